@@ -1,32 +1,51 @@
 # diagnostico_pipefy.py
 
 import os
-import requests
+import ssl
+import sys
 import json
+import time
+import socket
+import argparse
+import http.client
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
 
 # Carrega as variáveis do seu arquivo .env
 load_dotenv()
 
-PIPEFY_URL = "https://api.pipefy.com/graphql"
+PIPEFY_URL = os.getenv("PIPEFY_URL", "https://api.pipefy.com/graphql")
 ACCESS_TOKEN = os.getenv("PIPEFY_ACCESS_TOKEN")
 PIPE_ID = os.getenv("PIPEFY_PRE_SALES_PIPE_ID")
+GEMINI_URL = "https://generativelanguage.googleapis.com"
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
 
+USO = """
+Diagnóstico das dependências externas: sondas repetidas e cronometradas do
+GraphQL do Pipefy e do endpoint do Gemini, cada uma numa conexão nova, com o
+tempo quebrado em DNS, conexão TCP, TLS, TTFB (até os cabeçalhos da
+resposta) e download do corpo, mais uma segunda requisição na mesma conexão
+(reuso, como faz o pool da API). Mostra p50/p95/p99/máx por fase.
 
-def executar_query_diagnostico():
-    """
-    Executa uma query GraphQL para buscar todos os campos do Pipe.
-    """
-    if not ACCESS_TOKEN or not PIPE_ID:
-        print("ERRO: Tokens ou ID do Pipe não configurados no .env.")
-        return
+A sonda do Pipefy é a query do start_form_fields do pipe: a última resposta
+válida vira a tabela de campos, o snapshot do schema (carregado pela API na
+partida, sem consultar o Pipefy) e semeia o cache de field ids.
+
+A sonda do Gemini é um GET nos metadados do modelo (não gasta tokens).
 
-    # A query busca: nome do pipe, e os campos do formulário inicial
-    query = """
+--target nome=url aponta uma sonda para outro endereço (ex.: o Pipefy falso
+de app/fakes/pipefy_server.py); com --target, só os alvos informados rodam.
+Com o Pipefy em outro endereço, nada é gravado, a menos que --snapshot seja
+informado (e o cache de field ids da API nunca é semeado).
+"""
+
+QUERY_SCHEMA = """
     query GetPipeFields($pipeId: ID!) {
       pipe(id: $pipeId) {
         name
         start_form_fields {
+          id
           internal_id
           label
           type
@@ -34,70 +53,297 @@ def executar_query_diagnostico():
       }
     }
     """
-    variables = {"pipeId": PIPE_ID}
 
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    payload = {"query": query, "variables": variables}
+FASES = ("dns", "conexao", "tls", "ttfb", "download", "total", "reuso")
+
+
+# 🔹 Sonda
 
-    print(f"Executando query para o Pipe ID: {PIPE_ID}...")
 
+def sondar(url, metodo="GET", corpo=None, cabecalhos=None, timeout=10.0):
+    """
+    Uma requisição numa conexão nova, com a duração (s) de cada fase, seguida
+    de outra igual na mesma conexão ("reuso"). Em falha, `erro` diz em qual
+    fase parou.
+    """
+    partes = urlsplit(url)
+    https = partes.scheme == "https"
+    host = partes.hostname
+    porta = partes.port or (443 if https else 80)
+    caminho = (partes.path or "/") + (f"?{partes.query}" if partes.query else "")
+    cabecalhos = {"Host": partes.netloc, "User-Agent": "diagnostico_pipefy",
+                  **(cabecalhos or {})}
+    resultado = {"fases": {}, "status": None, "corpo": None, "endereco": None, "erro": None}
+    fases = resultado["fases"]
+    fase = "dns"
+    conexao = None
     try:
-        response = requests.post(PIPEFY_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        result = response.json()
-
-        # Verifica se há erros na resposta GraphQL
-        if 'errors' in result:
-            print("\n--- ERRO NA RESPOSTA DA API ---")
-            print(json.dumps(result['errors'], indent=2))
-            return
-
-        # Processa e exibe os resultados
-        pipe_data = result.get('data', {}).get('pipe')
-        if pipe_data:
-            print("\n--- RESULTADOS ENCONTRADOS ---")
-            print(f"Nome do Pipe: {pipe_data['name']}")
-            print("\nCAMPOS DO FORMULÁRIO INICIAL (Start Form Fields):")
-
-            campos_encontrados = pipe_data['start_form_fields']
-
-            if not campos_encontrados:
-                print("Nenhum campo encontrado no formulário inicial.")
-                print(
-                    "⚠️ Se o seu Pipe não usa formulário inicial, talvez você precise dos campos de uma fase específica.")
-                return
-
-            print(
-                "-----------------------------------------------------------------------------------")
-            print(
-                "| NOME VISÍVEL DO CAMPO (LABEL) | TIPO DE CAMPO | INTERNAL ID (VOCÊ PRECISA DESTE!) |")
-            print(
-                "-----------------------------------------------------------------------------------")
-
-            # Formato a lista para ser fácil de copiar
-            for campo in campos_encontrados:
-                print(
-                    f"| {campo['label'][:30]:<30} | {campo['type'][:13]:<13} | {campo['internal_id']:<33} |")
-
-            print(
-                "-----------------------------------------------------------------------------------")
-            print(
-                "\n✅ Use os valores da coluna 'INTERNAL ID' para configurar seu pipefy_service.py.")
+        inicio = marco = time.perf_counter()
+        familia, tipo, proto, _, endereco = socket.getaddrinfo(
+            host, porta, type=socket.SOCK_STREAM)[0]
+        resultado["endereco"] = endereco[0]
+        agora = time.perf_counter()
+        fases["dns"], marco = agora - marco, agora
+
+        fase = "conexao"
+        sock = socket.socket(familia, tipo, proto)
+        sock.settimeout(timeout)
+        sock.connect(endereco)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        agora = time.perf_counter()
+        fases["conexao"], marco = agora - marco, agora
+
+        fase = "tls"
+        if https:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+            agora = time.perf_counter()
+            fases["tls"], marco = agora - marco, agora
+
+        fase = "ttfb"
+        conexao = http.client.HTTPConnection(host, porta, timeout=timeout)
+        conexao.sock = sock
+        conexao.request(metodo, caminho, body=corpo, headers=cabecalhos)
+        resposta = conexao.getresponse()
+        agora = time.perf_counter()
+        fases["ttfb"], marco = agora - marco, agora
+
+        fase = "download"
+        resultado["status"] = resposta.status
+        resultado["corpo"] = resposta.read()
+        agora = time.perf_counter()
+        fases["download"] = agora - marco
+        fases["total"] = agora - inicio
+
+        if not resposta.will_close:
+            fase = "reuso"
+            marco = time.perf_counter()
+            conexao.request(metodo, caminho, body=corpo, headers=cabecalhos)
+            conexao.getresponse().read()
+            fases["reuso"] = time.perf_counter() - marco
+    except (OSError, http.client.HTTPException) as e:
+        resultado["erro"] = f"{fase}: {type(e).__name__}: {e}"
+    finally:
+        if conexao is not None:
+            conexao.close()
+    return resultado
+
+
+def percentis(amostras):
+    ordenadas = sorted(amostras)
+
+    def p(q):
+        return ordenadas[min(len(ordenadas) - 1, int(q * len(ordenadas)))]
+    return {"p50": p(0.5), "p95": p(0.95), "p99": p(0.99), "max": ordenadas[-1]}
+
+
+def resumir(nome, url, resultados):
+    """Percentis (ms) por fase, status HTTP e falhas de uma série de sondas."""
+    status = {}
+    for r in resultados:
+        chave = str(r["status"]) if r["status"] is not None else "falha"
+        status[chave] = status.get(chave, 0) + 1
+    fases = {}
+    for fase in FASES:
+        amostras = [r["fases"][fase] * 1000 for r in resultados if fase in r["fases"]]
+        if amostras:
+            fases[fase] = {k: round(v, 2) for k, v in percentis(amostras).items()}
+            fases[fase]["n"] = len(amostras)
+    enderecos = sorted({r["endereco"] for r in resultados if r["endereco"]})
+    return {
+        "alvo": nome,
+        "url": url,
+        "amostras": len(resultados),
+        "status": status,
+        "enderecos": enderecos,
+        "erros": sorted({r["erro"] for r in resultados if r["erro"]}),
+        "fases_ms": fases,
+    }
+
+
+def imprimir_resumo(resumo):
+    falhas = resumo["status"].get("falha", 0)
+    print(f"\n{resumo['alvo']}  {resumo['url']}  ({resumo['amostras']} sondas, "
+          f"{falhas} falhas, status {resumo['status']}, IP {', '.join(resumo['enderecos']) or '-'})")
+    print(f"  {'fase':10} {'p50':>9} {'p95':>9} {'p99':>9} {'máx':>9}   (ms)")
+    for fase, p in resumo["fases_ms"].items():
+        print(f"  {fase:10} {p['p50']:9.1f} {p['p95']:9.1f} {p['p99']:9.1f} {p['max']:9.1f}")
+    for erro in resumo["erros"]:
+        print(f"  ⚠️ {erro}")
+
+
+def executar_sondas(nome, url, requisicao, amostras, intervalo, timeout):
+    resultados = []
+    for i in range(amostras):
+        if i and intervalo:
+            time.sleep(intervalo)
+        resultados.append(sondar(url, timeout=timeout, **requisicao))
+    return resultados
+
+
+# 🔹 Alvos
+
+
+def requisicao_pipefy(pipe_id):
+    corpo = json.dumps({"query": QUERY_SCHEMA, "variables": {"pipeId": pipe_id}})
+    cabecalhos = {"Content-Type": "application/json"}
+    if ACCESS_TOKEN:
+        cabecalhos["Authorization"] = f"Bearer {ACCESS_TOKEN}"
+    return {"metodo": "POST", "corpo": corpo.encode("utf-8"), "cabecalhos": cabecalhos}
 
+
+def requisicao_gemini():
+    cabecalhos = {"x-goog-api-key": GEMINI_API_KEY} if GEMINI_API_KEY else {}
+    return {"metodo": "GET", "cabecalhos": cabecalhos}
+
+
+def url_gemini(base):
+    # A base pode vir com ou sem caminho (--target gemini=http://127.0.0.1:9000)
+    if urlsplit(base).path.strip("/"):
+        return base
+    return f"{base.rstrip('/')}/v1beta/models/{GEMINI_MODEL}"
+
+
+def ler_alvos(targets):
+    alvos = {"pipefy": PIPEFY_URL, "gemini": GEMINI_URL}
+    if not targets:
+        return alvos
+    escolhidos = {}
+    for target in targets:
+        nome, _, url = target.partition("=")
+        if nome not in alvos or not url:
+            raise SystemExit(f"--target inválido: {target!r} (use pipefy=URL ou gemini=URL).")
+        escolhidos[nome] = url
+    return escolhidos
+
+
+# 🔹 Schema do pipe
+
+
+def schema_da_resposta(resultados):
+    """Pipe (nome + start_form_fields) da última resposta válida, ou o erro da API."""
+    for r in reversed(resultados):
+        if r["status"] != 200 or not r["corpo"]:
+            continue
+        try:
+            result = json.loads(r["corpo"])
+        except ValueError:
+            continue
+        if "errors" in result:
+            return None, result["errors"]
+        return (result.get("data") or {}).get("pipe"), None
+    return None, None
+
+
+def imprimir_campos(pipe_data):
+    print("\n--- RESULTADOS ENCONTRADOS ---")
+    print(f"Nome do Pipe: {pipe_data['name']}")
+    print("\nCAMPOS DO FORMULÁRIO INICIAL (Start Form Fields):")
+
+    campos_encontrados = pipe_data['start_form_fields']
+
+    if not campos_encontrados:
+        print("Nenhum campo encontrado no formulário inicial.")
+        print(
+            "⚠️ Se o seu Pipe não usa formulário inicial, talvez você precise dos campos de uma fase específica.")
+        return
+
+    print(
+        "-----------------------------------------------------------------------------------")
+    print(
+        "| NOME VISÍVEL DO CAMPO (LABEL) | TIPO DE CAMPO | INTERNAL ID (VOCÊ PRECISA DESTE!) |")
+    print(
+        "-----------------------------------------------------------------------------------")
+
+    # Formato a lista para ser fácil de copiar
+    for campo in campos_encontrados:
+        print(
+            f"| {campo['label'][:30]:<30} | {campo['type'][:13]:<13} | {campo['internal_id']:<33} |")
+
+    print(
+        "-----------------------------------------------------------------------------------")
+    print(
+        "\n✅ Use os valores da coluna 'INTERNAL ID' para configurar seu pipefy_service.py.")
+
+
+def salvar_schema(pipe_id, pipe_data, caminho, semear_cache=True):
+    """Grava o snapshot do schema e semeia o cache de campos usado pela API (partida quente)."""
+    from app.services.pipefy_service import mapear_campos
+    from app.services.field_cache import field_cache, gravar_snapshot
+
+    gravar_snapshot(pipe_id, pipe_data.get("name"), pipe_data["start_form_fields"], caminho)
+    print(f"✅ Snapshot do schema gravado em {caminho}.", file=sys.stderr)
+    if not semear_cache:
+        return
+    field_cache.semear(pipe_id, mapear_campos(pipe_data["start_form_fields"]))
+    print(f"✅ Cache de campos gravado em {field_cache.caminho}.", file=sys.stderr)
+
+
+def main():
+    from app.services.field_cache import PIPEFY_SCHEMA_SNAPSHOT_PATH
+
+    parser = argparse.ArgumentParser(description=USO,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", metavar="NOME=URL",
+                        help="Endereço de um alvo (pipefy ou gemini); pode repetir.")
+    parser.add_argument("--amostras", type=int, default=10, help="Sondas por alvo.")
+    parser.add_argument("--intervalo", type=float, default=0.5,
+                        help="Pausa (s) entre sondas, para não esbarrar no rate limit.")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--pipe-id", default=PIPE_ID)
+    parser.add_argument("--snapshot",
+                        help="Arquivo do snapshot do schema (start_form_fields); padrão: "
+                             f"{PIPEFY_SCHEMA_SNAPSHOT_PATH}, só para o Pipefy de verdade.")
+    parser.add_argument("--sem-snapshot", action="store_true",
+                        help="Só mede: não grava snapshot nem cache de campos.")
+    parser.add_argument("--json", action="store_true",
+                        help="Resumo em JSON no stdout (para comparar execuções).")
+    args = parser.parse_args()
+
+    alvos = ler_alvos(args.target)
+    resumos = []
+    pipe_data = None
+
+    # O token só é exigido do Pipefy de verdade (não de um --target local), e
+    # só o schema dele vai para o snapshot e o cache da API sem --snapshot
+    pipefy_real = alvos.get("pipefy") == PIPEFY_URL
+    sem_credenciais = not args.pipe_id or (not ACCESS_TOKEN and pipefy_real)
+    snapshot = args.snapshot or (PIPEFY_SCHEMA_SNAPSHOT_PATH if pipefy_real else None)
+
+    if "pipefy" in alvos:
+        if sem_credenciais:
+            print("ERRO: Tokens ou ID do Pipe não configurados no .env.", file=sys.stderr)
         else:
-            print(
-                "Nenhum dado do Pipe encontrado. Verifique se o ID está correto ou se o Token tem permissão.")
+            print(f"Sondando o Pipefy (Pipe ID {args.pipe_id})...", file=sys.stderr)
+            resultados = executar_sondas("pipefy", alvos["pipefy"],
+                                         requisicao_pipefy(args.pipe_id),
+                                         args.amostras, args.intervalo, args.timeout)
+            resumos.append(resumir("pipefy", alvos["pipefy"], resultados))
+            pipe_data, erros = schema_da_resposta(resultados)
+            if erros:
+                print("\n--- ERRO NA RESPOSTA DA API ---", file=sys.stderr)
+                print(json.dumps(erros, indent=2), file=sys.stderr)
+
+    if "gemini" in alvos:
+        url = url_gemini(alvos["gemini"])
+        print(f"Sondando o Gemini ({GEMINI_MODEL})...", file=sys.stderr)
+        resultados = executar_sondas("gemini", url, requisicao_gemini(),
+                                     args.amostras, args.intervalo, args.timeout)
+        resumos.append(resumir("gemini", url, resultados))
+
+    if args.json:
+        print(json.dumps(resumos, ensure_ascii=False, indent=2))
+    else:
+        for resumo in resumos:
+            imprimir_resumo(resumo)
+        if pipe_data:
+            imprimir_campos(pipe_data)
 
-    except requests.exceptions.HTTPError as err:
-        print(f"\n--- ERRO HTTP DE CONEXÃO/AUTORIZAÇÃO ---")
-        print(f"Erro: {err}")
-        print("Pode ser token expirado, ou problema de permissão.")
-    except Exception as e:
-        print(f"Erro geral: {e}")
+    if pipe_data and pipe_data.get("start_form_fields") and snapshot and not args.sem_snapshot:
+        salvar_schema(args.pipe_id, pipe_data, snapshot, semear_cache=pipefy_real)
+    elif "pipefy" in alvos and pipe_data is None and not sem_credenciais:
+        print("Nenhum dado do Pipe encontrado. Verifique se o ID está correto ou se o Token "
+              "tem permissão.", file=sys.stderr)
 
 
 if __name__ == "__main__":
-    executar_query_diagnostico()
+    main()
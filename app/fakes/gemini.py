@@ -0,0 +1,199 @@
+"""
+Dublê do cliente Gemini para benchmarks e execuções offline.
+
+Imita a superfície do google.genai.Client usada pelo agente
+(client.models.generate_content, client.aio.models.generate_content,
+client.aio.models.generate_content_stream e client.aio.caches) devolvendo respostas reais do SDK
+(types.GenerateContentResponse) após uma latência configurável.
+"""
+import math
+import time
+import asyncio
+import random
+from google.genai import errors, types
+
+
+def resposta_texto(texto: str) -> types.GenerateContentResponse:
+    """Monta uma GenerateContentResponse contendo apenas texto."""
+    return types.GenerateContentResponse(candidates=[
+        types.Candidate(content=types.Content(
+            role="model", parts=[types.Part(text=texto)]))
+    ])
+
+
+def resposta_chamadas(chamadas) -> types.GenerateContentResponse:
+    """Monta uma resposta com function calls: lista de (nome, args)."""
+    return types.GenerateContentResponse(candidates=[
+        types.Candidate(content=types.Content(role="model", parts=[
+            types.Part(function_call=types.FunctionCall(name=nome, args=args))
+            for nome, args in chamadas
+        ]))
+    ])
+
+
+class Latencia:
+    """
+    Distribuição de latência (segundos) do modelo falso.
+
+    tipos: "fixa" (media), "normal" (media, desvio), "lognormal" (mediana =
+    media, sigma = desvio; cauda longa como a de uma API real) e
+    "exponencial" (media).
+    """
+
+    def __init__(self, media: float, desvio: float = 0.0, tipo: str = "normal"):
+        if tipo not in ("fixa", "normal", "lognormal", "exponencial"):
+            raise ValueError(f"Distribuição desconhecida: {tipo}")
+        self.media = media
+        self.desvio = desvio
+        self.tipo = tipo
+
+    @classmethod
+    def de_texto(cls, spec: str) -> "Latencia":
+        """'lognormal:0.4:0.5' -> Latencia(0.4, 0.5, 'lognormal')."""
+        tipo, _, resto = spec.partition(":")
+        valores = [float(v) for v in resto.split(":") if v]
+        return cls(*valores, tipo=tipo)
+
+    def amostrar(self) -> float:
+        if self.tipo == "fixa" or (self.tipo == "normal" and not self.desvio):
+            return self.media
+        if self.tipo == "normal":
+            return max(0.0, random.gauss(self.media, self.desvio))
+        if self.tipo == "lognormal":
+            return random.lognormvariate(math.log(self.media), self.desvio) if self.media else 0.0
+        return random.expovariate(1 / self.media) if self.media else 0.0
+
+
+class _ModelsSync:
+    def __init__(self, dono):
+        self._dono = dono
+
+    def generate_content(self, model, contents, config=None):
+        response = self._dono.responder(contents, config)
+        time.sleep(self._dono.latencia_de(model).amostrar() + self._dono.geracao(response))
+        self._dono.talvez_falhar(model)
+        return response
+
+
+def _fatiar(response: types.GenerateContentResponse, palavras: int):
+    """Divide uma resposta de texto em chunks de `palavras` palavras."""
+    texto = response.text if not response.function_calls else None
+    if not texto:
+        yield response
+        return
+    tokens = texto.split(" ")
+    for i in range(0, len(tokens), palavras):
+        trecho = " ".join(tokens[i:i + palavras])
+        if i + palavras < len(tokens):
+            trecho += " "
+        yield resposta_texto(trecho)
+
+
+class _ModelsAsync:
+    def __init__(self, dono):
+        self._dono = dono
+
+    async def generate_content(self, model, contents, config=None):
+        response = self._dono.responder(contents, config)
+        await asyncio.sleep(self._dono.latencia_de(model).amostrar() + self._dono.geracao(response))
+        self._dono.talvez_falhar(model)
+        return response
+
+    async def generate_content_stream(self, model, contents, config=None):
+        # Como no SDK: a corrotina devolve um iterador assíncrono de chunks
+        response = self._dono.responder(contents, config)
+        dono = self._dono
+
+        async def chunks():
+            # A latência configurada vira o tempo até o primeiro chunk
+            await asyncio.sleep(dono.latencia_de(model).amostrar())
+            dono.talvez_falhar(model)
+            for i, chunk in enumerate(_fatiar(response, dono.palavras_por_chunk)):
+                if i and dono.intervalo_chunk:
+                    await asyncio.sleep(dono.intervalo_chunk)
+                yield chunk
+        return chunks()
+
+
+class _CachesAsync:
+    """client.aio.caches: cached content guardado só em memória."""
+
+    def __init__(self, dono):
+        self._dono = dono
+
+    async def create(self, model, config=None):
+        nome = f"cachedContents/falso-{len(self._dono.caches) + 1}"
+        self._dono.caches[nome] = config
+        return types.CachedContent(name=nome, model=model)
+
+    async def update(self, name, config=None):
+        if name not in self._dono.caches:
+            raise KeyError(name)
+        return types.CachedContent(name=name)
+
+    async def delete(self, name, config=None):
+        self._dono.caches.pop(name, None)
+
+
+class _Aio:
+    def __init__(self, dono):
+        self.models = _ModelsAsync(dono)
+        self.caches = _CachesAsync(dono)
+
+
+class FakeGeminiClient:
+    """
+    Cliente Gemini falso com latência simulada (segundos ou Latencia).
+
+    `roteiro`, se informado, recebe (contents, config) e devolve a resposta;
+    assim dá para simular function calls. Sem roteiro, responde `texto`.
+    No streaming, o texto sai em chunks de `palavras_por_chunk` palavras,
+    separados por `intervalo_chunk` segundos; sem streaming, a resposta
+    inteira chega depois do mesmo tempo total de geração.
+
+    `latencia_por_modelo` e `taxa_falha` simulam vários modelos atrás do
+    mesmo cliente (roteador de modelos): latência própria e uma fração de
+    chamadas que terminam em ServerError 503.
+    """
+
+    def __init__(self, latencia=0.1, jitter: float = 0.0,
+                 texto: str = "Olá! Como posso ajudar?", roteiro=None,
+                 intervalo_chunk: float = 0.0, palavras_por_chunk: int = 3,
+                 latencia_por_modelo=None, taxa_falha=None):
+        # `latencia` aceita segundos (normal com `jitter`) ou uma Latencia
+        self.latencia = latencia if isinstance(latencia, Latencia) else Latencia(latencia, jitter)
+        self.latencia_por_modelo = {
+            modelo: valor if isinstance(valor, Latencia) else Latencia(valor)
+            for modelo, valor in (latencia_por_modelo or {}).items()}
+        self.taxa_falha = dict(taxa_falha or {})
+        self.chamadas_por_modelo = {}
+        self.texto = texto
+        self.roteiro = roteiro
+        self.intervalo_chunk = intervalo_chunk
+        self.palavras_por_chunk = palavras_por_chunk
+        self.chamadas = 0
+        self.caches = {}
+        self.models = _ModelsSync(self)
+        self.aio = _Aio(self)
+
+    def responder(self, contents, config=None) -> types.GenerateContentResponse:
+        self.chamadas += 1
+        if self.roteiro is not None:
+            return self.roteiro(contents, config)
+        return resposta_texto(self.texto)
+
+    def latencia_de(self, modelo: str) -> Latencia:
+        self.chamadas_por_modelo[modelo] = self.chamadas_por_modelo.get(modelo, 0) + 1
+        return self.latencia_por_modelo.get(modelo, self.latencia)
+
+    def talvez_falhar(self, modelo: str) -> None:
+        if random.random() < self.taxa_falha.get(modelo, 0.0):
+            raise errors.ServerError(503, {"error": {
+                "code": 503, "message": f"{modelo} sobrecarregado (falso)", "status": "UNAVAILABLE"}})
+
+    def geracao(self, response: types.GenerateContentResponse) -> float:
+        """Tempo de geração após o primeiro chunk (intervalos entre chunks)."""
+        if not self.intervalo_chunk:
+            return 0.0
+        n = sum(1 for _ in _fatiar(response, self.palavras_por_chunk))
+        return self.intervalo_chunk * (n - 1)
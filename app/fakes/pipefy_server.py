@@ -0,0 +1,237 @@
+"""
+Servidor GraphQL falso do Pipefy, para benchmarks e execuções offline.
+
+Responde às operações usadas pelo serviço (start_form_fields, createCard,
+updateFieldsValues, allCards), com latência e falhas (429/503) configuráveis, e conta
+quantas conexões TCP e requisições recebeu — o suficiente para medir pooling
+e retentativas sem tocar no Pipefy real.
+
+Uso:
+    python -m app.fakes.pipefy_server [--porta 8765] [--latencia 0.02] [--taxa-falha 0.1]
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CAMPOS_PADRAO = [
+    ("nome", "Nome", "short_text"),
+    ("email", "Email", "email"),
+    ("empresa", "Empresa", "short_text"),
+    ("necessidade", "Necessidade", "select"),
+    ("interesse_confirmado", "Interesse_confirmado", "radio_horizontal"),
+    ("meeting_link", "Meeting_link", "short_text"),
+    ("data_reuniao", "Data Reuniao", "datetime"),
+]
+
+def _agora_iso():
+    agora = time.time()
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(agora)) + f".{int(agora % 1 * 1e6):06d}Z"
+
+
+_OPERACAO_RE = re.compile(r"(?:query|mutation)\s+(\w+)")
+_ALIAS_CREATE_RE = re.compile(r"(\w+)\s*:\s*createCard\s*\(\s*input\s*:\s*\$(\w+)")
+
+
+class EstadoFake:
+    """Cards criados e estatísticas de tráfego (compartilhado entre threads)."""
+
+    def __init__(self, latencia=0.0, taxa_falha=0.0, retry_after=None):
+        self.latencia = latencia
+        self.taxa_falha = taxa_falha
+        self.retry_after = retry_after
+        self.cards = {}
+        self.atualizado_em = {}
+        self.conexoes = 0
+        self.requisicoes = 0
+        self.falhas_injetadas = 0
+        self.por_operacao = {}
+        self._proximo_id = 1000
+        self._lock = threading.Lock()
+
+    def novo_card(self, fields):
+        with self._lock:
+            self._proximo_id += 1
+            card_id = str(self._proximo_id)
+            self.cards[card_id] = {f["field_id"]: f["field_value"]
+                                   for f in fields or []}
+            self.atualizado_em[card_id] = _agora_iso()
+        return card_id
+
+    def cards_alterados(self, desde=None, depois_de=None, limite=50):
+        """Página de allCards: (card_id, campos, updated_at) e se há mais."""
+        with self._lock:
+            ids = [c for c in self.cards
+                   if desde is None or self.atualizado_em[c] >= desde]
+            inicio = ids.index(depois_de) + 1 if depois_de in ids else 0
+            pagina = ids[inicio:inicio + limite]
+            return ([(c, dict(self.cards[c]), self.atualizado_em[c]) for c in pagina],
+                    inicio + limite < len(ids))
+
+    def contar(self, operacao):
+        with self._lock:
+            self.requisicoes += 1
+            self.por_operacao[operacao] = self.por_operacao.get(
+                operacao, 0) + 1
+
+    def resumo(self):
+        return {
+            "conexoes": self.conexoes,
+            "requisicoes": self.requisicoes,
+            "falhas_injetadas": self.falhas_injetadas,
+            "cards": len(self.cards),
+            "por_operacao": dict(self.por_operacao),
+        }
+
+
+def _responder_graphql(estado, query, variables):
+    if "start_form_fields" in query:
+        return {"data": {"pipe": {"name": "Pipe Fake", "start_form_fields": [
+            {"id": fid, "internal_id": f"{fid}_{i}", "label": label, "type": tipo}
+            for i, (fid, label, tipo) in enumerate(CAMPOS_PADRAO)
+        ]}}}
+    aliases = _ALIAS_CREATE_RE.findall(query)
+    if aliases:
+        # Vários createCard num documento: cada alias responde (ou falha) sozinho
+        data, erros = {}, []
+        for alias, variavel in aliases:
+            entrada = variables.get(variavel) or {}
+            if not entrada.get("fields_attributes"):
+                data[alias] = None
+                erros.append({"message": "fields_attributes vazio",
+                              "path": [alias]})
+                continue
+            card_id = estado.novo_card(entrada["fields_attributes"])
+            data[alias] = {"card": {"id": card_id, "title": card_id}}
+        return {"data": data, "errors": erros} if erros else {"data": data}
+    if "createCard" in query:
+        entrada = variables.get("input") or {}
+        card_id = estado.novo_card(entrada.get("fields_attributes"))
+        return {"data": {"createCard": {"card": {"id": card_id, "title": card_id}}}}
+    if "updateFieldsValues" in query:
+        entrada = variables.get("input") or {}
+        ok = entrada.get("nodeId") in estado.cards
+        if ok:
+            with estado._lock:
+                estado.cards[entrada["nodeId"]].update(
+                    {v["fieldId"]: v["value"] for v in entrada.get("values") or []})
+                estado.atualizado_em[entrada["nodeId"]] = _agora_iso()
+        return {"data": {"updateFieldsValues": {"success": ok}}}
+    if "allCards" in query:
+        filtro = variables.get("filtro") or {}
+        cards, mais = estado.cards_alterados(filtro.get("value"), variables.get("after"))
+        return {"data": {"allCards": {
+            "pageInfo": {"hasNextPage": mais, "endCursor": cards[-1][0] if cards else None},
+            "edges": [{"node": {"id": c, "updated_at": atualizado, "fields": [
+                {"field": {"id": fid}, "value": valor} for fid, valor in campos.items()]}}
+                for c, campos, atualizado in cards],
+        }}}
+    return {"errors": [{"message": "Operação não suportada pelo servidor falso."}]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    # Cabeçalho e corpo saem num único write (evita o atraso do ACK com Nagle)
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.estado._lock:
+            self.server.estado.conexoes += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _enviar(self, status, corpo, headers=None):
+        dados = json.dumps(corpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        for chave, valor in (headers or {}).items():
+            self.send_header(chave, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_POST(self):
+        estado = self.server.estado
+        tamanho = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(tamanho) or b"{}")
+        query = payload.get("query", "")
+        variables = payload.get("variables") or {}
+
+        encontrado = _OPERACAO_RE.search(query)
+        estado.contar(encontrado.group(1) if encontrado else "anonima")
+
+        if estado.latencia:
+            time.sleep(estado.latencia)
+
+        if estado.taxa_falha and random.random() < estado.taxa_falha:
+            with estado._lock:
+                estado.falhas_injetadas += 1
+            if random.random() < 0.5:
+                headers = {}
+                if estado.retry_after is not None:
+                    headers["Retry-After"] = str(estado.retry_after)
+                self._enviar(429, {"error": "rate limited"}, headers)
+            else:
+                self._enviar(503, {"error": "unavailable"})
+            return
+
+        self._enviar(200, _responder_graphql(estado, query, variables))
+
+
+class _Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+    # A fila padrão de conexões (5) estoura com dezenas de clientes abrindo
+    # conexão ao mesmo tempo, e o reset chega como erro de leitura
+    request_queue_size = 128
+
+
+class FakePipefyServer:
+    """Sobe o servidor numa thread em segundo plano (porta 0 = porta livre)."""
+
+    def __init__(self, porta=0, latencia=0.0, taxa_falha=0.0, retry_after=None):
+        self.estado = EstadoFake(latencia, taxa_falha, retry_after)
+        self._httpd = _Servidor(("127.0.0.1", porta), _Handler)
+        self._httpd.estado = self.estado
+        self._thread = None
+
+    @property
+    def url(self):
+        host, porta = self._httpd.server_address[:2]
+        return f"http://{host}:{porta}/graphql"
+
+    def iniciar(self):
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.0)
+    parser.add_argument("--taxa-falha", type=float, default=0.0)
+    args = parser.parse_args()
+    servidor = FakePipefyServer(args.porta, args.latencia, args.taxa_falha)
+    print(f"Pipefy falso ouvindo em {servidor.url}")
+    try:
+        servidor._httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(servidor.estado.resumo(), indent=2))
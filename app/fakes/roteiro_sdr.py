@@ -0,0 +1,84 @@
+"""
+Roteiro de conversa SDR para o Gemini falso.
+
+Reproduz o fluxo da instrução de sistema: saudação, registrar_lead assim que
+o lead passa os dados, oferecer_horarios com o card_id devolvido e
+agendar_reuniao com o horário escolhido. As decisões são tomadas só a partir
+do histórico recebido, como faria o modelo real; por isso funciona com
+várias conversas concorrentes no mesmo cliente falso.
+"""
+import re
+import json
+from typing import List
+
+from google.genai import types
+
+from app.fakes.gemini import resposta_texto, resposta_chamadas
+
+_DADOS_RE = re.compile(
+    r"nome é (?P<nome>[^,]+), email (?P<email>\S+), empresa (?P<empresa>[^,]+), "
+    r"necessidade: (?P<necessidade>.+)$", re.IGNORECASE)
+
+
+def mensagens_do_lead(i: int) -> List[str]:
+    """Falas do lead `i` em uma conversa completa (três turnos)."""
+    return [
+        "Olá! Vi o anúncio de vocês e quero saber mais.",
+        f"Meu nome é Lead {i}, email lead{i}@exemplo.com, empresa Empresa {i}, "
+        "necessidade: Implementar IA",
+        "Pode ser o primeiro horário, por favor.",
+    ]
+
+
+def _resultado(part: types.Part) -> dict:
+    """Resultado de uma ferramenta (string JSON dentro de {"result": ...})."""
+    resposta = part.function_response.response or {}
+    try:
+        return json.loads(resposta.get("result") or "{}")
+    except (TypeError, ValueError):
+        return {}
+
+
+def _ultimo_resultado(contents, nome: str) -> dict:
+    for content in reversed(contents):
+        for part in content.parts or []:
+            if part.function_response and part.function_response.name == nome:
+                return _resultado(part)
+    return {}
+
+
+def roteiro_sdr(contents, config=None) -> types.GenerateContentResponse:
+    ultima = contents[-1]
+    respostas = [p for p in ultima.parts or [] if p.function_response]
+
+    if respostas:
+        feita = respostas[-1].function_response.name
+        if feita == "registrar_lead":
+            card_id = _resultado(respostas[-1]).get("card_id")
+            return resposta_chamadas([("oferecer_horarios", {"card_id": card_id})])
+        if feita == "oferecer_horarios":
+            slots = _resultado(respostas[-1]).get("slots") or []
+            return resposta_texto(
+                "Obrigado! Tenho estes horários disponíveis: " + ", ".join(slots)
+                + ". Qual deles fica melhor para você?")
+        if feita == "agendar_reuniao":
+            return resposta_texto(
+                f"Perfeito! {respostas[-1].function_response.response.get('result')}")
+        return resposta_texto("Tudo certo. Posso ajudar em algo mais?")
+
+    texto = " ".join(p.text for p in ultima.parts or [] if p.text)
+    dados = _DADOS_RE.search(texto)
+    if dados:
+        return resposta_chamadas([("registrar_lead", {
+            campo: valor.strip() for campo, valor in dados.groupdict().items()})])
+
+    if "horário" in texto.lower():
+        slots = _ultimo_resultado(contents, "oferecer_horarios").get("slots") or []
+        card_id = _ultimo_resultado(contents, "registrar_lead").get("card_id")
+        if slots and card_id:
+            return resposta_chamadas([("agendar_reuniao", {
+                "slot_input": slots[0], "card_id": card_id})])
+
+    return resposta_texto(
+        "Olá! Sou o assistente de pré-vendas. Para começar, me diga seu nome, "
+        "e-mail, empresa e qual a sua necessidade.")
@@ -0,0 +1,56 @@
+# importar_leads.py
+
+import sys
+import csv
+import json
+import time
+import argparse
+
+from app.services.pipefy_bulk import registrar_leads_em_lote
+
+CAMPOS_LEAD = ("nome", "email", "empresa", "necessidade",
+               "datetime_str", "link_reuniao")
+
+
+def ler_leads(caminho):
+    """Lê leads de um CSV (com cabeçalho) ou JSONL, conforme a extensão."""
+    with open(caminho, encoding="utf-8") as arquivo:
+        if caminho.endswith((".jsonl", ".ndjson")):
+            for linha in arquivo:
+                if linha.strip():
+                    yield json.loads(linha)
+        else:
+            for linha in csv.DictReader(arquivo):
+                yield {k: v for k, v in linha.items() if k in CAMPOS_LEAD and v}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Importa leads em lote para o Pipefy (createCard agrupado com aliases).")
+    parser.add_argument("arquivo", help="CSV com cabeçalho ou arquivo .jsonl")
+    parser.add_argument("--saida", help="Grava o resultado por lead em JSONL (padrão: stdout)")
+    args = parser.parse_args()
+
+    leads = list(ler_leads(args.arquivo))
+    print(f"Importando {len(leads)} leads...", file=sys.stderr)
+
+    inicio = time.perf_counter()
+    resultados = registrar_leads_em_lote(leads)
+    duracao = time.perf_counter() - inicio
+
+    destino = open(args.saida, "w", encoding="utf-8") if args.saida else sys.stdout
+    try:
+        for item in resultados:
+            destino.write(json.dumps(item, ensure_ascii=False) + "\n")
+    finally:
+        if args.saida:
+            destino.close()
+
+    sucesso = sum(1 for r in resultados if r["status"] == "sucesso")
+    existentes = sum(1 for r in resultados if r.get("existente"))
+    print(f"\n✅ {sucesso - existentes} criados, ♻️ {existentes} já registrados, "
+          f"❌ {len(resultados) - sucesso} com erro em {duracao:.2f}s.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,117 +1,252 @@
 import os
-import json
-from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
-from google import genai
-from google.genai import types
-from google.genai.errors import APIError
+import time
+import logging
+import contextlib
+from typing import Dict, Any, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Header, Depends
+from fastapi.responses import StreamingResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from app.models import AgentRequest, AgentResponse, SessionResponse
+
+# Agente (cliente Gemini, ferramentas e instrução de sistema ficam no serviço)
+from app.services.gemini_agent import executar_turno, executar_turno_stream
+from app.services.session_store import session_store, SessaoNaoEncontrada
+from app.services.conversa import ConversaCompilada
+from app.services.metrics import CHAT_SECONDS, CONVERSAS_EM_ANDAMENTO
+from app.services.admission import (
+    controle_admissao, limite_por_tenant, prazo_var, Rejeitado)
+from app.services.idempotency import (
+    idempotency_store, impressao, ChaveReutilizada, Reserva)
+from app.startup import lifespan
+from app.utils.json_utils import RespostaJSON, dumps
+from app.utils.log_utils import (
+    configurar_logging, conversa_id_var, ContextoRequisicaoMiddleware)
+
+configurar_logging()
+logger = logging.getLogger(__name__)
+
+# 🔹 Inicialização FastAPI (clientes pesados são carregados no lifespan)
+app = FastAPI(title="SDR Elite Dev API", lifespan=lifespan)
+# Request id (X-Request-ID) em todos os logs da requisição
+app.add_middleware(ContextoRequisicaoMiddleware)
 
-# Serviços
-from app.services.pipefy_service import registrar_lead, atualizar_card_com_reuniao
-from app.services.calendar_service import oferecer_horarios, agendar_reuniao
-
-# 🔹 Inicialização FastAPI
-app = FastAPI(title="SDR Elite Dev API")
+# 🔹 Rotas
 
-# 🔹 Modelos Pydantic
 
+@app.get("/")
+def root():
+    return {"message": "API SDR-Elite-Dev-IA está rodando 🚀"}
 
-class AgentRequest(BaseModel):
-    prompt: str
-    history: Optional[List[Dict[str, Any]]] = None
 
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
-class AgentResponse(BaseModel):
-    response: str
-    history: List[Dict[str, Any]]
 
+@app.post("/sessions", response_model=SessionResponse)
+def criar_sessao():
+    return SessionResponse(session_id=session_store.criar())
 
-# 🔹 Configuração Gemini
-try:
-    client = genai.Client()
-    MODEL_NAME = "gemini-2.0-flash"
-except Exception as e:
-    print(f"Erro ao inicializar Gemini: {e}")
-    client = None
 
-AVAILABLE_TOOLS = {
-    "registrar_lead": registrar_lead,
-    "atualizar_card_com_reuniao": atualizar_card_com_reuniao,
-    "oferecer_horarios": oferecer_horarios,
-    "agendar_reuniao": agendar_reuniao,
-}
+@app.delete("/sessions/{session_id}", status_code=204)
+def encerrar_sessao(session_id: str):
+    session_store.remover(session_id)
 
-SDR_SYSTEM_INSTRUCTION = """
-Você é o Agente SDR-Elite-Dev-IA...
-"""
 
-# 🔹 Função principal
+def _recusa(e: Rejeitado) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e),
+                         headers={"Retry-After": e.retry_after_header})
 
 
-def run_gemini_agent(history: List[Dict[str, Any]]) -> types.GenerateContentResponse:
-    if client is None:
-        raise Exception("Cliente Gemini não configurado.")
+async def _tenant(x_api_key: Optional[str] = Header(None),
+                  x_tenant_id: Optional[str] = Header(None),
+                  x_timeout_ms: Optional[int] = Header(None)) -> str:
+    """
+    Tenant (X-API-Key ou X-Tenant-ID) e prazo do cliente (X-Timeout-Ms),
+    usado pelo controle de admissão para recusar cedo o que não daria tempo
+    de atender.
+    """
+    if x_timeout_ms:
+        prazo_var.set(time.monotonic() + x_timeout_ms / 1000)
+    return x_api_key or x_tenant_id or "anonimo"
 
-    gemini_contents = []
-    for item in history:
-        role = item.get("role", "user")
-        parts_data = item.get("parts", [])
-        gemini_parts = [types.Part(text=p["text"]) for p in parts_data if isinstance(
-            p, dict) and p.get("text")]
-        final_role = "model" if role == "tool" else role
-        gemini_contents.append(types.Content(
-            role=final_role, parts=gemini_parts))
 
+def _admitir(tenant: str) -> None:
+    """
+    Gasta uma ficha do tenant. Só para turnos que vão rodar: repetições com
+    Idempotency-Key recebem o resultado guardado sem pagar (absorver a
+    rajada de repetições é justamente o objetivo da chave).
+    """
     try:
-        print("[DEBUG] Enviando requisição ao Gemini...")
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=gemini_contents,
-            config=types.GenerateContentConfig(
-                system_instruction=SDR_SYSTEM_INSTRUCTION,
-                tools=list(AVAILABLE_TOOLS.values()),
-            ),
-        )
-        print("[DEBUG] Gemini respondeu com sucesso.")
-        return response
-    except APIError as e:
-        print(f"[ERROR] Falha na API Gemini: {e}")
-        raise HTTPException(status_code=500, detail=f"Erro na API Gemini: {e}")
-    except Exception as e:
-        print(f"[ERROR] Erro geral em run_gemini_agent: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        limite_por_tenant.consumir(tenant)
+    except Rejeitado as e:
+        raise _recusa(e)
 
 
-# 🔹 Rotas
+def _chave_idempotencia(idempotency_key: Optional[str] = Header(None),
+                        tenant: str = Depends(_tenant)) -> Optional[str]:
+    """Idempotency-Key do cliente, separada por tenant."""
+    if not idempotency_key:
+        return None
+    return f"{tenant}:{idempotency_key}"
 
 
-@app.get("/")
-def root():
-    return {"message": "API SDR-Elite-Dev-IA está rodando 🚀"}
+def _impressao(chave: Optional[str], request: AgentRequest) -> Optional[str]:
+    return impressao(request.model_dump()) if chave is not None else None
 
 
-@app.post("/chat", response_model=AgentResponse)
-def chat(request: AgentRequest):
-    history = request.history or []
-    history.append({"role": "user", "parts": [{"text": request.prompt}]})
+def _replay(chave: Optional[str], marca: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Resposta já guardada para esta chave (repetição de um turno concluído)."""
+    if chave is None:
+        return None
+    try:
+        return idempotency_store.consultar(chave, marca)
+    except ChaveReutilizada as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
 
+async def _reservar(chave: Optional[str], marca: Optional[str]
+                    ) -> Tuple[Optional[Dict[str, Any]], Optional[Reserva]]:
+    """Espera a original em andamento, se houver; senão reserva a chave para este turno."""
+    if chave is None:
+        return None, None
     try:
-        response = run_gemini_agent(history)
-        reply_text = None
-
-        if hasattr(response, "text") and response.text:
-            reply_text = response.text
-        elif getattr(response, "candidates", None):
-            reply_text = response.candidates[0].content.parts[0].text
-        else:
-            reply_text = "[ERRO] Resposta vazia do Gemini."
-
-        history.append({"role": "model", "parts": [{"text": reply_text}]})
-        return AgentResponse(response=reply_text, history=history)
-
-    except HTTPException as e:
-        raise e
-    except Exception as e:
-        print(f"[ERROR] Exceção inesperada: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        return await idempotency_store.obter_ou_reservar(chave, marca)
+    except ChaveReutilizada as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def _conversa_do_turno(request: AgentRequest) -> ConversaCompilada:
+    """Histórico anterior (compilado) já com a mensagem nova do usuário."""
+    if request.session_id:
+        conversa_id_var.set(request.session_id)
+        try:
+            conversa = session_store.carregar_conversa(request.session_id)
+        except SessaoNaoEncontrada:
+            raise HTTPException(
+                status_code=404, detail="Sessão não encontrada ou expirada.")
+    else:
+        # `history` já foi validado contra HistoryItem no corpo da requisição
+        conversa = ConversaCompilada(request.history or [], validadas=True)
+    conversa.anexar({"role": "user", "parts": [{"text": request.prompt}]})
+    return conversa
+
+
+def _resposta(request: AgentRequest, texto: str, conversa: ConversaCompilada,
+              inicio_turno: int) -> Dict[str, Any]:
+    """
+    Corpo do AgentResponse montado direto em dict: as mensagens já estão
+    validadas, então não passam de novo pelo modelo (O(histórico) a cada turno).
+    """
+    if request.session_id:
+        turno = conversa.mensagens[inicio_turno:]
+        session_store.anexar(request.session_id, turno, conversa)
+        return {"response": texto, "history": turno, "session_id": request.session_id}
+    return {"response": texto, "history": conversa.mensagens, "session_id": None}
+
+
+@app.post("/chat", response_model=AgentResponse)
+async def chat(request: AgentRequest, tenant: str = Depends(_tenant),
+               chave: Optional[str] = Depends(_chave_idempotencia)):
+    # Com Idempotency-Key, a repetição recebe o resultado do turno original
+    # (ou espera por ele) em vez de chamar o modelo e as ferramentas de novo
+    guardada, reserva = await _reservar(chave, _impressao(chave, request))
+    if guardada is not None:
+        return RespostaJSON(guardada, headers={"Idempotent-Replayed": "true"})
+
+    async with reserva or contextlib.nullcontext():
+        # Recusado aqui, o 429 libera a reserva (não fica guardado)
+        _admitir(tenant)
+        conversa = _conversa_do_turno(request)
+        inicio_turno = len(conversa) - 1
+
+        inicio = time.perf_counter()
+        CONVERSAS_EM_ANDAMENTO.inc()
+        try:
+            # Uma única requisição cobre o turno inteiro, inclusive as ferramentas
+            reply_text, _ = await executar_turno(conversa)
+            resultado = _resposta(request, reply_text, conversa, inicio_turno)
+            if reserva is not None:
+                reserva.concluir(resultado)
+            # response_model fica só para a documentação (OpenAPI)
+            return RespostaJSON(resultado)
+
+        except HTTPException as e:
+            raise e
+        except Exception as e:
+            logger.exception("Exceção inesperada: %s", e)
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            CONVERSAS_EM_ANDAMENTO.dec()
+            CHAT_SECONDS.labels("chat").observe(time.perf_counter() - inicio)
+
+
+def _sse(evento: str, dados: Dict[str, Any]) -> str:
+    return f"event: {evento}\ndata: {dumps(dados).decode('utf-8')}\n\n"
+
+
+_CABECALHOS_SSE = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: AgentRequest, tenant: str = Depends(_tenant),
+                      chave: Optional[str] = Depends(_chave_idempotencia)):
+    """
+    Mesmo turno do /chat, entregue como Server-Sent Events: `token` (texto
+    parcial), `ferramenta` (progresso das function calls), `fim` (mesmo corpo
+    do /chat) ou `erro`. Uma repetição com a mesma Idempotency-Key recebe só
+    o `fim` do turno original.
+    """
+    marca = _impressao(chave, request)
+    guardada = _replay(chave, marca)
+    if guardada is not None:
+        async def repetir():
+            yield _sse("fim", guardada)
+        return StreamingResponse(repetir(), media_type="text/event-stream",
+                                 headers={**_CABECALHOS_SSE, "Idempotent-Replayed": "true"})
+
+    conversa = _conversa_do_turno(request)
+    inicio_turno = len(conversa) - 1
+    # Repetição de um turno em andamento só espera o `fim` da original: não
+    # paga ficha do tenant nem passa pela admissão
+    if chave is None or not idempotency_store.em_andamento(chave, marca):
+        _admitir(tenant)
+        try:
+            # Depois que o stream começa o status já é 200: a recusa precisa vir antes
+            controle_admissao.verificar()
+        except Rejeitado as e:
+            raise _recusa(e)
+
+    async def eventos():
+        inicio = time.perf_counter()
+        CONVERSAS_EM_ANDAMENTO.inc()
+        try:
+            # A reserva fica dentro do stream: uma repetição concorrente espera
+            # aqui (já com 200) e recebe só o `fim` da original
+            guardada, reserva = await _reservar(chave, marca)
+            if guardada is not None:
+                yield _sse("fim", guardada)
+                return
+
+            async with reserva or contextlib.nullcontext():
+                async for evento, dados in executar_turno_stream(conversa):
+                    if evento != "fim":
+                        yield _sse(evento, dados)
+                        continue
+
+                    final = _resposta(request, dados["response"], conversa, inicio_turno)
+                    if reserva is not None:
+                        reserva.concluir(final)
+                    yield _sse("fim", final)
+
+        except HTTPException as e:
+            yield _sse("erro", {"detail": e.detail})
+        except Exception as e:
+            logger.exception("Exceção inesperada no streaming: %s", e)
+            yield _sse("erro", {"detail": str(e)})
+        finally:
+            CONVERSAS_EM_ANDAMENTO.dec()
+            CHAT_SECONDS.labels("chat_stream").observe(time.perf_counter() - inicio)
+
+    return StreamingResponse(eventos(), media_type="text/event-stream", headers=_CABECALHOS_SSE)
@@ -1,27 +1,65 @@
-from pydantic import BaseModel, Field
-from typing import List, Any, Optional
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field
+from typing import List, Any, Dict, Literal, Optional
+from typing_extensions import Annotated, NotRequired, TypedDict
 
+# 🔹 Formato de wire do histórico
+# TypedDicts estritos: o validador (pydantic-core) devolve dicts comuns, já no
+# formato que o resto do código usa, sem objetos intermediários. Campos
+# desconhecidos e tipos trocados são recusados.
+_ESTRITO = ConfigDict(extra="forbid", strict=True)
 
-class HistoryPart(BaseModel):
-    text: Optional[str] = None
-    functionCall: Optional[dict] = Field(None, alias="function_call")
-    functionResponse: Optional[dict] = Field(None, alias="function_response")
 
+class FunctionCall(TypedDict):
+    __pydantic_config__ = _ESTRITO
 
-class HistoryItem(BaseModel):
-    role: str = Field(...,
-                      description="O papel na conversa (user, model, tool).")
-    parts: List[dict] = Field(...,
-                              description="O conteúdo da mensagem (principalmente o texto).")
+    name: Annotated[str, Field(min_length=1)]
+    args: NotRequired[Dict[str, Any]]
+
+
+class FunctionResponse(TypedDict):
+    __pydantic_config__ = _ESTRITO
+
+    name: Annotated[str, Field(min_length=1)]
+    response: Dict[str, Any]
+
+
+class HistoryPart(TypedDict, total=False):
+    # O wire usa camelCase (functionCall); o alias snake_case continua aceito
+    __pydantic_config__ = _ESTRITO
+
+    text: Optional[str]
+    functionCall: Annotated[FunctionCall, Field(
+        validation_alias=AliasChoices("functionCall", "function_call"))]
+    functionResponse: Annotated[FunctionResponse, Field(
+        validation_alias=AliasChoices("functionResponse", "function_response"))]
+
+
+class HistoryItem(TypedDict):
+    __pydantic_config__ = _ESTRITO
+
+    # Respostas de ferramenta (tool) vão para o modelo do lado do usuário
+    role: Literal["user", "model", "tool"]
+    parts: List[HistoryPart]
+
+
+# 🔹 Corpos da API
 
 
 class AgentRequest(BaseModel):
     prompt: str = Field(..., description="A nova mensagem do usuário.")
-    history: Optional[List[dict]] = Field(
+    history: Optional[List[HistoryItem]] = Field(
         None, description="Histórico da conversa anterior.")
+    # Modo sessão: o histórico fica no servidor e `history` é ignorado
+    session_id: Optional[str] = None
 
 
 class AgentResponse(BaseModel):
     response: str = Field(..., description="A resposta de texto do Agente.")
-    history: List[dict] = Field(...,
-                                description="Histórico completo e atualizado da conversa.")
+    # Sem sessão: histórico completo. Com sessão: apenas as mensagens do turno.
+    history: List[HistoryItem] = Field(...,
+                                       description="Histórico completo e atualizado da conversa.")
+    session_id: Optional[str] = None
+
+
+class SessionResponse(BaseModel):
+    session_id: str
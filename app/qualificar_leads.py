@@ -0,0 +1,277 @@
+# qualificar_leads.py
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+# Os serviços leem a configuração no import: tudo de app.services é importado
+# só depois de _preparar_ambiente.
+
+USO = """
+Qualificação em lote: passa cada lead de um CSV/JSONL pelo mesmo fluxo do
+agente SDR (executar_turno + ferramentas), como se o lead tivesse enviado o
+formulário e iniciado a conversa. Roda --concorrencia leads ao mesmo tempo e
+grava um resultado por linha (JSONL) assim que cada lead termina; o próprio
+arquivo de saída é o checkpoint, então rodar de novo com a mesma --saida
+continua de onde parou. Leads que terminaram com status "erro" rodam de
+novo e ganham outra linha (vale a última do índice). Leads repetidos não
+geram card duplicado (índice local de leads).
+
+Com --offline usa o Gemini falso (roteiro SDR) e um Pipefy falso local, com
+agenda, outbox e índice em uma pasta temporária.
+"""
+
+
+def mensagem_do_formulario(lead):
+    """Primeira fala do lead, montada a partir do formulário."""
+    return (f"Olá! Preenchi o formulário do site. Meu nome é {lead.get('nome')}, "
+            f"email {lead.get('email')}, empresa {lead.get('empresa')}, "
+            f"necessidade: {lead.get('necessidade')}")
+
+
+def ler_checkpoint(caminho):
+    """
+    Índices já concluídos na saída; os com status "erro" ficam de fora para
+    serem tentados de novo. Uma última linha incompleta (queda no meio da
+    escrita) é descartada do arquivo.
+    """
+    feitos = set()
+    if not os.path.exists(caminho):
+        return feitos
+    with open(caminho, "rb+") as arquivo:
+        dados = arquivo.read()
+        fim = dados.rfind(b"\n") + 1
+        if fim < len(dados):
+            arquivo.truncate(fim)
+    for linha in dados[:fim].splitlines():
+        try:
+            resultado = json.loads(linha)
+            if resultado.get("status") != "erro":
+                feitos.add(resultado["indice"])
+        except (ValueError, KeyError, AttributeError):
+            continue
+    return feitos
+
+
+class Etapas:
+    """Durações por etapa (modelo, cada ferramenta, lead inteiro)."""
+
+    def __init__(self):
+        self.duracoes = {}
+
+    def registrar(self, etapa, segundos):
+        self.duracoes.setdefault(etapa, []).append(segundos)
+
+    def cronometrar(self, etapa, func):
+        async def embrulho(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.registrar(etapa, time.perf_counter() - inicio)
+        return embrulho
+
+    def resumo(self):
+        linhas = []
+        for etapa, amostras in sorted(self.duracoes.items()):
+            ordenadas = sorted(amostras)
+
+            def p(q):
+                return ordenadas[min(len(ordenadas) - 1, int(q * len(ordenadas)))] * 1000
+            linhas.append(f"  {etapa:32} n={len(ordenadas):>6} | p50 {p(0.5):8.1f} ms | "
+                          f"p95 {p(0.95):8.1f} ms | total {sum(ordenadas):8.1f} s")
+        return "\n".join(linhas)
+
+
+def _preparar_ambiente(args):
+    # Em lote ninguém escolhe horário: os oferecidos não seguram a agenda, e
+    # o card é criado na hora (o card_id real vai para a saída)
+    os.environ.setdefault("AGENDA_HOLD_SECONDS", str(args.hold_segundos))
+    os.environ.setdefault("PIPEFY_WRITE_BEHIND", "0")
+    if not args.offline:
+        return None
+
+    from app.fakes.pipefy_server import FakePipefyServer
+
+    pasta = tempfile.mkdtemp(prefix="qualificar_leads_")
+    servidor = FakePipefyServer(latencia=args.latencia_pipefy).iniciar()
+    os.environ.update({
+        "PIPEFY_ACCESS_TOKEN": "token-falso",
+        "PIPEFY_PRE_SALES_PIPE_ID": "1",
+        "PIPEFY_URL": servidor.url,
+        "PIPEFY_OUTBOX_PATH": os.path.join(pasta, "outbox.sqlite3"),
+        "PIPEFY_FIELD_CACHE_PATH": os.path.join(pasta, "pipefy_fields.json"),
+        "LEAD_INDEX_PATH": os.path.join(pasta, "lead_index.sqlite3"),
+        "AGENDA_PATH": os.path.join(pasta, "agenda.sqlite3"),
+        "GEMINI_API_KEY": "chave-falsa",
+    })
+    return servidor
+
+
+def _instrumentar(etapas, args):
+    from app.services import gemini_agent
+
+    if args.offline:
+        from app.fakes.gemini import FakeGeminiClient, Latencia
+        from app.fakes.roteiro_sdr import roteiro_sdr
+        gemini_agent.client = FakeGeminiClient(
+            latencia=Latencia.de_texto(args.latencia_modelo), roteiro=roteiro_sdr)
+
+    cliente = gemini_agent.get_client()
+    if cliente is None:
+        raise SystemExit("Cliente Gemini não configurado (GEMINI_API_KEY) — use --offline.")
+    cliente.aio.models.generate_content = etapas.cronometrar(
+        "modelo", cliente.aio.models.generate_content)
+    for nome, ferramenta in list(gemini_agent.ASYNC_TOOLS.items()):
+        gemini_agent.ASYNC_TOOLS[nome] = etapas.cronometrar(f"ferramenta:{nome}", ferramenta)
+    return gemini_agent
+
+
+def _resultados_das_ferramentas(mensagens):
+    resultados = {}
+    for mensagem in mensagens:
+        for parte in mensagem.get("parts") or []:
+            resposta = parte.get("functionResponse")
+            if not resposta:
+                continue
+            resultado = (resposta.get("response") or {}).get("result")
+            try:
+                resultado = json.loads(resultado)
+            except (TypeError, ValueError):
+                pass
+            resultados[resposta.get("name")] = resultado
+    return resultados
+
+
+async def _qualificar_lead(gemini_agent, indice, lead, tentativas):
+    from fastapi import HTTPException
+
+    historico = [{"role": "user", "parts": [{"text": mensagem_do_formulario(lead)}]}]
+    for tentativa in range(1, tentativas + 1):
+        try:
+            texto, novas = await gemini_agent.executar_turno(historico)
+            break
+        except HTTPException as e:
+            # 429 (admissão/cota) e 5xx: espera e tenta de novo
+            if tentativa == tentativas or e.status_code not in (429, 500, 502, 503, 504):
+                return {"indice": indice, "email": lead.get("email"), "status": "erro",
+                        "erro": f"HTTP {e.status_code}: {e.detail}"}
+            espera = float((e.headers or {}).get("Retry-After", 2 ** tentativa))
+            await asyncio.sleep(espera)
+
+    ferramentas = _resultados_das_ferramentas(novas)
+    registro = ferramentas.get("registrar_lead")
+    card_id = registro.get("card_id") if isinstance(registro, dict) else None
+    horarios = ferramentas.get("oferecer_horarios")
+    return {
+        "indice": indice,
+        "email": lead.get("email"),
+        "status": "sucesso" if card_id else "nao_registrado",
+        "card_id": card_id,
+        "existente": bool(registro.get("existente")) if isinstance(registro, dict) else False,
+        "horarios": horarios.get("slots", []) if isinstance(horarios, dict) else [],
+        "resposta": texto,
+    }
+
+
+async def qualificar(leads, saida, gemini_agent, etapas, feitos, args):
+    """Consome `leads` sob demanda e grava cada resultado assim que sai."""
+    fila = asyncio.Queue(maxsize=2 * args.concorrencia)
+    contagem = {"processados": 0, "pulados": 0}
+    por_status = {}
+    inicio = time.perf_counter()
+    ultimo_progresso = inicio
+
+    async def produtor():
+        for indice, lead in enumerate(leads):
+            if indice in feitos:
+                contagem["pulados"] += 1
+                continue
+            await fila.put((indice, lead))
+        for _ in range(args.concorrencia):
+            await fila.put(None)
+
+    async def trabalhador():
+        nonlocal ultimo_progresso
+        while True:
+            item = await fila.get()
+            if item is None:
+                return
+            indice, lead = item
+            t0 = time.perf_counter()
+            try:
+                resultado = await _qualificar_lead(gemini_agent, indice, lead, args.tentativas)
+            except Exception as e:
+                resultado = {"indice": indice, "email": lead.get("email"), "status": "erro",
+                             "erro": repr(e)}
+            resultado["segundos"] = round(time.perf_counter() - t0, 3)
+            etapas.registrar("lead", time.perf_counter() - t0)
+            saida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+            saida.flush()
+            contagem["processados"] += 1
+            por_status[resultado["status"]] = por_status.get(resultado["status"], 0) + 1
+
+            agora = time.perf_counter()
+            if args.progresso and agora - ultimo_progresso >= args.progresso:
+                ultimo_progresso = agora
+                print(f"... {contagem['processados']} leads "
+                      f"({contagem['processados'] / (agora - inicio):.1f}/s)", file=sys.stderr)
+
+    await asyncio.gather(produtor(), *[trabalhador() for _ in range(args.concorrencia)])
+    return contagem, por_status, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=USO,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("arquivo", help="CSV com cabeçalho ou arquivo .jsonl")
+    parser.add_argument("--saida", required=True,
+                        help="JSONL de resultados (também é o checkpoint para retomar)")
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--tentativas", type=int, default=3,
+                        help="Tentativas por lead em 429/5xx do modelo.")
+    parser.add_argument("--hold-segundos", type=float, default=0,
+                        help="Quanto os horários oferecidos ficam segurados (padrão: nada).")
+    parser.add_argument("--progresso", type=float, default=10,
+                        help="Intervalo (s) entre as linhas de progresso; 0 desliga.")
+    parser.add_argument("--offline", action="store_true",
+                        help="Gemini e Pipefy falsos (nada sai da máquina).")
+    parser.add_argument("--latencia-modelo", default="lognormal:0.3:0.5",
+                        help="Latência do Gemini falso (--offline).")
+    parser.add_argument("--latencia-pipefy", type=float, default=0.02,
+                        help="Latência do Pipefy falso em segundos (--offline).")
+    args = parser.parse_args()
+
+    servidor = _preparar_ambiente(args)
+    try:
+        from app.importar_leads import ler_leads
+        from app.utils.log_utils import configurar_logging
+
+        # Só avisos e erros por padrão: o resumo sai no stderr junto com os logs
+        configurar_logging(os.getenv("LOG_LEVEL", "WARNING"))
+        etapas = Etapas()
+        gemini_agent = _instrumentar(etapas, args)
+        feitos = ler_checkpoint(args.saida)
+        if feitos:
+            print(f"Retomando: {len(feitos)} leads já estão em {args.saida}.", file=sys.stderr)
+
+        with open(args.saida, "a", encoding="utf-8") as saida:
+            contagem, por_status, duracao = asyncio.run(qualificar(
+                ler_leads(args.arquivo), saida, gemini_agent, etapas, feitos, args))
+    finally:
+        if servidor is not None:
+            servidor.parar()
+
+    processados = contagem["processados"]
+    print(f"\n{processados} leads qualificados em {duracao:.1f}s "
+          f"({processados / duracao if duracao else 0:.1f} leads/s), "
+          f"{contagem['pulados']} já estavam na saída. Status: {por_status}", file=sys.stderr)
+    print(etapas.resumo(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
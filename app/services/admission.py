@@ -0,0 +1,201 @@
+import os
+import math
+import time
+import asyncio
+import contextvars
+from collections import OrderedDict, deque
+from typing import Optional
+
+from .metrics import ADMISSAO_REJEITADAS
+
+# Controle de admissão das chamadas ao modelo: no máximo ADMISSION_MAX_CONCURRENT
+# em andamento; as demais esperam numa fila limitada e são recusadas (429) na
+# hora se não dá para atendê-las dentro do prazo. A rota é assíncrona e presa
+# em I/O, então o limite é opcional: 0 (padrão) desliga, e o valor deve vir da
+# capacidade medida do modelo/cota (benchmarks/bench_admission.py).
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "0"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "256"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10"))
+# Estimativa inicial da duração de uma chamada, refinada pela média móvel
+ADMISSION_SERVICE_SECONDS = float(os.getenv("ADMISSION_SERVICE_SECONDS", "1.0"))
+
+# Limite por tenant (X-API-Key / X-Tenant-ID): balde de fichas por turno de
+# conversa. TENANT_RATE_PER_SECOND=0 desliga.
+TENANT_RATE_PER_SECOND = float(os.getenv("TENANT_RATE_PER_SECOND", "0"))
+TENANT_BURST = int(os.getenv("TENANT_BURST", "20"))
+TENANT_MAX_TENANTS = int(os.getenv("TENANT_MAX_TENANTS", "10000"))
+
+# Prazo (time.monotonic) da requisição atual, vindo do cabeçalho X-Timeout-Ms
+prazo_var: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "prazo", default=None)
+
+_PESO_MEDIA = 0.2
+
+
+class Rejeitado(Exception):
+    """Requisição recusada pelo controle de admissão (vira 429 + Retry-After)."""
+
+    def __init__(self, motivo: str, retry_after: float):
+        super().__init__(f"Requisição recusada ({motivo}). Tente novamente em {retry_after:.0f}s.")
+        self.motivo = motivo
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class Vaga:
+    """Uma vaga de chamada ao modelo; `liberar` é idempotente."""
+    __slots__ = ("_controle", "_inicio", "_livre")
+
+    def __init__(self, controle: "ControleDeAdmissao"):
+        self._controle = controle
+        self._inicio = time.monotonic()
+        self._livre = False
+
+    def liberar(self) -> None:
+        if not self._livre:
+            self._livre = True
+            self._controle._liberar(time.monotonic() - self._inicio)
+
+    async def __aenter__(self) -> "Vaga":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.liberar()
+
+
+class ControleDeAdmissao:
+    """
+    Limite global de chamadas simultâneas ao modelo com fila limitada.
+
+    Chamadas prioritárias (continuação de um turno já iniciado: ferramentas
+    já executadas não podem ser jogadas fora) passam na frente e nunca são
+    recusadas. As demais são recusadas na entrada quando a fila está cheia
+    ou quando a espera estimada estoura o prazo da requisição.
+    """
+
+    def __init__(self, limite: int = ADMISSION_MAX_CONCURRENT,
+                 fila_max: int = ADMISSION_QUEUE_SIZE,
+                 espera_max: float = ADMISSION_MAX_WAIT_SECONDS):
+        self.limite = limite
+        self.fila_max = fila_max
+        self.espera_max = espera_max
+        self.em_uso = 0
+        self.servico_medio = ADMISSION_SERVICE_SECONDS
+        self._prioritarios: deque = deque()
+        self._fila: deque = deque()
+
+    @property
+    def na_fila(self) -> int:
+        return len(self._prioritarios) + len(self._fila)
+
+    def estimar_espera(self, posicao: int) -> float:
+        """Espera estimada de quem entra na fila na posição `posicao` (0 = primeiro)."""
+        if self.limite <= 0:
+            return 0.0
+        return (posicao // self.limite + 1) * self.servico_medio
+
+    def _prazo(self) -> float:
+        """Quanto a requisição ainda pode esperar por uma vaga."""
+        orcamento = self.espera_max
+        prazo = prazo_var.get()
+        if prazo is not None:
+            # Precisa sobrar tempo para a própria chamada ao modelo
+            orcamento = min(orcamento, prazo - time.monotonic() - self.servico_medio)
+        return orcamento
+
+    def verificar(self) -> None:
+        """Recusa já (sem entrar na fila) o que `adquirir` recusaria agora."""
+        if self.limite <= 0 or (self.em_uso < self.limite and not self.na_fila):
+            return
+        self._checar_entrada(self._prazo())
+
+    def _checar_entrada(self, orcamento: float) -> None:
+        if len(self._fila) >= self.fila_max:
+            self._recusar("fila_cheia", self.estimar_espera(self.na_fila))
+        espera = self.estimar_espera(self.na_fila)
+        if espera > orcamento:
+            self._recusar("prazo", espera)
+
+    def _recusar(self, motivo: str, retry_after: float) -> None:
+        ADMISSAO_REJEITADAS.labels(motivo).inc()
+        raise Rejeitado(motivo, retry_after)
+
+    async def adquirir(self, prioritario: bool = False) -> Vaga:
+        if self.limite <= 0 or (self.em_uso < self.limite and not self.na_fila):
+            self.em_uso += 1
+            return Vaga(self)
+
+        orcamento = None
+        if not prioritario:
+            orcamento = self._prazo()
+            self._checar_entrada(orcamento)
+
+        fila = self._prioritarios if prioritario else self._fila
+        futuro = asyncio.get_running_loop().create_future()
+        fila.append(futuro)
+        try:
+            await asyncio.wait_for(futuro, timeout=orcamento)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if futuro.done() and not futuro.cancelled():
+                # A vaga chegou junto com o cancelamento: devolve
+                self._liberar(None)
+            else:
+                try:
+                    fila.remove(futuro)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                self._recusar("prazo", self.estimar_espera(self.na_fila))
+            raise
+        return Vaga(self)
+
+    def _liberar(self, duracao: Optional[float]) -> None:
+        if duracao is not None:
+            self.servico_medio += _PESO_MEDIA * (duracao - self.servico_medio)
+        # A vaga passa direto para o próximo da fila (em_uso não muda)
+        for fila in (self._prioritarios, self._fila):
+            while fila:
+                futuro = fila.popleft()
+                if not futuro.done():
+                    futuro.set_result(None)
+                    return
+        self.em_uso -= 1
+
+
+class LimitePorTenant:
+    """Balde de fichas por tenant (LRU limitado em TENANT_MAX_TENANTS)."""
+
+    def __init__(self, taxa: float = TENANT_RATE_PER_SECOND, rajada: int = TENANT_BURST,
+                 max_tenants: int = TENANT_MAX_TENANTS):
+        self.taxa = taxa
+        self.rajada = rajada
+        self.max_tenants = max_tenants
+        # tenant -> [fichas, última atualização]
+        self._baldes: "OrderedDict[str, list]" = OrderedDict()
+
+    def consumir(self, tenant: str) -> None:
+        """Gasta uma ficha do tenant ou recusa com o tempo até a próxima."""
+        if self.taxa <= 0:
+            return
+        agora = time.monotonic()
+        balde = self._baldes.get(tenant)
+        if balde is None:
+            balde = self._baldes[tenant] = [float(self.rajada), agora]
+            while len(self._baldes) > self.max_tenants:
+                self._baldes.popitem(last=False)
+        else:
+            self._baldes.move_to_end(tenant)
+            balde[0] = min(self.rajada, balde[0] + (agora - balde[1]) * self.taxa)
+            balde[1] = agora
+        if balde[0] < 1:
+            ADMISSAO_REJEITADAS.labels("tenant").inc()
+            raise Rejeitado("tenant", (1 - balde[0]) / self.taxa)
+        balde[0] -= 1
+
+
+# Instâncias únicas usadas pela API e pelo agente
+controle_admissao = ControleDeAdmissao()
+limite_por_tenant = LimitePorTenant()
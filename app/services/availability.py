@@ -0,0 +1,629 @@
+import os
+import json
+import time
+import uuid
+import heapq
+import bisect
+import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, date, time as dtime, timedelta
+from typing import Dict, List, Optional, Iterable, Tuple, Any
+
+# Agenda local dos anfitriões (quem conduz as reuniões)
+AGENDA_PATH = os.getenv("AGENDA_PATH", "data/agenda.sqlite3")
+# Anfitriões e expediente: JSON opcional; sem ele, AGENDA_HOSTS + AGENDA_EXPEDIENTE
+AGENDA_HOSTS_PATH = os.getenv("AGENDA_HOSTS_PATH")
+AGENDA_HOSTS = os.getenv("AGENDA_HOSTS", "sdr")
+AGENDA_EXPEDIENTE = os.getenv("AGENDA_EXPEDIENTE", "09:00-18:00")
+AGENDA_DURACAO_MIN = int(os.getenv("AGENDA_DURACAO_MIN", "30"))
+# Antecedência mínima de um horário oferecido e horizonte da busca
+AGENDA_ANTECEDENCIA_MIN = int(os.getenv("AGENDA_ANTECEDENCIA_MIN", "60"))
+AGENDA_HORIZONTE_DIAS = int(os.getenv("AGENDA_HORIZONTE_DIAS", "30"))
+# Horários oferecidos ficam segurados (hold) por este tempo
+AGENDA_HOLD_SECONDS = float(os.getenv("AGENDA_HOLD_SECONDS", "600"))
+AGENDA_SLOTS_OFERECIDOS = int(os.getenv("AGENDA_SLOTS_OFERECIDOS", "3"))
+# Oferece no máximo um horário por dia (opções espalhadas pela semana)
+AGENDA_UM_POR_DIA = os.getenv("AGENDA_UM_POR_DIA", "1") == "1"
+
+FORMATO_SLOT = "%Y-%m-%dT%H:%M:%S"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocos (
+    id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    inicio REAL NOT NULL,
+    fim REAL NOT NULL,
+    tipo TEXT NOT NULL,               -- 'reserva' | 'hold' | 'ocupado'
+    titular TEXT,                     -- card_id de quem segura/reservou
+    expira_em REAL,                   -- só holds
+    origem TEXT NOT NULL DEFAULT 'local',  -- 'local' | 'calendly'
+    externo_id TEXT,
+    sincronizado INTEGER NOT NULL DEFAULT 0,
+    card_atualizado INTEGER NOT NULL DEFAULT 0,  -- link gravado no card (só reservas)
+    criado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_blocos_host ON blocos (host, inicio);
+CREATE INDEX IF NOT EXISTS idx_blocos_tipo ON blocos (tipo, expira_em);
+CREATE TABLE IF NOT EXISTS meta (
+    chave TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (chave, valor) VALUES ('versao', 0);
+"""
+
+
+class HorarioIndisponivel(Exception):
+    """O horário pedido está ocupado, segurado por outro lead ou fora do expediente."""
+
+
+class Expediente:
+    """Janelas de atendimento por dia da semana (0 = segunda) e duração das reuniões."""
+
+    def __init__(self, janelas: Dict[int, List[Tuple[dtime, dtime]]], duracao_min: int = AGENDA_DURACAO_MIN):
+        self.janelas = janelas
+        self.duracao = duracao_min * 60
+        self._cache_dias: Dict[date, List[Tuple[float, float]]] = {}
+
+    @classmethod
+    def de_texto(cls, faixas: str, dias: Iterable[int] = range(5), duracao_min: int = AGENDA_DURACAO_MIN):
+        """'09:00-12:00,13:00-18:00' aplicado aos `dias` informados."""
+        janelas = []
+        for faixa in faixas.split(","):
+            inicio, fim = faixa.strip().split("-")
+            janelas.append((dtime.fromisoformat(inicio), dtime.fromisoformat(fim)))
+        return cls({dia: list(janelas) for dia in dias}, duracao_min)
+
+    def janelas_do_dia(self, dia: date) -> List[Tuple[float, float]]:
+        janelas = self._cache_dias.get(dia)
+        if janelas is None:
+            if len(self._cache_dias) > 1024:
+                self._cache_dias.clear()
+            janelas = self._cache_dias[dia] = [
+                (datetime.combine(dia, ini).timestamp(), datetime.combine(dia, fim).timestamp())
+                for ini, fim in self.janelas.get(dia.weekday(), [])]
+        return janelas
+
+    def proximo_horario(self, desde: float, limite: float) -> Optional[float]:
+        """Primeiro início na grade do expediente (ex.: 09:00, 09:30, ...) >= desde."""
+        dia = datetime.fromtimestamp(desde).date()
+        while True:
+            for ini, fim in self.janelas_do_dia(dia):
+                passos = max(0, -(-(desde - ini) // self.duracao))
+                candidato = ini + passos * self.duracao
+                if candidato + self.duracao <= fim:
+                    return candidato
+            dia += timedelta(days=1)
+            if datetime.combine(dia, dtime()).timestamp() >= limite:
+                return None
+
+    def contem(self, inicio: float, fim: float) -> bool:
+        dia = datetime.fromtimestamp(inicio).date()
+        return any(ini <= inicio and fim <= fim_janela
+                   for ini, fim_janela in self.janelas_do_dia(dia))
+
+
+def carregar_anfitrioes() -> Dict[str, Expediente]:
+    """
+    Lê AGENDA_HOSTS_PATH, no formato
+    {"ana": {"expediente": {"0": ["09:00-12:00", "13:00-18:00"], ...}, "duracao_min": 30}},
+    ou monta os anfitriões de AGENDA_HOSTS com o mesmo AGENDA_EXPEDIENTE (seg-sex).
+    """
+    if AGENDA_HOSTS_PATH:
+        with open(AGENDA_HOSTS_PATH, encoding="utf-8") as arquivo:
+            config = json.load(arquivo)
+        anfitrioes = {}
+        for host, dados in config.items():
+            duracao = dados.get("duracao_min", AGENDA_DURACAO_MIN)
+            janelas = {}
+            for dia, faixas in dados["expediente"].items():
+                janelas[int(dia)] = Expediente.de_texto(
+                    ",".join(faixas), [int(dia)], duracao).janelas[int(dia)]
+            anfitrioes[host] = Expediente(janelas, duracao)
+        return anfitrioes
+    return {host.strip(): Expediente.de_texto(AGENDA_EXPEDIENTE)
+            for host in AGENDA_HOSTS.split(",") if host.strip()}
+
+
+class _Bloco:
+    __slots__ = ("id", "host", "inicio", "fim", "tipo", "titular", "expira_em")
+
+    def __init__(self, id, host, inicio, fim, tipo, titular=None, expira_em=None):
+        self.id = id
+        self.host = host
+        self.inicio = inicio
+        self.fim = fim
+        self.tipo = tipo
+        self.titular = titular
+        self.expira_em = expira_em
+
+    def ativo(self, agora: float) -> bool:
+        return self.tipo != "hold" or self.expira_em > agora
+
+
+class _IndiceIntervalos:
+    """
+    Blocos ocupados de um anfitrião, ordenados pelo início. A busca de
+    sobreposição é O(log n + k): só podem sobrepor [a, b) os blocos que
+    começam em [a - maior_duracao, b).
+    """
+
+    def __init__(self):
+        self._inicios: List[float] = []
+        self._blocos: List[_Bloco] = []
+        self._maior_duracao = 0.0
+
+    def inserir(self, bloco: _Bloco) -> None:
+        i = bisect.bisect_right(self._inicios, bloco.inicio)
+        self._inicios.insert(i, bloco.inicio)
+        self._blocos.insert(i, bloco)
+        self._maior_duracao = max(self._maior_duracao, bloco.fim - bloco.inicio)
+
+    def remover(self, bloco: _Bloco) -> None:
+        i = bisect.bisect_left(self._inicios, bloco.inicio)
+        while i < len(self._blocos) and self._inicios[i] == bloco.inicio:
+            if self._blocos[i] is bloco:
+                del self._inicios[i]
+                del self._blocos[i]
+                return
+            i += 1
+
+    def sobrepostos(self, inicio: float, fim: float) -> List[_Bloco]:
+        i = bisect.bisect_left(self._inicios, inicio - self._maior_duracao)
+        j = bisect.bisect_left(self._inicios, fim)
+        return [b for b in self._blocos[i:j] if b.fim > inicio]
+
+
+def _bloqueia(bloco: _Bloco, agora: float, titular: Optional[str], reserva: bool = False) -> bool:
+    """Holds vencidos ou do próprio titular não bloqueiam."""
+    if not bloco.ativo(agora):
+        return False
+    if bloco.tipo != "hold":
+        return True
+    if titular is not None and bloco.titular == titular:
+        return False
+    # Hold anônimo impede outra oferta, mas não a reserva (não dá para saber de quem é)
+    return not (reserva and bloco.titular is None)
+
+
+class _TravaFIFO:
+    """
+    Trava reentrante que atende na ordem de chegada. Com threading.RLock,
+    quem acabou de soltar a trava a retoma antes de os que esperam
+    acordarem, e algumas ofertas ficam para trás por dezenas de transações
+    (p99 muito acima do p50). Aqui quem solta entrega a trava ao primeiro
+    da fila.
+    """
+
+    def __init__(self):
+        self._interna = threading.Lock()
+        self._fila: "deque[Tuple[int, threading.Lock]]" = deque()
+        self._dono: Optional[int] = None
+        self._nivel = 0
+
+    def __enter__(self):
+        eu = threading.get_ident()
+        with self._interna:
+            if self._dono == eu:
+                self._nivel += 1
+                return self
+            if self._dono is None:
+                self._dono, self._nivel = eu, 1
+                return self
+            vez = threading.Lock()
+            vez.acquire()
+            self._fila.append((eu, vez))
+        vez.acquire()  # liberada por __exit__ já com a trava em nosso nome
+        return self
+
+    def __exit__(self, *exc):
+        with self._interna:
+            self._nivel -= 1
+            if self._nivel:
+                return
+            if self._fila:
+                self._dono, vez = self._fila.popleft()
+                self._nivel = 1
+                vez.release()
+            else:
+                self._dono = None
+
+
+class Agenda:
+    """
+    Motor de disponibilidade: expediente por anfitrião, índice de intervalos
+    ocupados em memória e persistência em SQLite (WAL).
+
+    Consultas são feitas só em memória. Ofertas (com hold) e reservas são
+    enfileiradas no processo (_TravaFIFO) e rodam numa transação BEGIN
+    IMMEDIATE, então o check-and-reserve é atômico também entre processos;
+    um contador de versão no banco avisa quando outro processo mudou a
+    agenda e o índice precisa ser recarregado.
+    Blocos de origem 'calendly' representam a agenda externa sincronizada.
+    """
+
+    def __init__(self, anfitrioes: Optional[Dict[str, Expediente]] = None, caminho: str = AGENDA_PATH,
+                 hold_segundos: float = AGENDA_HOLD_SECONDS):
+        self.anfitrioes = anfitrioes if anfitrioes is not None else carregar_anfitrioes()
+        self.caminho = caminho
+        self.hold_segundos = hold_segundos
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._conn = sqlite3.connect(caminho, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        colunas = {linha[1] for linha in self._conn.execute("PRAGMA table_info(blocos)")}
+        if "card_atualizado" not in colunas:  # banco de antes da coluna
+            self._conn.execute(
+                "ALTER TABLE blocos ADD COLUMN card_atualizado INTEGER NOT NULL DEFAULT 0")
+        # Escritas do processo em fila, numa conexão só: o BEGIN IMMEDIATE
+        # só espera por outros processos
+        self._lock = _TravaFIFO()
+        self._indices: Dict[str, _IndiceIntervalos] = {}
+        self._por_id: Dict[str, _Bloco] = {}
+        # Holds por titular (oferta e reserva buscam os do lead sem varrer tudo)
+        self._holds: Dict[str, Dict[str, _Bloco]] = {}
+        # (grupo, horário) -> até quando todos os anfitriões do grupo estão
+        # tomados por blocos fixos (reserva/ocupado): a busca pula direto
+        self._lotados: Dict[Tuple[int, float], float] = {}
+        self._versao = -1
+        self._escritas = 0
+        self._ultima_limpeza = 0.0
+        self._grupos_todos: Optional[List[Tuple[Expediente, List[str]]]] = None
+
+    # 🔹 Sincronização do índice com o banco
+
+    def _versao_banco(self) -> int:
+        return self._conn.execute("SELECT valor FROM meta WHERE chave = 'versao'").fetchone()[0]
+
+    def _recarregar(self) -> None:
+        self._indices = {host: _IndiceIntervalos() for host in self.anfitrioes}
+        self._por_id = {}
+        self._holds = {}
+        self._lotados = {}
+        linhas = self._conn.execute(
+            "SELECT id, host, inicio, fim, tipo, titular, expira_em FROM blocos WHERE fim > ?",
+            (time.time(),))
+        for linha in linhas:
+            self._indexar(_Bloco(*linha))
+
+    def _atualizar_indice(self) -> None:
+        versao = self._versao_banco()
+        if versao != self._versao:
+            self._recarregar()
+            self._versao = versao
+
+    def _indexar(self, bloco: _Bloco) -> None:
+        indice = self._indices.get(bloco.host)
+        if indice is None:
+            # Anfitrião fora da configuração atual: ainda conta como ocupado
+            indice = self._indices[bloco.host] = _IndiceIntervalos()
+        indice.inserir(bloco)
+        self._por_id[bloco.id] = bloco
+        if bloco.tipo == "hold" and bloco.titular:
+            self._holds.setdefault(bloco.titular, {})[bloco.id] = bloco
+
+    def _desindexar(self, bloco: _Bloco) -> None:
+        self._indices[bloco.host].remover(bloco)
+        self._por_id.pop(bloco.id, None)
+        if bloco.tipo != "hold":
+            # Um horário fixo liberado pode desfazer um "lotado"
+            self._lotados.clear()
+        elif bloco.titular:
+            holds = self._holds.get(bloco.titular)
+            if holds is not None:
+                holds.pop(bloco.id, None)
+                if not holds:
+                    del self._holds[bloco.titular]
+
+    @contextmanager
+    def _transacao(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._escritas = 0
+            try:
+                self._atualizar_indice()
+                self._limpar_holds_vencidos()
+                yield
+                if self._escritas:
+                    # Avisa os outros processos que o índice deles ficou velho
+                    self._conn.execute(
+                        "UPDATE meta SET valor = valor + 1 WHERE chave = 'versao'")
+                self._conn.execute("COMMIT")
+                if self._escritas:
+                    self._versao += 1
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                self._versao = -1  # o índice pode ter ficado à frente do banco
+                raise
+
+    def _limpar_holds_vencidos(self) -> None:
+        agora = time.time()
+        if agora - self._ultima_limpeza < 60:
+            return
+        self._ultima_limpeza = agora
+        self._conn.execute(
+            "DELETE FROM blocos WHERE tipo = 'hold' AND expira_em <= ?", (agora,))
+        for bloco in [b for b in self._por_id.values() if not b.ativo(agora)]:
+            self._desindexar(bloco)
+        self._lotados = {chave: ate for chave, ate in self._lotados.items() if ate > agora}
+
+    def _gravar(self, bloco: _Bloco, origem: str = "local", externo_id: Optional[str] = None) -> None:
+        self._conn.execute(
+            """INSERT INTO blocos (id, host, inicio, fim, tipo, titular, expira_em,
+                                   origem, externo_id, sincronizado, criado_em)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (bloco.id, bloco.host, bloco.inicio, bloco.fim, bloco.tipo, bloco.titular,
+             bloco.expira_em, origem, externo_id, int(origem != "local"), time.time()))
+        self._indexar(bloco)
+        self._escritas += 1
+
+    def _apagar(self, blocos: List[_Bloco]) -> None:
+        if not blocos:
+            return
+        self._conn.executemany("DELETE FROM blocos WHERE id = ?", [(b.id,) for b in blocos])
+        for bloco in blocos:
+            self._desindexar(bloco)
+        self._escritas += 1
+
+    def _holds_do_titular(self, titular: str) -> List[_Bloco]:
+        return list(self._holds.get(titular, {}).values())
+
+    # 🔹 Busca de horários livres
+
+    def _grupos(self, hosts: Optional[Iterable[str]]) -> List[Tuple[Expediente, List[str]]]:
+        """Anfitriões com o mesmo expediente compartilham a grade de horários."""
+        if hosts is None and self._grupos_todos is not None:
+            return self._grupos_todos
+        grupos: Dict[tuple, Tuple[Expediente, List[str]]] = {}
+        for host in hosts or self.anfitrioes:
+            expediente = self.anfitrioes[host]
+            chave = (expediente.duracao,
+                     tuple((dia, tuple(faixas)) for dia, faixas in sorted(expediente.janelas.items())))
+            grupos.setdefault(chave, (expediente, []))[1].append(host)
+        if hosts is None:
+            self._grupos_todos = list(grupos.values())
+        return list(grupos.values())
+
+    def _livres(self, n: int, desde: float, titular: Optional[str], um_por_dia: bool,
+                hosts: Optional[Iterable[str]] = None) -> List[Tuple[float, str]]:
+        """
+        Varre a grade em ordem cronológica com um heap de cursores (um por
+        grupo de expediente). Em cada horário, os anfitriões do grupo são
+        testados até achar um livre, então a consulta para assim que tem
+        `n` opções sem percorrer a agenda de todos. Horários em que o grupo
+        inteiro está tomado por blocos fixos ficam em _lotados e não são
+        testados de novo.
+        """
+        agora = time.time()
+        limite = desde + AGENDA_HORIZONTE_DIAS * 86400
+        grupos = self._grupos(hosts)
+        # Os índices dos grupos só são estáveis na grade de todos os anfitriões
+        lotados = self._lotados if hosts is None else {}
+        heap = []
+        for i, (expediente, _) in enumerate(grupos):
+            candidato = expediente.proximo_horario(desde, limite)
+            if candidato is not None:
+                heap.append((candidato, i))
+        heapq.heapify(heap)
+
+        escolhidos, vistos, dias = [], set(), set()
+        while heap and len(escolhidos) < n:
+            candidato, i = heap[0]
+            expediente, membros = grupos[i]
+            fim = candidato + expediente.duracao
+            dia = datetime.fromtimestamp(candidato).date()
+            proximo = fim
+            if um_por_dia and dia in dias:
+                # Dia já tem opção: o grupo pula para o dia seguinte
+                proximo = datetime.combine(dia + timedelta(days=1), dtime()).timestamp()
+            elif (i, candidato) in lotados:
+                proximo = max(fim, lotados[(i, candidato)])
+            elif candidato not in vistos:
+                # Rodízio do primeiro anfitrião testado, para espalhar as reuniões
+                rodizio = int(candidato // expediente.duracao) % len(membros)
+                desocupa = None
+                # Até quando todos ficam tomados por blocos fixos (None: algum não fica)
+                fixo: Optional[float] = float("inf")
+                for host in membros[rodizio:] + membros[:rodizio]:
+                    indice = self._indices.get(host)
+                    conflitos = [b for b in indice.sobrepostos(candidato, fim)
+                                 if _bloqueia(b, agora, titular)] if indice else []
+                    if not conflitos:
+                        escolhidos.append((candidato, host))
+                        vistos.add(candidato)
+                        dias.add(dia)
+                        break
+                    livre_em = max(b.fim for b in conflitos)
+                    desocupa = livre_em if desocupa is None else min(desocupa, livre_em)
+                    fixos = [b.fim for b in conflitos if b.tipo != "hold"]
+                    if fixo is not None:
+                        fixo = min(fixo, max(fixos)) if fixos else None
+                else:
+                    # Ninguém livre: pula até o primeiro anfitrião desocupar
+                    proximo = max(fim, desocupa)
+                    if fixo is not None and hosts is None:
+                        lotados[(i, candidato)] = fixo
+            proximo = expediente.proximo_horario(proximo, limite)
+            if proximo is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (proximo, i))
+        return escolhidos
+
+    def _inicio_minimo(self, a_partir_de: Optional[datetime]) -> float:
+        minimo = time.time() + AGENDA_ANTECEDENCIA_MIN * 60
+        return max(minimo, a_partir_de.timestamp()) if a_partir_de else minimo
+
+    def proximos_livres(self, n: int = AGENDA_SLOTS_OFERECIDOS, a_partir_de: Optional[datetime] = None,
+                        host: Optional[str] = None, um_por_dia: bool = False) -> List[Dict[str, str]]:
+        """Próximos `n` horários livres (sem segurar). Só memória, sem escrita."""
+        with self._lock:
+            self._atualizar_indice()
+            livres = self._livres(n, self._inicio_minimo(a_partir_de), None, um_por_dia,
+                                  [host] if host else None)
+        return [{"host": h, "inicio": datetime.fromtimestamp(i).strftime(FORMATO_SLOT)}
+                for i, h in livres]
+
+    # 🔹 Oferta e reserva
+
+    def oferecer(self, n: int = AGENDA_SLOTS_OFERECIDOS, titular: Optional[str] = None,
+                 um_por_dia: bool = AGENDA_UM_POR_DIA) -> List[Dict[str, str]]:
+        """
+        Escolhe `n` horários livres e os segura por hold_segundos, para que
+        ofertas concorrentes não se sobreponham. Uma nova oferta ao mesmo
+        titular substitui os holds anteriores dele.
+        """
+        with self._transacao():
+            if titular:
+                self._apagar(self._holds_do_titular(titular))
+            livres = self._livres(n, self._inicio_minimo(None), titular, um_por_dia)
+            expira_em = time.time() + self.hold_segundos
+            for inicio, host in livres:
+                self._gravar(_Bloco(uuid.uuid4().hex, host, inicio,
+                                    inicio + self.anfitrioes[host].duracao, "hold",
+                                    titular, expira_em))
+        return [{"host": h, "inicio": datetime.fromtimestamp(i).strftime(FORMATO_SLOT)}
+                for i, h in livres]
+
+    def reservar(self, inicio: datetime, titular: Optional[str] = None,
+                 host: Optional[str] = None) -> Dict[str, str]:
+        """
+        Check-and-reserve atômico. Sem `host`, prefere o anfitrião em que o
+        titular segurou este horário e depois qualquer um livre.
+        Levanta HorarioIndisponivel se nenhum anfitrião puder atender.
+        Idempotente por (titular, horário): repetir a reserva devolve a mesma,
+        com "existente": True e "card_atualizado" (marcar_card_atualizado).
+        """
+        ts = inicio.timestamp()
+        if ts < time.time():
+            raise HorarioIndisponivel("O horário informado já passou.")
+
+        with self._transacao():
+            agora = time.time()
+            existente = self._reserva_do_titular(titular, ts) if titular else None
+            if existente is not None:
+                card_atualizado = self._conn.execute(
+                    "SELECT card_atualizado FROM blocos WHERE id = ?", (existente.id,)).fetchone()
+                return {"id": existente.id, "host": existente.host, "existente": True,
+                        "card_atualizado": bool(card_atualizado and card_atualizado[0]),
+                        "inicio": datetime.fromtimestamp(ts).strftime(FORMATO_SLOT),
+                        "fim": datetime.fromtimestamp(existente.fim).strftime(FORMATO_SLOT)}
+            if host is not None:
+                if host not in self.anfitrioes:
+                    raise HorarioIndisponivel(f"Anfitrião desconhecido: {host}")
+                candidatos = [host]
+            else:
+                segurados = {b.host for b in self._holds_do_titular(titular)
+                             if b.inicio == ts and b.ativo(agora)} if titular else set()
+                candidatos = sorted(self.anfitrioes, key=lambda h: h not in segurados)
+
+            fora_do_expediente = True
+            for candidato in candidatos:
+                fim = ts + self.anfitrioes[candidato].duracao
+                if not self.anfitrioes[candidato].contem(ts, fim):
+                    continue
+                fora_do_expediente = False
+                sobrepostos = self._indices[candidato].sobrepostos(ts, fim) \
+                    if candidato in self._indices else []
+                if any(_bloqueia(b, agora, titular, reserva=True) for b in sobrepostos):
+                    continue
+
+                # Holds anônimos sobre o horário e os holds do titular caem
+                liberar = {b.id: b for b in sobrepostos if b.tipo == "hold"}
+                if titular:
+                    liberar.update((b.id, b) for b in self._holds_do_titular(titular))
+                self._apagar(list(liberar.values()))
+                reserva = _Bloco(uuid.uuid4().hex, candidato, ts, fim, "reserva", titular)
+                self._gravar(reserva)
+                return {"id": reserva.id, "host": candidato,
+                        "inicio": datetime.fromtimestamp(ts).strftime(FORMATO_SLOT),
+                        "fim": datetime.fromtimestamp(fim).strftime(FORMATO_SLOT)}
+
+        if fora_do_expediente:
+            raise HorarioIndisponivel("Horário fora do expediente de atendimento.")
+        raise HorarioIndisponivel("Horário já reservado para outro cliente.")
+
+    def _reserva_do_titular(self, titular: str, ts: float) -> Optional[_Bloco]:
+        for indice in self._indices.values():
+            for bloco in indice.sobrepostos(ts, ts + 1):
+                if bloco.tipo == "reserva" and bloco.titular == titular and bloco.inicio == ts:
+                    return bloco
+        return None
+
+    def marcar_card_atualizado(self, reserva_id: str) -> None:
+        """Registra que o card do lead já recebeu o link desta reserva."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE blocos SET card_atualizado = 1 WHERE id = ?", (reserva_id,))
+
+    def cancelar(self, reserva_id: str) -> bool:
+        with self._transacao():
+            bloco = self._por_id.get(reserva_id)
+            if bloco is None or bloco.tipo != "reserva":
+                return False
+            self._apagar([bloco])
+        return True
+
+    # 🔹 Sincronização com agenda externa (Calendly)
+
+    def importar_ocupados(self, host: str, inicio: datetime, fim: datetime,
+                          ocupados: Iterable[Tuple[datetime, datetime, str]]) -> int:
+        """
+        Substitui os blocos de origem 'calendly' do anfitrião na janela
+        [inicio, fim) por `ocupados` (inicio, fim, id externo).
+        """
+        with self._transacao():
+            antigos = self._conn.execute(
+                """SELECT id FROM blocos WHERE host = ? AND origem = 'calendly'
+                   AND inicio < ? AND fim > ?""",
+                (host, fim.timestamp(), inicio.timestamp())).fetchall()
+            # Blocos já passados não estão no índice, mas saem do banco também
+            self._conn.executemany("DELETE FROM blocos WHERE id = ?", antigos)
+            for (bloco_id,) in antigos:
+                if bloco_id in self._por_id:
+                    self._desindexar(self._por_id[bloco_id])
+            self._escritas += len(antigos)
+            total = 0
+            for ini, fim_externo, externo_id in ocupados:
+                self._gravar(_Bloco(f"calendly:{host}:{externo_id}", host, ini.timestamp(),
+                                    fim_externo.timestamp(), "ocupado"),
+                             origem="calendly", externo_id=externo_id)
+                total += 1
+        return total
+
+    def reservas_nao_sincronizadas(self) -> List[Dict[str, Any]]:
+        """Reservas locais ainda não enviadas à agenda externa."""
+        # A conexão é compartilhada: sem a trava, a leitura cairia dentro da
+        # transação de outra thread (e veria reservas que ainda podem voltar)
+        with self._lock:
+            linhas = self._conn.execute(
+                """SELECT id, host, inicio, fim, titular FROM blocos
+                   WHERE tipo = 'reserva' AND origem = 'local' AND sincronizado = 0
+                   ORDER BY inicio""").fetchall()
+        return [{"id": i, "host": h, "titular": t,
+                 "inicio": datetime.fromtimestamp(ini).strftime(FORMATO_SLOT),
+                 "fim": datetime.fromtimestamp(fim).strftime(FORMATO_SLOT)}
+                for i, h, ini, fim, t in linhas]
+
+    def marcar_sincronizadas(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE blocos SET sincronizado = 1 WHERE id = ?", [(i,) for i in ids])
+
+
+_agenda: Optional[Agenda] = None
+_agenda_lock = threading.Lock()
+
+
+def get_agenda() -> Agenda:
+    global _agenda
+    if _agenda is None:
+        with _agenda_lock:
+            if _agenda is None:
+                _agenda = Agenda()
+    return _agenda
@@ -1,40 +1,36 @@
-import os
 import json
-import uuid
-from datetime import datetime, timedelta
+from datetime import datetime
 from app.utils.date_utils import normalizar_data
-import random
-
-CALENDAR_API_KEY = os.getenv("CALENDAR_API_KEY")
-USE_SIMULATION = not CALENDAR_API_KEY  # se token vazio, ativa simulação
-
-
-def _get_available_slots():
-    """Simula ou pega horários reais (por enquanto simula)."""
-    slots = []
-    base_date = datetime.now() + timedelta(days=1)
-    while len(slots) < 3:
-        current_date = base_date + timedelta(days=len(slots))
-        random_hour = random.randint(9, 17)
-        random_minute = random.choice([0, 30])
-        slot_datetime = current_date.replace(
-            hour=random_hour, minute=random_minute, second=0, microsecond=0
-        )
-        if slot_datetime.weekday() < 5:
-            slots.append(slot_datetime.isoformat())
-    return slots
-
-
-def oferecer_horarios() -> str:
-    """Oferece horários disponíveis (simulados ou reais)."""
-    if USE_SIMULATION:
-        slots = _get_available_slots()
-        return json.dumps({"slots": slots})
-    else:
-        # TODO: Aqui você chamaria a API do Calendly para buscar horários reais
-        return json.dumps({
-            "slots": ["2025-10-25T10:00:00", "2025-10-25T14:00:00"]
-        })
+from app.services.availability import get_agenda, HorarioIndisponivel
+
+# Os horários saem da agenda local (app/services/availability.py). Uma agenda
+# externa entra por Agenda.importar_ocupados / reservas_nao_sincronizadas.
+
+
+def _get_available_slots(card_id: str = None):
+    """Próximos horários livres, segurados para o lead até ele escolher."""
+    return [slot["inicio"] for slot in get_agenda().oferecer(titular=card_id)]
+
+
+def oferecer_horarios(card_id: str = None) -> str:
+    """
+    Oferece horários disponíveis. Informe o card_id do lead para que os
+    horários fiquem reservados para ele enquanto escolhe.
+    """
+    slots = _get_available_slots(card_id)
+    if not slots:
+        return json.dumps({"slots": [], "mensagem": "Nenhum horário livre no momento."})
+    return json.dumps({"slots": slots})
+
+
+def _card_atualizado(resultado: str) -> bool:
+    """Se o retorno de atualizar_card_com_reuniao(_outbox) indica sucesso."""
+    if "atualizado com sucesso" in resultado:
+        return True
+    try:
+        return json.loads(resultado).get("status") == "sucesso"  # modo de simulação
+    except (ValueError, AttributeError):
+        return False
 
 
 def agendar_reuniao(slot_input: str, card_id: str) -> str:
@@ -48,10 +44,28 @@ def agendar_reuniao(slot_input: str, card_id: str) -> str:
     except Exception as e:
         return f"Erro ao interpretar data: {e}"
 
-    meeting_id = str(uuid.uuid4())
+    # Check-and-reserve atômico: dois leads nunca ficam com o mesmo horário
+    try:
+        reserva = get_agenda().reservar(
+            datetime.strptime(slot_iso_str, "%Y-%m-%dT%H:%M:%S"), titular=card_id)
+    except HorarioIndisponivel as e:
+        return f"Erro: {e} Ofereça outros horários com oferecer_horarios."
+
+    meeting_id = reserva["id"]
     meeting_link = f"https://meet.link.ficticio/{meeting_id}"
+    if reserva.get("card_atualizado"):
+        # Repetição (retry do cliente ou do modelo): o card já recebeu este link
+        return f"Reunião agendada em {slot_iso_str}. Link: {meeting_link}"
 
     from .pipefy_service import atualizar_card_com_reuniao
-    atualizar_card_com_reuniao(card_id, meeting_link, slot_iso_str)
+    from .outbox import PIPEFY_WRITE_BEHIND, atualizar_card_com_reuniao_outbox
+    atualizar = atualizar_card_com_reuniao_outbox if PIPEFY_WRITE_BEHIND else atualizar_card_com_reuniao
+    resultado = atualizar(card_id, meeting_link, slot_iso_str)
+    if not _card_atualizado(resultado):
+        # A reserva fica; repetir agendar_reuniao com o mesmo horário refaz só o card
+        return (f"Erro: o horário {slot_iso_str} foi reservado, mas o card {card_id} não "
+                f"recebeu o link da reunião ({resultado}). Tente agendar_reuniao de novo "
+                f"com o mesmo horário.")
+    get_agenda().marcar_card_atualizado(meeting_id)
 
     return f"Reunião agendada em {slot_iso_str}. Link: {meeting_link}"
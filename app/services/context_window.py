@@ -0,0 +1,242 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
+
+# Janela de contexto enviada ao Gemini
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "6"))
+# Quantos turnos antigos são dobrados no resumo de uma vez (a janela "anda" em blocos)
+CONTEXT_FOLD_TURNS = int(os.getenv("CONTEXT_FOLD_TURNS", "4"))
+CONTEXT_SUMMARY_MAX_CHARS = int(os.getenv("CONTEXT_SUMMARY_MAX_CHARS", "2000"))
+CONTEXT_SUMMARY_CACHE_SIZE = int(os.getenv("CONTEXT_SUMMARY_CACHE_SIZE", "1024"))
+
+# Fatos do lead que nunca saem do contexto
+FATOS_FIXADOS = ("card_id", "nome", "email", "empresa", "necessidade")
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+
+# Resumidor: recebe (resumo anterior, mensagens a dobrar) e devolve o novo resumo
+Resumidor = Callable[[str, List[Dict[str, Any]]], Awaitable[str]]
+
+
+class _CacheResumos:
+    """LRU simples: chave encadeada do prefixo dobrado -> resumo."""
+
+    def __init__(self, capacidade: int):
+        self.capacidade = capacidade
+        self._itens: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+
+    def get(self, chave: str) -> Optional[str]:
+        with self._lock:
+            resumo = self._itens.get(chave)
+            if resumo is not None:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+            else:
+                self.faltas += 1
+            return resumo
+
+    def set(self, chave: str, resumo: str) -> None:
+        with self._lock:
+            self._itens[chave] = resumo
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+
+
+_cache_resumos = _CacheResumos(CONTEXT_SUMMARY_CACHE_SIZE)
+
+
+def _eh_inicio_de_turno(item: Dict[str, Any]) -> bool:
+    return item.get("role") == "user" and any(
+        isinstance(p, dict) and p.get("text") for p in item.get("parts", []))
+
+
+def dividir_em_turnos(history: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    Agrupa o histórico em turnos. Cada turno começa numa mensagem de texto do
+    usuário, então chamadas de ferramenta nunca ficam separadas da resposta.
+    """
+    turnos: List[List[Dict[str, Any]]] = []
+    for item in history:
+        if not turnos or _eh_inicio_de_turno(item):
+            turnos.append([])
+        turnos[-1].append(item)
+    return turnos
+
+
+def _procurar_card_id(valor: Any) -> Optional[str]:
+    if isinstance(valor, str):
+        try:
+            valor = json.loads(valor)
+        except ValueError:
+            return None
+    if isinstance(valor, dict):
+        if valor.get("card_id"):
+            return str(valor["card_id"])
+        for interno in valor.values():
+            encontrado = _procurar_card_id(interno)
+            if encontrado:
+                return encontrado
+    return None
+
+
+def extrair_fatos(history: List[Dict[str, Any]], fatos: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Extrai card_id e dados do lead das chamadas/respostas de ferramentas."""
+    fatos = dict(fatos or {})
+    for item in history:
+        for p in item.get("parts", []):
+            if not isinstance(p, dict):
+                continue
+            call = p.get("functionCall")
+            if call:
+                args = call.get("args") or {}
+                if call.get("name") == "registrar_lead":
+                    for chave in ("nome", "email", "empresa", "necessidade"):
+                        if args.get(chave):
+                            fatos[chave] = str(args[chave])
+                if args.get("card_id"):
+                    fatos["card_id"] = str(args["card_id"])
+            resposta = p.get("functionResponse")
+            if resposta:
+                card_id = _procurar_card_id(resposta.get("response"))
+                if card_id:
+                    fatos["card_id"] = card_id
+            texto = p.get("text")
+            if texto and item.get("role") == "user" and "email" not in fatos:
+                encontrado = _EMAIL_RE.search(texto)
+                if encontrado:
+                    fatos["email"] = encontrado.group(0)
+    return fatos
+
+
+def _linha(item: Dict[str, Any]) -> str:
+    autor = {"user": "Usuário", "tool": "Ferramenta"}.get(
+        item.get("role"), "Agente")
+    pedacos = []
+    for p in item.get("parts", []):
+        if not isinstance(p, dict):
+            continue
+        if p.get("text"):
+            pedacos.append(p["text"].strip().replace("\n", " ")[:200])
+        elif p.get("functionCall"):
+            pedacos.append(f"[chamou {p['functionCall'].get('name')}]")
+        elif p.get("functionResponse"):
+            pedacos.append(
+                f"[resultado de {p['functionResponse'].get('name')}]")
+    return f"{autor}: {' '.join(pedacos)}" if pedacos else ""
+
+
+async def resumo_extrativo(anterior: str, mensagens: List[Dict[str, Any]]) -> str:
+    """Resumo sem chamada ao modelo: linhas curtas, mantendo só o final."""
+    linhas = [l for l in (_linha(m) for m in mensagens) if l]
+    resumo = "\n".join(filter(None, [anterior] + linhas))
+    if len(resumo) > CONTEXT_SUMMARY_MAX_CHARS:
+        resumo = "…" + resumo[-CONTEXT_SUMMARY_MAX_CHARS:]
+    return resumo
+
+
+def _chave(anterior: str, bloco: List[Dict[str, Any]]) -> str:
+    dados = json.dumps(bloco, sort_keys=True, ensure_ascii=False,
+                       separators=(",", ":"), default=str)
+    return hashlib.sha256((anterior + dados).encode("utf-8")).hexdigest()
+
+
+class EstadoJanela:
+    """
+    Estado de janela_de_contexto para um histórico que só cresce (a
+    ConversaCompilada de uma sessão): onde começa cada turno, os fatos já
+    extraídos e o resumo dos blocos já dobrados. Cada chamada lê só as
+    mensagens novas e dobra só os blocos novos.
+    """
+    __slots__ = ("lidas", "inicios", "fatos", "blocos", "chave", "resumo")
+
+    def __init__(self):
+        self.lidas = 0
+        self.inicios: List[int] = []  # índice da primeira mensagem de cada turno
+        self.fatos: Dict[str, str] = {}
+        self.blocos = 0
+        self.chave = ""
+        self.resumo = ""
+
+    def copiar(self) -> "EstadoJanela":
+        copia = EstadoJanela()
+        copia.lidas, copia.blocos = self.lidas, self.blocos
+        copia.chave, copia.resumo = self.chave, self.resumo
+        copia.inicios = list(self.inicios)
+        copia.fatos = dict(self.fatos)
+        return copia
+
+    def ler(self, history: List[Dict[str, Any]]) -> None:
+        """Registra turnos e fatos das mensagens ainda não lidas."""
+        if len(history) < self.lidas:
+            # Não é o mesmo histórico (só cresce): recomeça do zero
+            self.__init__()
+        for i in range(self.lidas, len(history)):
+            if not self.inicios or _eh_inicio_de_turno(history[i]):
+                self.inicios.append(i)
+        self.fatos = extrair_fatos(history[self.lidas:], self.fatos)
+        self.lidas = len(history)
+
+    def _inicio(self, turno: int) -> int:
+        return self.inicios[turno] if turno < len(self.inicios) else self.lidas
+
+
+async def janela_de_contexto(history: List[Dict[str, Any]],
+                             resumir: Resumidor = resumo_extrativo,
+                             estado: Optional[EstadoJanela] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Mantém os últimos CONTEXT_MAX_TURNS turnos literais e dobra os anteriores
+    num resumo em cache, recalculado só quando a janela avança um bloco.
+    Os fatos fixados (card_id, nome, email, empresa, necessidade) vão sempre
+    numa mensagem de contexto no início.
+
+    Com `estado` (o da conversa), só as mensagens e os blocos novos desde a
+    chamada anterior são processados; sem ele, o histórico é lido inteiro.
+
+    Devolve (mensagens de contexto, índice em `history` onde começa a janela
+    literal); sem nada a dobrar, ([], 0).
+    """
+    estado = estado if estado is not None else EstadoJanela()
+    estado.ler(history)
+    blocos = max(0, (len(estado.inicios) - CONTEXT_MAX_TURNS) // CONTEXT_FOLD_TURNS)
+    if blocos == 0:
+        return [], 0
+
+    for i in range(estado.blocos, blocos):
+        bloco = history[estado._inicio(i * CONTEXT_FOLD_TURNS):
+                        estado._inicio((i + 1) * CONTEXT_FOLD_TURNS)]
+        chave = _chave(estado.chave, bloco)
+        em_cache = _cache_resumos.get(chave)
+        if em_cache is None:
+            em_cache = await resumir(estado.resumo, bloco)
+            _cache_resumos.set(chave, em_cache)
+        estado.blocos, estado.chave, estado.resumo = i + 1, chave, em_cache
+
+    fatos = estado.fatos
+    linhas_fatos = [f"- {nome}: {fatos[nome]}"
+                    for nome in FATOS_FIXADOS if fatos.get(nome)]
+    contexto = "[Contexto da conversa até aqui]\n"
+    if linhas_fatos:
+        contexto += "Dados do lead:\n" + "\n".join(linhas_fatos) + "\n"
+    contexto += "Resumo das mensagens anteriores:\n" + estado.resumo
+
+    return [
+        {"role": "user", "parts": [{"text": contexto}]},
+        {"role": "model", "parts": [{"text": "Entendido."}]},
+    ], estado._inicio(blocos * CONTEXT_FOLD_TURNS)
+
+
+async def compactar_historico(history: List[Dict[str, Any]],
+                              resumir: Resumidor = resumo_extrativo) -> List[Dict[str, Any]]:
+    """Histórico compactado por janela_de_contexto, já no formato de wire."""
+    contexto, inicio = await janela_de_contexto(history, resumir)
+    if not contexto:
+        return history
+    return contexto + history[inicio:]
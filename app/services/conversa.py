@@ -0,0 +1,112 @@
+from typing import List, Dict, Any, Iterable, Optional, TYPE_CHECKING
+
+from pydantic import TypeAdapter, ValidationError
+
+from app.models import HistoryItem
+from app.services.context_window import EstadoJanela
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+# Validador compilado (pydantic-core) do formato de wire
+_VALIDADOR = TypeAdapter(HistoryItem)
+
+
+class HistoricoInvalido(ValueError):
+    """Mensagem do histórico fora do formato de wire (role/parts)."""
+
+
+class _MensagemCompilada:
+    __slots__ = ("wire", "content")
+
+    def __init__(self, wire: Dict[str, Any], content: Optional["types.Content"]):
+        self.wire = wire
+        self.content = content
+
+
+def compilar_mensagem(item: Dict[str, Any], validada: bool = False) -> _MensagemCompilada:
+    """
+    Valida uma mensagem de wire contra HistoryItem (aliases snake_case saem
+    normalizados) e a converte em types.Content. `validada=True` pula a
+    validação: a mensagem já passou por HistoryItem (o `history` do corpo da
+    requisição, as mensagens guardadas na sessão). Mensagens sem partes
+    aproveitáveis ficam sem Content.
+    """
+    from google.genai import types
+
+    if not validada:
+        try:
+            item = _VALIDADOR.validate_python(item)
+        except ValidationError as e:
+            raise HistoricoInvalido(f"Mensagem inválida no histórico: {e}") from e
+
+    gemini_parts = []
+    for parte in item["parts"]:
+        if parte.get("text"):
+            gemini_parts.append(types.Part(text=parte["text"]))
+
+        elif parte.get("functionCall"):
+            chamada = parte["functionCall"]
+            gemini_parts.append(types.Part.from_function_call(
+                name=chamada["name"],
+                args=chamada.get("args") or {}
+            ))
+
+        elif parte.get("functionResponse"):
+            resposta = parte["functionResponse"]
+            gemini_parts.append(types.Part.from_function_response(
+                name=resposta["name"],
+                response=resposta["response"]
+            ))
+
+    if not gemini_parts:
+        return _MensagemCompilada(item, None)
+    # Atenção: O Python client espera 'user' ou 'model'.
+    # Respostas de ferramenta (role 'tool') vão do lado do usuário.
+    role = "user" if item["role"] == "tool" else item["role"]
+    return _MensagemCompilada(item, types.Content(role=role, parts=gemini_parts))
+
+
+class ConversaCompilada:
+    """
+    Histórico já convertido para o SDK, só com acréscimos: cada mensagem é
+    validada e vira types.Content uma única vez (em `anexar`, O(1)), e o
+    formato de wire original fica guardado ao lado, sem reconversão. `janela`
+    guarda o estado da janela de contexto (turnos, fatos, resumo dobrado).
+    """
+    __slots__ = ("_wire", "_contents", "janela")
+
+    def __init__(self, mensagens: Iterable[Dict[str, Any]] = (), validadas: bool = False):
+        self._wire: List[Dict[str, Any]] = []
+        self._contents: List[Optional["types.Content"]] = []
+        self.janela = EstadoJanela()
+        self.estender(mensagens, validadas)
+
+    def __len__(self) -> int:
+        return len(self._wire)
+
+    def anexar(self, mensagem: Dict[str, Any], validada: bool = False) -> None:
+        compilada = compilar_mensagem(mensagem, validada)
+        self._wire.append(compilada.wire)
+        self._contents.append(compilada.content)
+
+    def estender(self, mensagens: Iterable[Dict[str, Any]], validadas: bool = False) -> None:
+        for mensagem in mensagens:
+            self.anexar(mensagem, validadas)
+
+    def bifurcar(self) -> "ConversaCompilada":
+        """Cópia rasa: compartilha as mensagens compiladas, não a lista."""
+        copia = ConversaCompilada()
+        copia._wire = list(self._wire)
+        copia._contents = list(self._contents)
+        copia.janela = self.janela.copiar()
+        return copia
+
+    @property
+    def mensagens(self) -> List[Dict[str, Any]]:
+        """Histórico no formato de wire (não alterar a lista devolvida)."""
+        return self._wire
+
+    def contents(self, inicio: int = 0) -> List["types.Content"]:
+        """Contents do SDK a partir da mensagem `inicio`."""
+        return [c for c in self._contents[inicio:] if c is not None]
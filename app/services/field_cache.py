@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl  # trava entre processos (workers do uvicorn); só em POSIX
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+PIPEFY_FIELD_CACHE_PATH = os.getenv(
+    "PIPEFY_FIELD_CACHE_PATH", "data/pipefy_fields.json")
+PIPEFY_FIELD_CACHE_TTL = float(os.getenv("PIPEFY_FIELD_CACHE_TTL", "3600"))
+# Snapshot do start_form_fields gravado pelo diagnostico_pipefy.py: semeia o
+# cache na partida sem consultar o Pipefy
+PIPEFY_SCHEMA_SNAPSHOT_PATH = os.getenv(
+    "PIPEFY_SCHEMA_SNAPSHOT_PATH", "data/pipefy_schema.json")
+
+logger = logging.getLogger(__name__)
+
+
+class FieldIdCache:
+    """
+    Cache do mapeamento chave -> field id do Start Form, por PIPE_ID.
+
+    Fica em memória e num arquivo JSON (partida quente e compartilhamento
+    entre workers). Expira após o TTL; a atualização é single-flight: dentro
+    do processo por um lock por pipe, entre processos por flock no arquivo.
+    """
+
+    def __init__(self, caminho: str = PIPEFY_FIELD_CACHE_PATH, ttl: float = PIPEFY_FIELD_CACHE_TTL):
+        self.caminho = caminho
+        self.ttl = ttl
+        self._memoria: Dict[str, dict] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self._em_voo: Dict[tuple, asyncio.Future] = {}
+        self.acertos = 0
+        self.faltas = 0
+
+    def _fresco(self, entrada: Optional[dict]) -> bool:
+        return bool(entrada) and time.time() - entrada["atualizado_em"] < self.ttl
+
+    def _lock(self, pipe_id: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(pipe_id, threading.Lock())
+
+    # 🔹 Disco
+
+    def _ler_disco(self) -> Dict[str, dict]:
+        try:
+            with open(self.caminho, encoding="utf-8") as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError):
+            return {}
+
+    def _gravar_disco(self, pipe_id: str, entrada: Optional[dict]) -> None:
+        pasta = os.path.dirname(self.caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        dados = self._ler_disco()
+        if entrada is None:
+            dados.pop(pipe_id, None)
+        else:
+            dados[pipe_id] = entrada
+        temporario = f"{self.caminho}.{os.getpid()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(dados, arquivo, ensure_ascii=False, indent=2)
+        os.replace(temporario, self.caminho)
+
+    def _trava_processos(self):
+        """Arquivo de trava para que só um worker busque no Pipefy por vez."""
+        if fcntl is None:
+            return None
+        pasta = os.path.dirname(self.caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        arquivo = open(f"{self.caminho}.lock", "w")
+        fcntl.flock(arquivo, fcntl.LOCK_EX)
+        return arquivo
+
+    # 🔹 API
+
+    def obter(self, pipe_id: str, buscar: Callable[[], Dict[str, str]]) -> Dict[str, str]:
+        """Devolve os field ids do pipe, chamando `buscar` só se o cache expirou."""
+        pipe_id = str(pipe_id)
+        entrada = self._memoria.get(pipe_id)
+        if self._fresco(entrada):
+            self.acertos += 1
+            return entrada["ids"]
+
+        with self._lock(pipe_id):
+            entrada = self._memoria.get(pipe_id)
+            if self._fresco(entrada):
+                self.acertos += 1
+                return entrada["ids"]
+
+            trava = self._trava_processos()
+            try:
+                # Outro worker (ou uma execução anterior) pode já ter gravado
+                entrada = self._ler_disco().get(pipe_id)
+                if self._fresco(entrada):
+                    self.acertos += 1
+                else:
+                    self.faltas += 1
+                    entrada = {"ids": buscar(), "atualizado_em": time.time()}
+                    self._gravar_disco(pipe_id, entrada)
+                self._memoria[pipe_id] = entrada
+            finally:
+                if trava is not None:
+                    trava.close()
+        return entrada["ids"]
+
+    async def aobter(self, pipe_id: str, buscar: Callable[[], Dict[str, str]]) -> Dict[str, str]:
+        """Versão assíncrona: corrotinas concorrentes esperam a mesma busca."""
+        pipe_id = str(pipe_id)
+        entrada = self._memoria.get(pipe_id)
+        if self._fresco(entrada):
+            self.acertos += 1
+            return entrada["ids"]
+
+        chave = (id(asyncio.get_running_loop()), pipe_id)
+        futuro = self._em_voo.get(chave)
+        if futuro is None:
+            futuro = asyncio.ensure_future(
+                asyncio.to_thread(self.obter, pipe_id, buscar))
+            self._em_voo[chave] = futuro
+            futuro.add_done_callback(lambda _: self._em_voo.pop(chave, None))
+        return await asyncio.shield(futuro)
+
+    def semear(self, pipe_id: str, ids: Dict[str, str], substituir: bool = True,
+               atualizado_em: Optional[float] = None) -> bool:
+        """
+        Grava um mapeamento obtido por fora (ex.: diagnostico_pipefy.py).
+        `atualizado_em` é quando ele foi lido do Pipefy (padrão: agora); um
+        mapeamento já vencido pelo TTL não é gravado. Com substituir=False,
+        um mapeamento ainda fresco (memória ou disco) é mantido. Devolve se
+        gravou.
+        """
+        pipe_id = str(pipe_id)
+        entrada = {"ids": dict(ids),
+                   "atualizado_em": time.time() if atualizado_em is None else atualizado_em}
+        if not self._fresco(entrada):
+            return False
+        with self._lock(pipe_id):
+            if not substituir and self._fresco(self._memoria.get(pipe_id)):
+                return False
+            trava = self._trava_processos()
+            try:
+                if not substituir:
+                    atual = self._ler_disco().get(pipe_id)
+                    if self._fresco(atual):
+                        self._memoria[pipe_id] = atual
+                        return False
+                self._memoria[pipe_id] = entrada
+                self._gravar_disco(pipe_id, entrada)
+            finally:
+                if trava is not None:
+                    trava.close()
+        return True
+
+    def invalidar(self, pipe_id: str) -> None:
+        """Descarta o mapeamento (ex.: o Pipefy rejeitou um field id)."""
+        pipe_id = str(pipe_id)
+        with self._lock(pipe_id):
+            trava = self._trava_processos()
+            try:
+                self._memoria.pop(pipe_id, None)
+                self._gravar_disco(pipe_id, None)
+            finally:
+                if trava is not None:
+                    trava.close()
+        logger.warning("Cache de campos do pipe %s invalidado.", pipe_id)
+
+
+field_cache = FieldIdCache()
+
+
+# 🔹 Snapshot do schema
+
+
+def gravar_snapshot(pipe_id: str, nome: Optional[str], campos: List[dict],
+                    caminho: str = PIPEFY_SCHEMA_SNAPSHOT_PATH) -> None:
+    """Grava o start_form_fields do pipe (id, internal_id, label, type)."""
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    dados = {
+        "pipe_id": str(pipe_id),
+        "nome": nome,
+        "capturado_em": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "start_form_fields": campos,
+    }
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(dados, arquivo, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+
+def ler_snapshot(pipe_id: str, caminho: str = PIPEFY_SCHEMA_SNAPSHOT_PATH
+                 ) -> Optional[Tuple[List[dict], float]]:
+    """
+    (start_form_fields, capturado_em em epoch) do snapshot, ou None se não
+    houver um válido para este pipe.
+    """
+    try:
+        with open(caminho, encoding="utf-8") as arquivo:
+            dados = json.load(arquivo)
+        capturado_em = datetime.strptime(
+            dados["capturado_em"], "%Y-%m-%dT%H:%M:%S%z").timestamp()
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if str(dados.get("pipe_id")) != str(pipe_id) or not dados.get("start_form_fields"):
+        return None
+    return dados["start_form_fields"], capturado_em
@@ -1,27 +1,63 @@
 import os
 import json
-from google import genai
-from google.genai import types
-from google.genai.errors import APIError
+import math
+import asyncio
+import time
+import logging
+import functools
+import threading
+import contextlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Union, TYPE_CHECKING
 from pydantic import BaseModel  # Mantenha Pydantic para o Main.py usar
 
 # Importa as funções de serviço que o Gemini pode "chamar"
-from .pipefy_service import registrar_lead, atualizar_card_com_reuniao
+from .pipefy_service import (registrar_lead, atualizar_card_com_reuniao,
+                             registrar_lead_async, atualizar_card_com_reuniao_async)
 from .calendar_service import oferecer_horarios, agendar_reuniao
+from .outbox import (PIPEFY_WRITE_BEHIND, registrar_lead_outbox,
+                     atualizar_card_com_reuniao_outbox)
+from .context_window import janela_de_contexto, resumo_extrativo
+from .conversa import ConversaCompilada, compilar_mensagem
+from .tool_registry import ToolRegistry
+from .model_router import ModelRouter, GEMINI_FALLBACK_MODELS
+from .admission import controle_admissao, Rejeitado
+from .response_cache import (RESPONSE_CACHE_ENABLED, response_cache,
+                             pode_usar_cache, chave_resposta)
+from .metrics import GEMINI_SECONDS, TOOL_SECONDS, ERRORS, RESPONSE_CACHE_SECONDS_SAVED
+
+# O SDK do Gemini é pesado (centenas de ms só de import): fica fora do caminho
+# de import da API e é carregado no aquecimento do lifespan ou no primeiro uso.
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
 
 # 1. Configuração do Cliente Gemini
-try:
-    client = genai.Client()
-    MODEL_NAME = "gemini-2.5-flash"
-except Exception as e:
-    print(
-        f"Erro ao inicializar o cliente Gemini. Verifique GEMINI_API_KEY: {e}")
-    client = None
-
-# Mapeamento de Funções: O Gemini retorna a função por nome, precisamos executá-la
-# APENAS para o Gemini conhecer as ferramentas. A execução fica no main.py
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+
+client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Cria o cliente Gemini na primeira chamada (None se não configurado)."""
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                from google import genai
+                try:
+                    client = genai.Client()
+                except Exception as e:
+                    logger.error(
+                        "Erro ao inicializar o cliente Gemini. Verifique GEMINI_API_KEY: %s", e)
+    return client
+
+# Mapeamento de Funções: O Gemini retorna a função por nome, precisamos executá-la.
+# A execução acontece em executar_turno (loop de function calling no servidor).
 AVAILABLE_TOOLS = {
     "registrar_lead": registrar_lead,
     "atualizar_card_com_reuniao": atualizar_card_com_reuniao,
@@ -29,13 +65,49 @@ AVAILABLE_TOOLS = {
     "agendar_reuniao": agendar_reuniao,
 }
 
+# As ferramentas são síncronas (requests no Pipefy, dateparser). Rodam num pool
+# próprio para não bloquear o event loop nem disputar o threadpool do Starlette.
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "32"))
+_tool_executor = ThreadPoolExecutor(
+    max_workers=TOOL_MAX_WORKERS, thread_name_prefix="sdr-tool")
+
+
+def _como_async(func):
+    """Embrulha uma ferramenta síncrona numa corrotina com a mesma assinatura."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # run_in_executor não propaga contextvars (request/conversa dos logs)
+        contexto = contextvars.copy_context()
+        return await loop.run_in_executor(
+            _tool_executor, functools.partial(contexto.run, func, *args, **kwargs))
+    return wrapper
+
+
+# Versões assíncronas das ferramentas, despachadas por executar_turno.
+# As do Pipefy são nativas (cliente httpx assíncrono); as demais vão para o pool.
+ASYNC_TOOLS = {nome: _como_async(func)
+               for nome, func in AVAILABLE_TOOLS.items()}
+ASYNC_TOOLS["registrar_lead"] = registrar_lead_async
+ASYNC_TOOLS["atualizar_card_com_reuniao"] = atualizar_card_com_reuniao_async
+
+# Write-behind: as mutations vão para o outbox local e a ferramenta retorna na hora
+if PIPEFY_WRITE_BEHIND:
+    ASYNC_TOOLS["registrar_lead"] = _como_async(registrar_lead_outbox)
+    ASYNC_TOOLS["atualizar_card_com_reuniao"] = _como_async(
+        atualizar_card_com_reuniao_outbox)
+
+# Limites do loop de function calling
+TOOL_MAX_HOPS = int(os.getenv("TOOL_MAX_HOPS", "5"))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "20"))
+
 # 2. Definição do Agente e Instruções do Sistema (System Instruction)
 SDR_SYSTEM_INSTRUCTION = """
 Você é o Agente SDR-Elite-Dev-IA, um assistente de pré-vendas altamente competente e profissional.
 Seu objetivo é seguir estritamente os seguintes passos:
 1.  **Qualificar o Lead:** Obtenha o nome completo, e-mail, nome da empresa e a necessidade do cliente.
 2.  **Registrar o Lead:** Assim que tiver as 4 informações, use a ferramenta `registrar_lead`. O resultado desta ferramenta conterá um `card_id`.
-3.  **Oferecer Horários:** Imediatamente após o registro bem-sucedido, use a ferramenta `oferecer_horarios` para mostrar as opções de reunião ao cliente.
+3.  **Oferecer Horários:** Imediatamente após o registro bem-sucedido, use a ferramenta `oferecer_horarios`, passando o `card_id`, para mostrar as opções de reunião ao cliente.
 4.  **Agendar a Reunião:** Quando o cliente escolher um horário, use a ferramenta `agendar_reuniao`. Você **DEVE** usar o `card_id` obtido no passo 2 como argumento para esta função. Não peça as informações do cliente novamente.
 
 **Regras estritas:**
@@ -44,69 +116,380 @@ Seu objetivo é seguir estritamente os seguintes passos:
 - Se o próximo passo for uma chamada de ferramenta, **NUNCA** gere texto antes dela.
 """
 
+# Declarações das ferramentas e configs montadas uma vez (e, se ligado, o
+# cached content do Gemini com a instrução de sistema + ferramentas)
+tool_registry = ToolRegistry(AVAILABLE_TOOLS, SDR_SYSTEM_INSTRUCTION, MODEL_NAME)
+
+# Modelo principal + reservas (GEMINI_FALLBACK_MODELS); fallback e hedge no roteador
+model_router = ModelRouter([MODEL_NAME] + GEMINI_FALLBACK_MODELS)
+
+# Resumo das mensagens antigas: "extrativo" (sem custo) ou "modelo" (Gemini)
+CONTEXT_SUMMARY_MODE = os.getenv("CONTEXT_SUMMARY_MODE", "extrativo")
+
+RESUMO_INSTRUCTION = (
+    "Resuma a conversa de pré-vendas abaixo em no máximo 5 frases curtas, "
+    "mantendo decisões, dados do lead e horários mencionados."
+)
+
+
+async def _resumir_com_modelo(anterior: str, mensagens: List[Dict[str, Any]]) -> str:
+    """Resumo incremental via Gemini; cai no extrativo se a chamada falhar."""
+    from google.genai import types
+
+    texto = await resumo_extrativo("", mensagens)
+    inicio = time.perf_counter()
+    try:
+        response = await get_client().aio.models.generate_content(
+            model=MODEL_NAME,
+            contents=f"Resumo anterior:\n{anterior}\n\nNovas mensagens:\n{texto}",
+            config=types.GenerateContentConfig(
+                system_instruction=RESUMO_INSTRUCTION),
+        )
+        GEMINI_SECONDS.labels("resumo").observe(time.perf_counter() - inicio)
+        if response.text:
+            return response.text.strip()
+    except Exception as e:
+        ERRORS.labels("gemini", type(e).__name__).inc()
+        logger.warning("Falha ao resumir histórico com o modelo: %s", e)
+    return await resumo_extrativo(anterior, mensagens)
+
+
 # 3. Função Principal de Conversação (AGORA SEM O LOOP INTERNO)
 # Recebe o histórico COMPLETO (incluindo o prompt do usuário)
 
 
-def run_gemini_agent(history: List[Dict[str, Any]]) -> types.GenerateContentResponse:
+async def _montar_requisicao(conversa: ConversaCompilada, permitir_ferramentas: bool, cliente):
     """
-    Gerencia a interação com o modelo Gemini usando o histórico fornecido.
-    Retorna a resposta bruta do Gemini (que pode conter function_calls ou texto).
+    Contents + config do Gemini. As mensagens da janela literal já estão
+    compiladas na conversa; só o bloco de resumo (quando há) é convertido aqui.
     """
-    if client is None:
+    # Janela de contexto limitada: turnos recentes + resumo + fatos fixados
+    resumir = _resumir_com_modelo if CONTEXT_SUMMARY_MODE == "modelo" else resumo_extrativo
+    contexto, inicio = await janela_de_contexto(conversa.mensagens, resumir, conversa.janela)
+
+    gemini_contents = [compilada.content for compilada in map(compilar_mensagem, contexto)
+                       if compilada.content is not None]
+    gemini_contents.extend(conversa.contents(inicio))
+    return gemini_contents, tool_registry.config_para(cliente, permitir_ferramentas)
+
+
+def _como_conversa(history: Union[List[Dict[str, Any]], ConversaCompilada]) -> ConversaCompilada:
+    if isinstance(history, ConversaCompilada):
+        return history
+    return ConversaCompilada(history)
+
+
+async def _chamar_modelo(metodo, modelo: str, principal: bool, *, gemini_contents,
+                         config, permitir_ferramentas: bool):
+    """
+    Uma chamada a um modelo (generate_content ou generate_content_stream).
+    O cached content foi criado para o modelo principal: os demais vão com a
+    config completa.
+    """
+    from google.genai.errors import APIError
+
+    if not principal:
+        config = tool_registry.config(permitir_ferramentas)
+    try:
+        return await metodo(model=modelo, contents=gemini_contents, config=config)
+    except APIError as e:
+        if not config.cached_content:
+            raise
+        # Cached content expirado/apagado do lado do Gemini: refaz sem ele
+        logger.warning("Cached content %s recusado: %s", config.cached_content, e)
+        tool_registry.invalidar_cache()
+        return await metodo(model=modelo, contents=gemini_contents,
+                            config=tool_registry.config(permitir_ferramentas))
+
+
+def _retry_delay(e) -> str:
+    """Retry-After a partir do RetryInfo do erro 429 do Gemini (padrão: 10s)."""
+    detalhes = (e.details or {}).get("error", {}).get("details") or []
+    for detalhe in detalhes:
+        atraso = str(detalhe.get("retryDelay") or "")
+        if atraso.endswith("s"):
+            try:
+                return str(max(1, math.ceil(float(atraso[:-1]))))
+            except ValueError:
+                pass
+    return "10"
+
+
+def _erro_do_modelo(e: Exception) -> HTTPException:
+    """Converte a falha final do roteador (todos os modelos) em HTTPException."""
+    from google.genai.errors import APIError
+
+    if isinstance(e, Rejeitado):
+        return HTTPException(status_code=429, detail=str(e),
+                             headers={"Retry-After": e.retry_after_header})
+    if isinstance(e, APIError) and e.code == 429:
+        # Cota do Gemini esgotada: repassa como 429 para o cliente esperar
+        ERRORS.labels("gemini", "quota").inc()
+        logger.warning("Cota do Gemini esgotada: %s", e)
+        return HTTPException(status_code=429, detail="Cota do modelo esgotada.",
+                             headers={"Retry-After": _retry_delay(e)})
+    if isinstance(e, asyncio.TimeoutError):
+        ERRORS.labels("gemini", "timeout").inc()
+        logger.error("Tempo limite excedido em todos os modelos.")
+        return HTTPException(status_code=504, detail="Tempo limite excedido ao consultar o modelo.")
+    if isinstance(e, APIError):
+        ERRORS.labels("gemini", "api").inc()
+        error_message = f"Erro na API Gemini: {e}. Verifique sua chave API."
+        logger.error(error_message)
+        return HTTPException(status_code=500, detail=error_message)
+    ERRORS.labels("gemini", type(e).__name__).inc()
+    logger.exception("Erro geral em run_gemini_agent: %s", e)
+    return HTTPException(status_code=500, detail=str(e))
+
+
+def _cliente_configurado():
+    cliente = get_client()
+    if cliente is None:
         raise Exception("Erro de configuração da API Gemini.")
+    return cliente
 
-    # Bloco de Reconstrução CORRIGIDO E SIMPLIFICADO para usar o formato do main.py
-    gemini_contents = []
-
-    for item in history:
-        gemini_parts = []
-        role = item['role']
-
-        for p in item.get('parts', []):
-            if p.get('text'):
-                gemini_parts.append(types.Part(text=p['text']))
-
-            elif p.get('functionCall'):
-                call_data = p['functionCall']
-                gemini_parts.append(types.Part.from_function_call(
-                    types.FunctionCall(
-                        name=call_data['name'],
-                        args=call_data['args']
-                    )
-                ))
-
-            elif p.get('functionResponse'):
-                response_data = p['functionResponse']
-                # O Main.py garante que response_data['response'] é um dict
-                response_dict = response_data['response']
-
-                gemini_parts.append(types.Part.from_function_response(
-                    name=response_data['name'],
-                    response=response_dict
-                ))
-
-        if gemini_parts:
-            # Atenção: O Python client espera 'user' ou 'model' (que inclui 'tool')
-            # Mapeamos 'tool' para 'model' ou ajustamos o role
-            if role == 'tool':
-                role = 'model'  # O SDK do Gemini lida com o role 'tool'
-
-            gemini_contents.append(types.Content(
-                role=role, parts=gemini_parts))
+
+async def run_gemini_agent(history: Union[List[Dict[str, Any]], ConversaCompilada],
+                           permitir_ferramentas: bool = True,
+                           prioritario: bool = False) -> "types.GenerateContentResponse":
+    """
+    Gerencia a interação com o modelo Gemini usando o histórico fornecido.
+    Usa o client.aio, então nenhuma thread fica presa durante a chamada ao modelo.
+    Retorna a resposta bruta do Gemini (que pode conter function_calls ou texto).
+    Com permitir_ferramentas=False o modelo é obrigado a responder em texto.
+    `prioritario` (continuação de um turno) fura a fila do controle de
+    admissão e nunca é recusado.
+    """
+    cliente = _cliente_configurado()
+    gemini_contents, config = await _montar_requisicao(
+        _como_conversa(history), permitir_ferramentas, cliente)
 
     # A última iteração é a mais importante
+    inicio = time.perf_counter()
     try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=gemini_contents,
-            config=types.GenerateContentConfig(
-                system_instruction=SDR_SYSTEM_INSTRUCTION,
-                tools=list(AVAILABLE_TOOLS.values()),
-            ),
-        )
+        async with await controle_admissao.adquirir(prioritario):
+            response, _ = await model_router.gerar(functools.partial(
+                _chamar_modelo, cliente.aio.models.generate_content,
+                gemini_contents=gemini_contents, config=config,
+                permitir_ferramentas=permitir_ferramentas))
+        GEMINI_SECONDS.labels("completo").observe(time.perf_counter() - inicio)
         return response
-    except APIError as e:
-        error_message = f"Erro na API Gemini: {e}. Verifique sua chave API."
-        print(f"[ERROR] {error_message}")
-        raise HTTPException(status_code=500, detail=error_message)
+    except Exception as e:
+        raise _erro_do_modelo(e)
+
+
+# 4. Loop de Function Calling
+
+def _chave_cache(history: List[Dict[str, Any]]):
+    """Chave do cache de respostas, ou None se o turno não pode usar o cache."""
+    if not RESPONSE_CACHE_ENABLED or not pode_usar_cache(history):
+        return None
+    # A versão do registro muda junto com as ferramentas e invalida o cache
+    return chave_resposta(MODEL_NAME, SDR_SYSTEM_INSTRUCTION,
+                          tool_registry.versao, history)
+
+
+def _resposta_em_cache(chave):
+    if chave is None:
+        return None
+    entrada = response_cache.get(chave)
+    if entrada is None:
+        return None
+    RESPONSE_CACHE_SECONDS_SAVED.inc(entrada.segundos)
+    return entrada.texto
+
+
+async def _executar_ferramenta(nome: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    """Executa uma ferramenta com timeout e devolve o payload do functionResponse."""
+    ferramenta = ASYNC_TOOLS.get(nome)
+    if ferramenta is None:
+        ERRORS.labels("ferramenta", "desconhecida").inc()
+        return {"error": f"Ferramenta desconhecida: {nome}"}
+    inicio = time.perf_counter()
+    try:
+        resultado = await asyncio.wait_for(ferramenta(**args), timeout=TOOL_TIMEOUT_SECONDS)
+        return {"result": resultado}
+    except asyncio.TimeoutError:
+        ERRORS.labels("ferramenta", "timeout").inc()
+        logger.error("Ferramenta %s excedeu %ss.", nome, TOOL_TIMEOUT_SECONDS)
+        return {"error": f"Tempo limite excedido ao executar {nome}."}
+    except Exception as e:
+        ERRORS.labels("ferramenta", type(e).__name__).inc()
+        logger.exception("Falha ao executar a ferramenta %s: %s", nome, e)
+        return {"error": str(e)}
+    finally:
+        TOOL_SECONDS.labels(nome).observe(time.perf_counter() - inicio)
+
+
+def _extrair_texto(response: "types.GenerateContentResponse") -> str:
+    partes = []
+    for candidate in response.candidates or []:
+        for part in (candidate.content.parts if candidate.content else None) or []:
+            if part.text and not part.thought:
+                partes.append(part.text)
+        break
+    return "".join(partes)
+
+
+def _mensagem_ferramentas(chamadas, resultados) -> Dict[str, Any]:
+    return {"role": "tool", "parts": [
+        {"functionResponse": {"name": c.name, "response": r}}
+        for c, r in zip(chamadas, resultados)
+    ]}
+
+
+async def executar_turno(history: Union[List[Dict[str, Any]], ConversaCompilada]):
+    """
+    Roda um turno completo: chama o modelo, executa as function calls que ele
+    pedir (em paralelo quando vierem juntas), devolve os resultados e repete
+    até o modelo responder em texto ou atingir TOOL_MAX_HOPS.
+
+    Retorna (texto_final, novas_mensagens) — as mensagens do modelo e das
+    ferramentas geradas no turno, já no formato de wire do histórico. Uma
+    ConversaCompilada recebida também ganha essas mensagens (compiladas).
+    """
+    conversa = _como_conversa(history)
+    antes = len(conversa)
+    chave = _chave_cache(conversa.mensagens)
+    texto = _resposta_em_cache(chave)
+    if texto is not None:
+        conversa.anexar({"role": "model", "parts": [{"text": texto}]})
+        return texto, conversa.mensagens[antes:]
+
+    for salto in range(TOOL_MAX_HOPS + 1):
+        ultimo_salto = salto == TOOL_MAX_HOPS
+        inicio = time.perf_counter()
+        response = await run_gemini_agent(
+            conversa, permitir_ferramentas=not ultimo_salto, prioritario=salto > 0)
+        chamadas = response.function_calls or []
+
+        if not chamadas or ultimo_salto:
+            texto = _extrair_texto(response)
+            # Só vai para o cache a resposta direta em texto (sem ferramentas no turno)
+            if texto and chave is not None and salto == 0:
+                response_cache.set(chave, texto, time.perf_counter() - inicio)
+            texto = texto or "[ERRO] Resposta vazia do Gemini."
+            conversa.anexar({"role": "model", "parts": [{"text": texto}]})
+            return texto, conversa.mensagens[antes:]
+
+        conversa.anexar({"role": "model", "parts": [
+            {"functionCall": {"name": c.name, "args": dict(c.args or {})}}
+            for c in chamadas
+        ]})
+        resultados = await asyncio.gather(*[
+            _executar_ferramenta(c.name, dict(c.args or {})) for c in chamadas
+        ])
+        conversa.anexar(_mensagem_ferramentas(chamadas, resultados))
+
+
+# 5. Streaming (SSE)
+
+
+async def _liberando_ao_fim(chunks, vaga):
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        vaga.liberar()
+
+
+async def run_gemini_agent_stream(history: Union[List[Dict[str, Any]], ConversaCompilada],
+                                  permitir_ferramentas: bool = True,
+                                  prioritario: bool = False):
+    """
+    Igual a run_gemini_agent, mas via generate_content_stream: devolve um
+    iterador assíncrono de chunks (GenerateContentResponse parciais).
+    Fallback e hedge valem até o primeiro chunk; a vaga do controle de
+    admissão fica ocupada até o stream terminar (ou ser fechado).
+    """
+    cliente = _cliente_configurado()
+    gemini_contents, config = await _montar_requisicao(
+        _como_conversa(history), permitir_ferramentas, cliente)
+    try:
+        vaga = await controle_admissao.adquirir(prioritario)
+        try:
+            chunks, _ = await model_router.gerar_stream(functools.partial(
+                _chamar_modelo, cliente.aio.models.generate_content_stream,
+                gemini_contents=gemini_contents, config=config,
+                permitir_ferramentas=permitir_ferramentas))
+        except BaseException:
+            vaga.liberar()
+            raise
+        return _liberando_ao_fim(chunks, vaga)
+    except Exception as e:
+        raise _erro_do_modelo(e)
+
+
+async def _executar_ferramenta_com_eventos(chamada, fila: asyncio.Queue) -> Dict[str, Any]:
+    args = dict(chamada.args or {})
+    await fila.put(("ferramenta", {"nome": chamada.name, "status": "executando"}))
+    resultado = await _executar_ferramenta(chamada.name, args)
+    await fila.put(("ferramenta", {
+        "nome": chamada.name,
+        "status": "erro" if "error" in resultado else "concluida",
+        "resposta": resultado,
+    }))
+    return resultado
+
+
+async def executar_turno_stream(history: Union[List[Dict[str, Any]], ConversaCompilada]):
+    """
+    Versão em streaming de executar_turno. Gera tuplas (evento, dados):
+
+    - ("token", {"texto"}): trecho de texto do modelo, assim que chega;
+    - ("ferramenta", {"nome", "status", ...}): progresso das function calls
+      ("executando" ao iniciar, "concluida"/"erro" com a resposta ao terminar);
+    - ("fim", {"response", "mensagens"}): texto final e as novas mensagens do
+      turno no formato de wire do histórico (as mesmas de executar_turno).
+    """
+    conversa = _como_conversa(history)
+    antes = len(conversa)
+    chave = _chave_cache(conversa.mensagens)
+    texto = _resposta_em_cache(chave)
+    if texto is not None:
+        conversa.anexar({"role": "model", "parts": [{"text": texto}]})
+        yield "token", {"texto": texto}
+        yield "fim", {"response": texto, "mensagens": conversa.mensagens[antes:]}
+        return
+
+    for salto in range(TOOL_MAX_HOPS + 1):
+        ultimo_salto = salto == TOOL_MAX_HOPS
+        inicio = time.perf_counter()
+        chunks = await run_gemini_agent_stream(
+            conversa, permitir_ferramentas=not ultimo_salto, prioritario=salto > 0)
+
+        textos, chamadas = [], []
+        # aclosing: se o cliente SSE desconectar, o stream é fechado e libera a vaga
+        async with contextlib.aclosing(chunks):
+            async for chunk in chunks:
+                texto = _extrair_texto(chunk)
+                if texto:
+                    textos.append(texto)
+                    yield "token", {"texto": texto}
+                chamadas.extend(chunk.function_calls or [])
+        # Inclui o tempo em que o cliente SSE consome os tokens
+        GEMINI_SECONDS.labels("stream").observe(time.perf_counter() - inicio)
+
+        texto = "".join(textos)
+        if not chamadas or ultimo_salto:
+            if texto and chave is not None and salto == 0:
+                response_cache.set(chave, texto, time.perf_counter() - inicio)
+            texto = texto or "[ERRO] Resposta vazia do Gemini."
+            conversa.anexar({"role": "model", "parts": [{"text": texto}]})
+            yield "fim", {"response": texto, "mensagens": conversa.mensagens[antes:]}
+            return
+
+        partes = [{"text": texto}] if texto else []
+        partes.extend({"functionCall": {"name": c.name, "args": dict(c.args or {})}}
+                      for c in chamadas)
+        conversa.anexar({"role": "model", "parts": partes})
+
+        # As ferramentas rodam em paralelo; o progresso sai por uma fila.
+        # Cada uma publica exatamente dois eventos (início e fim).
+        fila: asyncio.Queue = asyncio.Queue()
+        execucao = asyncio.gather(*[
+            _executar_ferramenta_com_eventos(c, fila) for c in chamadas
+        ])
+        for _ in range(2 * len(chamadas)):
+            yield await fila.get()
+        conversa.anexar(_mensagem_ferramentas(chamadas, await execucao))
@@ -0,0 +1,184 @@
+import os
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.utils.json_utils import dumps
+
+# Idempotency-Key no /chat: repetições do cliente (timeout, rede móvel,
+# webhook) recebem o resultado do turno original em vez de rodar outro.
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+IDEMPOTENCY_MAX_ITEMS = int(os.getenv("IDEMPOTENCY_MAX_ITEMS", "10000"))
+IDEMPOTENCY_MAX_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BYTES", str(32 * 1024 * 1024)))
+
+_OVERHEAD_ENTRADA = 256
+
+
+class ChaveReutilizada(ValueError):
+    """A mesma Idempotency-Key chegou com outro corpo de requisição."""
+
+
+class _Abandonada(Exception):
+    """A requisição original foi cancelada antes de terminar."""
+
+
+def impressao(corpo: Dict[str, Any]) -> str:
+    """Hash canônico do corpo, para detectar a chave reaproveitada em outra requisição."""
+    return hashlib.sha256(dumps(corpo, ordenado=True)).hexdigest()
+
+
+class _Entrada:
+    __slots__ = ("impressao", "futuro", "resultado", "tamanho", "expira_em")
+
+    def __init__(self, impressao: str, futuro: asyncio.Future):
+        self.impressao = impressao
+        # Resolvido quando a original termina; quem repetir espera por ele
+        self.futuro = futuro
+        self.resultado: Optional[Dict[str, Any]] = None
+        self.tamanho = _OVERHEAD_ENTRADA
+        self.expira_em = float("inf")
+
+
+class Reserva:
+    """
+    Vez de executar uma chave. `concluir` guarda o resultado para as
+    repetições; sair do bloco sem concluir libera a chave (erros não ficam
+    guardados: a próxima repetição roda de novo).
+    """
+    __slots__ = ("_store", "_chave", "_entrada")
+
+    def __init__(self, store: "IdempotencyStore", chave: str, entrada: _Entrada):
+        self._store = store
+        self._chave = chave
+        self._entrada = entrada
+
+    def concluir(self, resultado: Dict[str, Any]) -> None:
+        self._store._concluir(self._chave, self._entrada, resultado)
+
+    async def __aenter__(self) -> "Reserva":
+        return self
+
+    async def __aexit__(self, tipo, erro, tb) -> None:
+        if self._entrada.futuro.done():
+            return
+        if erro is None or isinstance(erro, (asyncio.CancelledError, GeneratorExit)):
+            erro = _Abandonada()
+        self._store._liberar(self._chave, self._entrada, erro)
+
+
+class IdempotencyStore:
+    """
+    Resultados por Idempotency-Key, em memória, com LRU, TTL (contado da
+    conclusão) e teto de memória. Enquanto a original roda, as repetições
+    esperam por ela no mesmo processo; se ela for cancelada, uma das
+    repetições assume.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL_SECONDS,
+                 max_itens: int = IDEMPOTENCY_MAX_ITEMS,
+                 max_bytes: int = IDEMPOTENCY_MAX_BYTES):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self._itens: "OrderedDict[str, _Entrada]" = OrderedDict()
+        self._bytes = 0
+        self.repeticoes = 0
+        self.esperas = 0
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+    @property
+    def bytes_em_uso(self) -> int:
+        return self._bytes
+
+    def consultar(self, chave: str, impressao: str) -> Optional[Dict[str, Any]]:
+        """Resultado já concluído da chave (sem esperar nem reservar)."""
+        entrada = self._itens.get(chave)
+        if entrada is None or entrada.resultado is None or entrada.expira_em <= time.monotonic():
+            return None
+        if entrada.impressao != impressao:
+            raise ChaveReutilizada(
+                "Idempotency-Key já usada com outro corpo de requisição.")
+        self._itens.move_to_end(chave)
+        self.repeticoes += 1
+        return entrada.resultado
+
+    def em_andamento(self, chave: str, impressao: str) -> bool:
+        """A original desta chave (mesmo corpo) ainda está rodando."""
+        entrada = self._itens.get(chave)
+        return (entrada is not None and entrada.resultado is None
+                and not entrada.futuro.done() and entrada.impressao == impressao)
+
+    async def obter_ou_reservar(self, chave: str, impressao: str
+                                ) -> Tuple[Optional[Dict[str, Any]], Optional[Reserva]]:
+        """
+        (resultado guardado, None) para uma repetição, ou (None, Reserva) para
+        quem deve executar. Espera a original em andamento; levanta o mesmo
+        erro dela, ou ChaveReutilizada se o corpo for outro.
+        """
+        while True:
+            entrada = self._itens.get(chave)
+            if entrada is not None and entrada.expira_em <= time.monotonic():
+                self._remover(chave)
+                entrada = None
+            if entrada is None:
+                entrada = _Entrada(impressao, asyncio.get_running_loop().create_future())
+                self._itens[chave] = entrada
+                self._bytes += entrada.tamanho
+                self._despejar()
+                return None, Reserva(self, chave, entrada)
+
+            if entrada.impressao != impressao:
+                raise ChaveReutilizada(
+                    "Idempotency-Key já usada com outro corpo de requisição.")
+            self._itens.move_to_end(chave)
+            if entrada.resultado is not None:
+                self.repeticoes += 1
+                return entrada.resultado, None
+
+            self.esperas += 1
+            try:
+                resultado = await asyncio.shield(entrada.futuro)
+            except _Abandonada:
+                continue
+            self.repeticoes += 1
+            return resultado, None
+
+    def _concluir(self, chave: str, entrada: _Entrada, resultado: Dict[str, Any]) -> None:
+        entrada.resultado = resultado
+        entrada.expira_em = time.monotonic() + self.ttl
+        if not entrada.futuro.done():
+            entrada.futuro.set_result(resultado)
+        if self._itens.get(chave) is not entrada:
+            return  # despejada enquanto rodava: só quem já esperava recebe
+        tamanho = len(dumps(resultado)) + _OVERHEAD_ENTRADA
+        self._bytes += tamanho - entrada.tamanho
+        entrada.tamanho = tamanho
+        if tamanho > self.max_bytes:
+            self._remover(chave)
+        self._despejar()
+
+    def _liberar(self, chave: str, entrada: _Entrada, erro: BaseException) -> None:
+        entrada.futuro.set_exception(erro)
+        # Ninguém esperando: evita o aviso de exceção nunca lida
+        entrada.futuro.exception()
+        if self._itens.get(chave) is entrada:
+            self._remover(chave)
+
+    def _remover(self, chave: str) -> None:
+        entrada = self._itens.pop(chave, None)
+        if entrada is not None:
+            self._bytes -= entrada.tamanho
+
+    def _despejar(self) -> None:
+        while self._itens and (len(self._itens) > self.max_itens
+                               or self._bytes > self.max_bytes):
+            _, entrada = self._itens.popitem(last=False)
+            self._bytes -= entrada.tamanho
+
+
+# Instância única usada pela API
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+import unicodedata
+from typing import Iterable, Optional, Tuple
+
+# Índice local email/empresa -> card_id: evita card duplicado quando o lead
+# volta ou o modelo repete a chamada de registrar_lead
+LEAD_INDEX_ENABLED = os.getenv("LEAD_INDEX_ENABLED", "1") == "1"
+LEAD_INDEX_PATH = os.getenv("LEAD_INDEX_PATH", "data/lead_index.sqlite3")
+# Sincronização incremental com o Pipefy (cards alterados desde a última) e,
+# de tempos em tempos, uma completa para descartar cards apagados
+LEAD_INDEX_SYNC_SECONDS = float(os.getenv("LEAD_INDEX_SYNC_SECONDS", "300"))
+LEAD_INDEX_FULL_SYNC_SECONDS = float(os.getenv("LEAD_INDEX_FULL_SYNC_SECONDS", "86400"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leads (
+    card_id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,              -- normalizado
+    empresa TEXT NOT NULL,            -- normalizada
+    atualizado_em TEXT,               -- updated_at do Pipefy (NULL = gravado localmente)
+    visto_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leads_chave ON leads (email, empresa);
+CREATE TABLE IF NOT EXISTS meta (
+    chave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
+
+_ESPACOS_RE = re.compile(r"[\W_]+")
+
+
+def normalizar_email(email: Optional[str]) -> str:
+    return (email or "").strip().lower()
+
+
+def normalizar_empresa(empresa: Optional[str]) -> str:
+    """'  Açaí & Cia. ' -> 'acai cia' (sem acento, caixa ou pontuação)."""
+    sem_acento = unicodedata.normalize("NFKD", empresa or "")
+    sem_acento = "".join(c for c in sem_acento if not unicodedata.combining(c))
+    return _ESPACOS_RE.sub(" ", sem_acento.casefold()).strip()
+
+
+def chave_lead(email: Optional[str], empresa: Optional[str]) -> Tuple[str, str]:
+    return normalizar_email(email), normalizar_empresa(empresa)
+
+
+class LeadIndex:
+    """
+    Leads já registrados no Pipefy, em SQLite (WAL) com índice na chave
+    normalizada (email, empresa).
+
+    A consulta é uma busca no índice B-tree (alguns µs mesmo com centenas de
+    milhares de leads) e pode rodar direto no event loop. Cada thread tem a
+    própria conexão, então vários processos podem compartilhar o arquivo.
+    """
+
+    def __init__(self, caminho: str = LEAD_INDEX_PATH):
+        self.caminho = caminho
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._local = threading.local()
+        self.acertos = 0
+        self.faltas = 0
+        with self._conexao() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=30,
+                                   isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # 🔹 Consultas
+
+    def buscar(self, email: Optional[str], empresa: Optional[str]) -> Optional[str]:
+        """card_id já registrado para este lead, ou None."""
+        email, empresa = chave_lead(email, empresa)
+        if not email:
+            return None
+        linha = self._conexao().execute(
+            "SELECT card_id FROM leads WHERE email = ? AND empresa = ? ORDER BY rowid LIMIT 1",
+            (email, empresa)).fetchone()
+        if linha is None:
+            self.faltas += 1
+            return None
+        self.acertos += 1
+        return linha[0]
+
+    def __len__(self) -> int:
+        return self._conexao().execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+
+    # 🔹 Escritas locais (após criar o card)
+
+    def registrar(self, email: Optional[str], empresa: Optional[str], card_id: str) -> None:
+        email, empresa = chave_lead(email, empresa)
+        if not email or not card_id:
+            return
+        self._conexao().execute(
+            """INSERT INTO leads (card_id, email, empresa, visto_em) VALUES (?, ?, ?, ?)
+               ON CONFLICT (card_id) DO UPDATE SET email = excluded.email,
+                   empresa = excluded.empresa, visto_em = excluded.visto_em""",
+            (card_id, email, empresa, time.time()))
+
+    def trocar_card(self, anterior: str, card_id: str) -> None:
+        """Troca um id provisório (outbox) pelo card_id real."""
+        self._conexao().execute(
+            "UPDATE OR REPLACE leads SET card_id = ? WHERE card_id = ?", (card_id, anterior))
+
+    def esquecer(self, card_id: str) -> None:
+        self._conexao().execute("DELETE FROM leads WHERE card_id = ?", (card_id,))
+
+    # 🔹 Sincronização com o Pipefy
+
+    def _meta(self, chave: str) -> Optional[str]:
+        linha = self._conexao().execute(
+            "SELECT valor FROM meta WHERE chave = ?", (chave,)).fetchone()
+        return linha[0] if linha else None
+
+    def _gravar_meta(self, chave: str, valor: Optional[str]) -> None:
+        self._conexao().execute(
+            "INSERT OR REPLACE INTO meta (chave, valor) VALUES (?, ?)", (chave, valor))
+
+    @property
+    def cursor_sincronizacao(self) -> Optional[str]:
+        """Maior updated_at já importado (None = nunca sincronizado)."""
+        return self._meta("cursor")
+
+    def precisa_sincronizacao_completa(self) -> bool:
+        ultima = self._meta("ultima_completa")
+        return ultima is None or time.time() - float(ultima) >= LEAD_INDEX_FULL_SYNC_SECONDS
+
+    def aplicar_pagina(self, cards: Iterable[Tuple[str, str, str, str]]) -> int:
+        """
+        Grava uma página da sincronização: (card_id, email, empresa, updated_at).
+        Não mexe no cursor (ver avancar_cursor). Devolve quantos cards vieram.
+        """
+        conn = self._conexao()
+        agora = time.time()
+        n = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for card_id, email, empresa, atualizado_em in cards:
+                n += 1
+                email, empresa = chave_lead(email, empresa)
+                if not email:
+                    # Card sem email não serve para deduplicar
+                    conn.execute("DELETE FROM leads WHERE card_id = ?", (card_id,))
+                    continue
+                conn.execute(
+                    """INSERT INTO leads (card_id, email, empresa, atualizado_em, visto_em)
+                       VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT (card_id) DO UPDATE SET email = excluded.email,
+                           empresa = excluded.empresa, atualizado_em = excluded.atualizado_em,
+                           visto_em = excluded.visto_em""",
+                    (card_id, email, empresa, atualizado_em, agora))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return n
+
+    def avancar_cursor(self, atualizado_em: Optional[str]) -> None:
+        """
+        Move o cursor para o maior updated_at lido. Só depois da última página:
+        as páginas do allCards não vêm em ordem de updated_at, e um cursor
+        gravado no meio faria uma sincronização interrompida pular os cards
+        das páginas que faltaram.
+        """
+        cursor = self.cursor_sincronizacao
+        if atualizado_em and (cursor is None or atualizado_em > cursor):
+            self._gravar_meta("cursor", atualizado_em)
+
+    def concluir_sincronizacao_completa(self, inicio: float) -> int:
+        """
+        Após ler todos os cards do pipe: apaga os que vieram de uma
+        sincronização anterior e não apareceram nesta (cards apagados no
+        Pipefy). Gravações locais ainda não vistas (ids provisórios do outbox,
+        cards recém-criados) ficam. Devolve quantos saíram.
+        """
+        conn = self._conexao()
+        cursor = conn.execute(
+            "DELETE FROM leads WHERE visto_em < ? AND atualizado_em IS NOT NULL", (inicio,))
+        self._gravar_meta("ultima_completa", str(time.time()))
+        return cursor.rowcount
+
+
+_lead_index: Optional[LeadIndex] = None
+_lead_index_lock = threading.Lock()
+
+
+def get_lead_index() -> LeadIndex:
+    global _lead_index
+    if _lead_index is None:
+        with _lead_index_lock:
+            if _lead_index is None:
+                _lead_index = LeadIndex()
+    return _lead_index
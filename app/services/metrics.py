@@ -0,0 +1,124 @@
+from typing import Iterator
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Métricas da API (expostas em /metrics). Os contadores de cache e os gauges
+# de estado são lidos só na hora da coleta, sem custo no caminho da conversa.
+
+# Faixas pensadas para chamadas de rede (ms a dezenas de segundos)
+_BUCKETS_REDE = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+# normalizar_data: do acerto de cache (µs) ao fallback do dateparser (ms)
+_BUCKETS_LOCAL = (.00001, .00005, .0001, .0005, .001, .005, .01, .05, .1)
+
+GEMINI_SECONDS = Histogram(
+    "sdr_gemini_request_seconds", "Duração das chamadas ao Gemini.",
+    ["modo"], buckets=_BUCKETS_REDE)
+GEMINI_MODEL_SECONDS = Histogram(
+    "sdr_gemini_model_seconds", "Duração das chamadas bem-sucedidas por modelo (roteador).",
+    ["modelo"], buckets=_BUCKETS_REDE)
+TOOL_SECONDS = Histogram(
+    "sdr_tool_seconds", "Duração da execução de cada ferramenta do agente.",
+    ["ferramenta"], buckets=_BUCKETS_REDE)
+PIPEFY_SECONDS = Histogram(
+    "sdr_pipefy_request_seconds", "Duração de cada round trip GraphQL ao Pipefy.",
+    ["operacao"], buckets=_BUCKETS_REDE)
+DATE_SECONDS = Histogram(
+    "sdr_normalizar_data_seconds", "Duração de normalizar_data.",
+    buckets=_BUCKETS_LOCAL)
+CHAT_SECONDS = Histogram(
+    "sdr_chat_seconds", "Duração total de um turno de conversa.",
+    ["rota"], buckets=_BUCKETS_REDE)
+
+ERRORS = Counter(
+    "sdr_errors_total", "Erros por origem.", ["origem", "tipo"])
+PIPEFY_RETRIES = Counter(
+    "sdr_pipefy_retries_total", "Retentativas de chamadas ao Pipefy.", ["motivo"])
+GEMINI_ROUTER = Counter(
+    "sdr_gemini_router_total",
+    "Eventos do roteador de modelos (hedge, vencedor, fallback, erro, timeout).",
+    ["evento", "modelo"])
+ADMISSAO_REJEITADAS = Counter(
+    "sdr_admissao_rejeitadas_total",
+    "Requisições recusadas com 429 pelo controle de admissão.", ["motivo"])
+RESPONSE_CACHE_SECONDS_SAVED = Counter(
+    "sdr_response_cache_seconds_saved",
+    "Tempo de modelo economizado por acertos no cache de respostas.")
+
+CONVERSAS_EM_ANDAMENTO = Gauge(
+    "sdr_conversas_em_andamento", "Turnos de conversa sendo processados agora.")
+
+
+class _ColetorEstado:
+    """Lê caches, sessões e outbox no momento do scrape."""
+
+    def describe(self) -> list:
+        # Sem descrição prévia o registro chamaria collect() já no import
+        return []
+
+    def collect(self) -> Iterator:
+        # Imports tardios: este módulo é importado pelos próprios serviços
+        from app.utils.date_utils import _normalizar_em_cache
+        from app.services.field_cache import field_cache
+        from app.services.context_window import _cache_resumos
+        from app.services.session_store import session_store
+        from app.services import outbox
+        from app.services.response_cache import response_cache
+        from app.services.admission import controle_admissao
+        from app.services import lead_index
+        from app.services.idempotency import idempotency_store
+
+        acertos = CounterMetricFamily(
+            "sdr_cache_hits", "Acertos de cache.", labels=["cache"])
+        faltas = CounterMetricFamily(
+            "sdr_cache_misses", "Faltas de cache.", labels=["cache"])
+        info = _normalizar_em_cache.cache_info()
+        for nome, hits, misses in (
+                ("datas", info.hits, info.misses),
+                ("field_ids", field_cache.acertos, field_cache.faltas),
+                ("resumos_contexto", _cache_resumos.acertos, _cache_resumos.faltas),
+                ("respostas", response_cache.acertos, response_cache.faltas)):
+            acertos.add_metric([nome], hits)
+            faltas.add_metric([nome], misses)
+        if lead_index._lead_index is not None:
+            acertos.add_metric(["leads"], lead_index._lead_index.acertos)
+            faltas.add_metric(["leads"], lead_index._lead_index.faltas)
+        yield acertos
+        yield faltas
+
+        idempotencia = CounterMetricFamily(
+            "sdr_idempotencia", "Repetições com Idempotency-Key atendidas sem rodar o turno.",
+            labels=["resultado"])
+        idempotencia.add_metric(["repetida"], idempotency_store.repeticoes)
+        idempotencia.add_metric(["esperou_original"], idempotency_store.esperas)
+        yield idempotencia
+
+        sessoes = GaugeMetricFamily("sdr_sessoes_ativas", "Sessões no session store.")
+        sessoes.add_metric([], len(session_store))
+        yield sessoes
+        bytes_sessoes = GaugeMetricFamily(
+            "sdr_sessoes_bytes", "Bytes de histórico guardados no session store.")
+        bytes_sessoes.add_metric([], session_store.bytes_em_uso)
+        yield bytes_sessoes
+        bytes_respostas = GaugeMetricFamily(
+            "sdr_response_cache_bytes", "Bytes guardados no cache de respostas.")
+        bytes_respostas.add_metric([], response_cache.bytes_em_uso)
+        yield bytes_respostas
+
+        em_uso = GaugeMetricFamily(
+            "sdr_admissao_em_uso", "Chamadas ao modelo em andamento (controle de admissão).")
+        em_uso.add_metric([], controle_admissao.em_uso)
+        yield em_uso
+        na_fila = GaugeMetricFamily(
+            "sdr_admissao_fila", "Chamadas ao modelo esperando vaga.")
+        na_fila.add_metric([], controle_admissao.na_fila)
+        yield na_fila
+
+        if outbox._outbox is not None:
+            pendentes = GaugeMetricFamily(
+                "sdr_outbox_pendentes", "Escritas do Pipefy aguardando no outbox.")
+            pendentes.add_metric([], outbox._outbox.pendentes())
+            yield pendentes
+
+
+REGISTRY.register(_ColetorEstado())
@@ -0,0 +1,191 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .metrics import GEMINI_MODEL_SECONDS, GEMINI_ROUTER
+
+# Modelos de reserva, em ordem, para quando o principal (GEMINI_MODEL) falha
+# com APIError ou estoura o tempo limite
+GEMINI_FALLBACK_MODELS = [m.strip() for m in os.getenv("GEMINI_FALLBACK_MODELS", "").split(",")
+                          if m.strip()]
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+
+# Hedging: se a chamada passar do percentil de latência do modelo, dispara uma
+# cópia no próximo modelo (ou no mesmo, como réplica) e fica com a primeira
+# resposta. Desligado por padrão: as cópias também são cobradas.
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "0") == "1"
+GEMINI_HEDGE_PERCENTIL = float(os.getenv("GEMINI_HEDGE_PERCENTIL", "0.95"))
+# Atraso usado enquanto não há amostras suficientes para o percentil
+GEMINI_HEDGE_DELAY_SECONDS = float(os.getenv("GEMINI_HEDGE_DELAY_SECONDS", "2.0"))
+GEMINI_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("GEMINI_HEDGE_MIN_DELAY_SECONDS", "0.2"))
+GEMINI_HEDGE_JANELA = int(os.getenv("GEMINI_HEDGE_JANELA", "200"))
+GEMINI_HEDGE_MIN_AMOSTRAS = int(os.getenv("GEMINI_HEDGE_MIN_AMOSTRAS", "20"))
+
+# O percentil é recalculado a cada tantas amostras novas, não a cada chamada
+_RECALCULAR_A_CADA = 10
+
+logger = logging.getLogger(__name__)
+
+
+class _Latencias:
+    """Janela das latências recentes de um modelo."""
+
+    def __init__(self, janela: int):
+        self._amostras: deque = deque(maxlen=janela)
+        self._novas = 0
+        self._percentil: Optional[Tuple[float, float]] = None
+
+    def __len__(self) -> int:
+        return len(self._amostras)
+
+    def registrar(self, segundos: float) -> None:
+        self._amostras.append(segundos)
+        self._novas += 1
+
+    def percentil(self, q: float) -> Optional[float]:
+        if len(self._amostras) < GEMINI_HEDGE_MIN_AMOSTRAS:
+            return None
+        if self._percentil is None or self._percentil[0] != q or self._novas >= _RECALCULAR_A_CADA:
+            ordenadas = sorted(self._amostras)
+            valor = ordenadas[min(len(ordenadas) - 1, int(q * len(ordenadas)))]
+            self._percentil = (q, valor)
+            self._novas = 0
+        return self._percentil[1]
+
+
+async def _com_primeiro_chunk(chunks):
+    """Espera o primeiro chunk de um stream (fecha o stream se for cancelado)."""
+    try:
+        return await chunks.__anext__(), chunks
+    except StopAsyncIteration:
+        return None, chunks
+    except BaseException:
+        fechar = getattr(chunks, "aclose", None)
+        if fechar is not None:
+            await fechar()
+        raise
+
+
+async def _encadear(primeiro, chunks):
+    if primeiro is not None:
+        yield primeiro
+    async for chunk in chunks:
+        yield chunk
+
+
+# Executa a chamada num modelo: (modelo, eh_o_principal) -> resultado
+Execucao = Callable[[str, bool], Awaitable[Any]]
+
+
+class ModelRouter:
+    """
+    Distribui uma chamada ao Gemini entre o modelo principal e os de reserva:
+    fallback em APIError/tempo limite e, com hedge ligado, uma cópia
+    disparada quando a chamada passa do percentil de latência observado.
+    """
+
+    def __init__(self, modelos: List[str], hedge: bool = GEMINI_HEDGE,
+                 timeout: float = GEMINI_TIMEOUT_SECONDS,
+                 percentil: float = GEMINI_HEDGE_PERCENTIL):
+        self.modelos = list(dict.fromkeys(modelos))
+        self.hedge = hedge
+        self.percentil = percentil
+        self.timeout = timeout
+        self.latencias: Dict[str, _Latencias] = {
+            m: _Latencias(GEMINI_HEDGE_JANELA) for m in self.modelos}
+
+    @property
+    def principal(self) -> str:
+        return self.modelos[0]
+
+    def _candidatos(self) -> List[str]:
+        if self.hedge and len(self.modelos) == 1:
+            # Sem modelo de reserva, a cópia vai para o próprio principal (réplica)
+            return self.modelos * 2
+        return self.modelos
+
+    def atraso_hedge(self, modelo: str) -> float:
+        """Quanto esperar por `modelo` antes de disparar a cópia."""
+        p = self.latencias[modelo].percentil(self.percentil)
+        if p is None:
+            return GEMINI_HEDGE_DELAY_SECONDS
+        return max(GEMINI_HEDGE_MIN_DELAY_SECONDS, p)
+
+    async def gerar(self, executar: Execucao) -> Tuple[Any, str]:
+        """Roda `executar` pelo roteador. Devolve (resultado, modelo que respondeu)."""
+        from google.genai.errors import APIError
+
+        candidatos = self._candidatos()
+        pendentes: Dict[asyncio.Future, Tuple[str, float]] = {}
+        proximo = 0
+        ultimo_lancamento = 0.0
+        ultimo_erro: Optional[BaseException] = None
+
+        def lancar() -> str:
+            nonlocal proximo, ultimo_lancamento
+            modelo = candidatos[proximo]
+            tarefa = asyncio.ensure_future(
+                asyncio.wait_for(executar(modelo, proximo == 0), self.timeout))
+            ultimo_lancamento = time.perf_counter()
+            pendentes[tarefa] = (modelo, ultimo_lancamento)
+            proximo += 1
+            return modelo
+
+        lancar()
+        try:
+            while pendentes:
+                espera = None
+                if self.hedge and proximo < len(candidatos):
+                    modelo_atual = candidatos[proximo - 1]
+                    espera = max(0.0, ultimo_lancamento + self.atraso_hedge(modelo_atual)
+                                 - time.perf_counter())
+                feitos, _ = await asyncio.wait(
+                    pendentes, timeout=espera, return_when=asyncio.FIRST_COMPLETED)
+
+                if not feitos:
+                    GEMINI_ROUTER.labels("hedge", lancar()).inc()
+                    continue
+
+                for tarefa in feitos:
+                    modelo, inicio = pendentes.pop(tarefa)
+                    duracao = time.perf_counter() - inicio
+                    erro = tarefa.exception()
+                    if erro is None:
+                        self.latencias[modelo].registrar(duracao)
+                        GEMINI_MODEL_SECONDS.labels(modelo).observe(duracao)
+                        if proximo > 1:
+                            GEMINI_ROUTER.labels("vencedor", modelo).inc()
+                        return tarefa.result(), modelo
+                    if not isinstance(erro, (APIError, asyncio.TimeoutError)):
+                        raise erro
+                    if isinstance(erro, asyncio.TimeoutError):
+                        self.latencias[modelo].registrar(duracao)
+                    GEMINI_ROUTER.labels(
+                        "timeout" if isinstance(erro, asyncio.TimeoutError) else "erro", modelo).inc()
+                    logger.warning("Modelo %s falhou (%s); tentando o próximo.",
+                                   modelo, type(erro).__name__)
+                    ultimo_erro = erro
+
+                if not pendentes and proximo < len(candidatos):
+                    GEMINI_ROUTER.labels("fallback", lancar()).inc()
+            raise ultimo_erro
+        finally:
+            for tarefa, (modelo, inicio) in pendentes.items():
+                tarefa.cancel()
+                # A perdedora levaria pelo menos isso: entra como amostra para
+                # o percentil não ficar otimista só com as vencedoras
+                self.latencias[modelo].registrar(time.perf_counter() - inicio)
+
+    async def gerar_stream(self, abrir: Execucao):
+        """
+        Como `gerar`, para streaming: `abrir` devolve o iterador de chunks e a
+        corrida vale até o primeiro chunk. Devolve (iterador, modelo).
+        """
+        async def ate_o_primeiro(modelo: str, principal: bool):
+            return await _com_primeiro_chunk(await abrir(modelo, principal))
+
+        (primeiro, chunks), modelo = await self.gerar(ate_o_primeiro)
+        return _encadear(primeiro, chunks), modelo
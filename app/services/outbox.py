@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import uuid
+import random
+import logging
+import sqlite3
+import threading
+from typing import Optional, Dict, Any
+
+from app.services import pipefy_service
+from app.services.pipefy_service import (
+    _get_field_ids, _montar_campos_lead, _normalizar_ou_manter, _executar_query,
+    _variaveis_atualizacao, _card_existente, _indexar_lead, _resposta_existente,
+    MUTATION_CREATE_CARD, MUTATION_UPDATE_FIELDS, NECESSIDADE_MAP, PIPE_ID)
+from app.services.lead_index import LEAD_INDEX_ENABLED, get_lead_index
+
+# Escritas no Pipefy fora do caminho da conversa (write-behind)
+PIPEFY_WRITE_BEHIND = os.getenv("PIPEFY_WRITE_BEHIND", "1") == "1"
+PIPEFY_OUTBOX_PATH = os.getenv("PIPEFY_OUTBOX_PATH", "data/pipefy_outbox.sqlite3")
+PIPEFY_OUTBOX_POLL = float(os.getenv("PIPEFY_OUTBOX_POLL", "1.0"))
+PIPEFY_OUTBOX_MAX_TENTATIVAS = int(os.getenv("PIPEFY_OUTBOX_MAX_TENTATIVAS", "8"))
+# Espera antes de enviar um create, dando chance de juntar o update da reunião
+PIPEFY_OUTBOX_COALESCE_DELAY = float(os.getenv("PIPEFY_OUTBOX_COALESCE_DELAY", "2"))
+# Tempo que um item fica reservado por um worker antes de voltar para a fila
+PIPEFY_OUTBOX_LEASE = float(os.getenv("PIPEFY_OUTBOX_LEASE", "60"))
+
+PREFIXO_PROVISORIO = "PROV_"
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo TEXT NOT NULL,               -- 'create' | 'update'
+    alvo TEXT NOT NULL,               -- id provisório (create) ou card_id/id provisório (update)
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pendente',
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    proxima_tentativa REAL NOT NULL DEFAULT 0,
+    reservado_ate REAL NOT NULL DEFAULT 0,
+    erro TEXT,
+    criado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_fila ON outbox (status, proxima_tentativa, id);
+CREATE INDEX IF NOT EXISTS idx_outbox_alvo ON outbox (alvo, status);
+CREATE TABLE IF NOT EXISTS card_map (
+    provisorio TEXT PRIMARY KEY,
+    card_id TEXT NOT NULL,
+    criado_em REAL NOT NULL
+);
+"""
+
+
+def eh_provisorio(card_id: Optional[str]) -> bool:
+    return bool(card_id) and str(card_id).startswith(PREFIXO_PROVISORIO)
+
+
+class Outbox:
+    """
+    Fila durável (SQLite em modo WAL) das mutations do Pipefy.
+
+    As ferramentas gravam aqui e retornam na hora com um id provisório; um
+    worker em segundo plano drena a fila, junta um create com o update
+    pendente do mesmo lead numa única mutation e registra o card_id real.
+    Vários processos podem compartilhar o arquivo: cada item é reservado
+    (lease) antes de ser enviado.
+    """
+
+    def __init__(self, caminho: str = PIPEFY_OUTBOX_PATH):
+        self.caminho = caminho
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._local = threading.local()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        with self._conexao() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=30,
+                                   isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # 🔹 Produtores (chamados pelas ferramentas)
+
+    def enfileirar_criacao(self, lead: Dict[str, Any]) -> str:
+        provisorio = f"{PREFIXO_PROVISORIO}{uuid.uuid4().hex[:12]}"
+        self._inserir("create", provisorio, lead,
+                      pronto_em=time.time() + PIPEFY_OUTBOX_COALESCE_DELAY)
+        return provisorio
+
+    def enfileirar_atualizacao(self, card_id: str, link: str, datetime_str: str) -> None:
+        self._inserir("update", card_id, {"link": link, "datetime_str": datetime_str})
+
+    def _inserir(self, tipo: str, alvo: str, payload: Dict[str, Any], pronto_em: float = 0.0) -> None:
+        self._conexao().execute(
+            """INSERT INTO outbox (tipo, alvo, payload, proxima_tentativa, criado_em)
+               VALUES (?, ?, ?, ?, ?)""",
+            (tipo, alvo, json.dumps(payload, ensure_ascii=False), pronto_em, time.time()))
+        self.iniciar_worker()
+        self._acordar.set()
+
+    # 🔹 Consultas
+
+    def resolver(self, card_id: str) -> Optional[str]:
+        """Devolve o card_id real de um id provisório (None se ainda não gravado)."""
+        if not eh_provisorio(card_id):
+            return card_id
+        linha = self._conexao().execute(
+            "SELECT card_id FROM card_map WHERE provisorio = ?", (card_id,)).fetchone()
+        return linha["card_id"] if linha else None
+
+    def pendentes(self) -> int:
+        linha = self._conexao().execute(
+            "SELECT COUNT(*) AS n FROM outbox WHERE status IN ('pendente', 'processando')").fetchone()
+        return linha["n"]
+
+    # 🔹 Worker
+
+    def iniciar_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._parar.clear()
+            self._worker = threading.Thread(
+                target=self._loop, name="pipefy-outbox", daemon=True)
+            self._worker.start()
+
+    def parar_worker(self, timeout: float = 5.0) -> None:
+        self._parar.set()
+        self._acordar.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def _loop(self) -> None:
+        while not self._parar.is_set():
+            try:
+                processados = self.drenar()
+            except Exception as e:
+                logger.exception("Falha no worker do outbox do Pipefy: %s", e)
+                processados = 0
+            if not processados:
+                self._acordar.wait(PIPEFY_OUTBOX_POLL)
+                self._acordar.clear()
+
+    def _reservar(self) -> Optional[sqlite3.Row]:
+        conn = self._conexao()
+        agora = time.time()
+        linha = conn.execute(
+            """SELECT * FROM outbox
+               WHERE (status = 'pendente' AND proxima_tentativa <= ?)
+                  OR (status = 'processando' AND reservado_ate < ?)
+               ORDER BY id LIMIT 1""", (agora, agora)).fetchone()
+        if linha is None:
+            return None
+        cursor = conn.execute(
+            """UPDATE outbox SET status = 'processando', reservado_ate = ?
+               WHERE id = ? AND (status = 'pendente' OR reservado_ate < ?)""",
+            (agora + PIPEFY_OUTBOX_LEASE, linha["id"], agora))
+        return linha if cursor.rowcount == 1 else None
+
+    def drenar(self, limite: int = 100) -> int:
+        """Processa até `limite` itens prontos. Retorna quantos foram tratados."""
+        processados = 0
+        while processados < limite:
+            item = self._reservar()
+            if item is None:
+                break
+            processados += 1
+            try:
+                if item["tipo"] == "create":
+                    self._processar_criacao(item)
+                else:
+                    self._processar_atualizacao(item)
+            except Exception as e:
+                self._falhou(item, str(e))
+        return processados
+
+    def _concluir(self, item_id: int, status: str = "enviado") -> None:
+        self._conexao().execute(
+            "UPDATE outbox SET status = ?, erro = NULL WHERE id = ?", (status, item_id))
+
+    def _falhou(self, item: sqlite3.Row, erro: str) -> None:
+        tentativas = item["tentativas"] + 1
+        if tentativas >= PIPEFY_OUTBOX_MAX_TENTATIVAS:
+            status, espera = "erro", 0.0
+            logger.error("Outbox: desistindo do item %s (%s %s): %s",
+                         item["id"], item["tipo"], item["alvo"], erro)
+            if item["tipo"] == "create" and LEAD_INDEX_ENABLED:
+                # O id provisório nunca vai virar card: o lead pode ser registrado de novo
+                get_lead_index().esquecer(item["alvo"])
+        else:
+            status = "pendente"
+            espera = random.uniform(0, min(300.0, 2.0 ** tentativas))
+        self._conexao().execute(
+            """UPDATE outbox SET status = ?, tentativas = ?, proxima_tentativa = ?, erro = ?
+               WHERE id = ?""", (status, tentativas, time.time() + espera, erro, item["id"]))
+
+    def _processar_criacao(self, item: sqlite3.Row) -> None:
+        lead = json.loads(item["payload"])
+        conn = self._conexao()
+
+        # Coalescência: o update mais recente para este lead vai junto no createCard
+        mesclados = conn.execute(
+            """SELECT id, payload FROM outbox
+               WHERE tipo = 'update' AND alvo = ? AND status = 'pendente' ORDER BY id""",
+            (item["alvo"],)).fetchall()
+        if mesclados:
+            ultimo = json.loads(mesclados[-1]["payload"])
+            lead["link_reuniao"] = ultimo["link"]
+            lead["datetime_str"] = ultimo["datetime_str"]
+
+        field_ids = _get_field_ids()
+        datetime_str = lead.get("datetime_str")
+        if datetime_str:
+            datetime_str = _normalizar_ou_manter(datetime_str)
+        fields = _montar_campos_lead(
+            field_ids, lead["nome"], lead["email"], lead["empresa"], lead["necessidade"],
+            datetime_str, lead.get("link_reuniao"))
+
+        result = _executar_query(MUTATION_CREATE_CARD, {
+            "input": {"pipe_id": PIPE_ID, "fields_attributes": fields}})
+        criado = (result.get("data") or {}).get("createCard")
+        if not criado:
+            raise RuntimeError(f"Falha ao criar card: {json.dumps(result)}")
+
+        card_id = criado["card"]["id"]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO card_map (provisorio, card_id, criado_em) VALUES (?, ?, ?)",
+                (item["alvo"], card_id, time.time()))
+            conn.execute(
+                "UPDATE outbox SET status = 'enviado', erro = NULL WHERE id = ?", (item["id"],))
+            for m in mesclados:
+                conn.execute(
+                    "UPDATE outbox SET status = 'mesclado' WHERE id = ?", (m["id"],))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if LEAD_INDEX_ENABLED:
+            get_lead_index().trocar_card(item["alvo"], card_id)
+        logger.info("Outbox: %s gravado no Pipefy como card %s.", item["alvo"], card_id)
+
+    def _processar_atualizacao(self, item: sqlite3.Row) -> None:
+        card_id = self.resolver(item["alvo"])
+        if card_id is None:
+            criacao = self._conexao().execute(
+                """SELECT 1 FROM outbox WHERE tipo = 'create' AND alvo = ?
+                   AND status IN ('pendente', 'processando')""", (item["alvo"],)).fetchone()
+            if criacao is None:
+                self._falhou(item, f"Card provisório {item['alvo']} não foi criado.")
+                return
+            # O create ainda não foi gravado: tenta de novo depois, sem contar falha
+            self._conexao().execute(
+                "UPDATE outbox SET status = 'pendente', proxima_tentativa = ? WHERE id = ?",
+                (time.time() + PIPEFY_OUTBOX_POLL, item["id"]))
+            return
+
+        dados = json.loads(item["payload"])
+        field_ids = _get_field_ids()
+        datetime_str = _normalizar_ou_manter(dados["datetime_str"])
+        result = _executar_query(MUTATION_UPDATE_FIELDS, _variaveis_atualizacao(
+            field_ids, card_id, dados["link"], datetime_str))
+        if not (result.get("data") or {}).get("updateFieldsValues", {}).get("success"):
+            raise RuntimeError(f"Falha ao atualizar card {card_id}: {json.dumps(result)}")
+        self._concluir(item["id"])
+
+
+_outbox: Optional[Outbox] = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> Outbox:
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = Outbox()
+    return _outbox
+
+
+# 🔹 Ferramentas com write-behind (mesma assinatura das originais)
+
+
+def registrar_lead_outbox(nome: str, email: str, empresa: str, necessidade: str, datetime_str: str = None, link_reuniao: str = None) -> str:
+    """Cria um novo card (lead) no Pipefy."""
+    if pipefy_service.SIMULATION_MODE:
+        return pipefy_service.registrar_lead(nome, email, empresa, necessidade, datetime_str, link_reuniao)
+
+    if not NECESSIDADE_MAP.get((necessidade or "").lower()):
+        return "Erro: Necessidade inválida. Escolha uma opção válida do Pipefy."
+
+    card_id = _card_existente(email, empresa)
+    if card_id:
+        return _resposta_existente(card_id, email)
+
+    provisorio = get_outbox().enfileirar_criacao({
+        "nome": nome, "email": email, "empresa": empresa, "necessidade": necessidade,
+        "datetime_str": datetime_str, "link_reuniao": link_reuniao})
+    # Uma nova chamada para o mesmo lead recebe o mesmo id provisório
+    _indexar_lead(email, empresa, provisorio)
+    return json.dumps({
+        "status": "sucesso",
+        "card_id": provisorio,
+        "email": email,
+        "mensagem": "Lead registrado com sucesso. Próximo passo: oferecer horários de reunião."
+    })
+
+
+def atualizar_card_com_reuniao_outbox(card_id: str, link: str, datetime_str: str) -> str:
+    """Agenda a gravação do link e da data da reunião no card do Pipefy."""
+    if pipefy_service.SIMULATION_MODE:
+        return pipefy_service.atualizar_card_com_reuniao(card_id, link, datetime_str)
+
+    get_outbox().enfileirar_atualizacao(card_id, link, datetime_str)
+    return f"Card {card_id} atualizado com sucesso com link e data da reunião."
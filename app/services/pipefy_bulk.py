@@ -0,0 +1,177 @@
+import os
+from typing import List, Dict, Any, Iterable, Tuple
+
+from app.services import pipefy_service
+from app.services.pipefy_service import (
+    _get_field_ids, _montar_campos_lead, _normalizar_ou_manter, _executar_query,
+    _card_existente, _indexar_lead, PIPE_ID)
+from app.services.lead_index import LEAD_INDEX_ENABLED, chave_lead
+
+# Tamanho dos lotes: limite de operações por documento e de "complexidade"
+# estimada (1 ponto por createCard + 1 por campo), abaixo do teto do Pipefy.
+PIPEFY_BULK_BATCH_SIZE = int(os.getenv("PIPEFY_BULK_BATCH_SIZE", "50"))
+PIPEFY_BULK_MAX_COMPLEXIDADE = int(
+    os.getenv("PIPEFY_BULK_MAX_COMPLEXIDADE", "500"))
+
+
+def _custo(fields: List[dict]) -> int:
+    return 1 + len(fields)
+
+
+def montar_mutation_lote(entradas: List[dict]) -> Tuple[str, dict]:
+    """
+    Junta vários createCard num único documento GraphQL com aliases
+    (c0, c1, ...), cada um com sua variável de input.
+    """
+    declaracoes = ", ".join(
+        f"$i{i}: CreateCardInput!" for i in range(len(entradas)))
+    corpo = "\n".join(
+        f"      c{i}: createCard(input: $i{i}) {{ card {{ id title }} }}"
+        for i in range(len(entradas)))
+    mutation = f"""
+    mutation BulkCreateCards({declaracoes}) {{
+{corpo}
+    }}
+    """
+    variables = {f"i{i}": entrada for i, entrada in enumerate(entradas)}
+    return mutation, variables
+
+
+def _dividir_em_lotes(validos: List[tuple]) -> Iterable[List[tuple]]:
+    lote, custo = [], 0
+    for item in validos:
+        c = _custo(item[2]["fields_attributes"])
+        if lote and (len(lote) >= PIPEFY_BULK_BATCH_SIZE or custo + c > PIPEFY_BULK_MAX_COMPLEXIDADE):
+            yield lote
+            lote, custo = [], 0
+        lote.append(item)
+        custo += c
+    if lote:
+        yield lote
+
+
+def _erros_por_alias(result: dict) -> Dict[str, str]:
+    erros = {}
+    for erro in result.get("errors") or []:
+        caminho = erro.get("path") or []
+        if caminho:
+            erros[str(caminho[0])] = erro.get("message", "Erro desconhecido")
+    return erros
+
+
+def _interpretar_lote(lote: List[tuple], result: dict) -> List[Dict[str, Any]]:
+    if result.get("error"):
+        return [{"indice": indice, "email": lead.get("email"), "status": "erro",
+                 "erro": result["error"]} for indice, lead, _ in lote]
+
+    data = result.get("data") or {}
+    erros = _erros_por_alias(result)
+    erro_geral = None
+    if result.get("errors") and not erros:
+        erro_geral = "; ".join(e.get("message", "") for e in result["errors"])
+
+    saida = []
+    for posicao, (indice, lead, _) in enumerate(lote):
+        alias = f"c{posicao}"
+        criado = data.get(alias)
+        if criado and criado.get("card"):
+            saida.append({"indice": indice, "email": lead.get("email"), "status": "sucesso",
+                          "card_id": criado["card"]["id"]})
+        else:
+            saida.append({"indice": indice, "email": lead.get("email"), "status": "erro",
+                          "erro": erros.get(alias) or erro_geral or "Card não criado."})
+    return saida
+
+
+def _existente(indice: int, lead: Dict[str, Any], card_id: str) -> Dict[str, Any]:
+    return {"indice": indice, "email": lead.get("email"), "status": "sucesso",
+            "card_id": card_id, "existente": True}
+
+
+def _separar_registrados(validos: List[tuple], resultados: List[Dict[str, Any]]
+                         ) -> Tuple[List[tuple], List[Tuple[int, Dict[str, Any], int]]]:
+    """
+    Tira do lote os leads já registrados (índice local) e as repetições do
+    mesmo lead dentro da entrada: reimportar um arquivo não duplica cards.
+    Devolve (novos, repetidos como (indice, lead, indice da primeira vez)).
+    """
+    if not LEAD_INDEX_ENABLED:
+        return validos, []
+    novos, repetidos, primeiro = [], [], {}
+    for item in validos:
+        indice, lead, _ = item
+        card_id = _card_existente(lead.get("email"), lead.get("empresa"))
+        if card_id:
+            resultados[indice] = _existente(indice, lead, card_id)
+            continue
+        chave = chave_lead(lead.get("email"), lead.get("empresa"))
+        if chave[0] and chave in primeiro:
+            repetidos.append((indice, lead, primeiro[chave]))
+            continue
+        primeiro[chave] = indice
+        novos.append(item)
+    return novos, repetidos
+
+
+def registrar_leads_em_lote(leads: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Registra vários leads com poucos createCard agrupados por requisição.
+
+    Cada lead é um dict com nome, email, empresa, necessidade e, opcionalmente,
+    datetime_str e link_reuniao (os mesmos argumentos de registrar_lead).
+    Devolve um resultado por lead, na ordem de entrada:
+    {"indice", "email", "status": "sucesso"|"erro", "card_id"|"erro"}; leads
+    que já tinham card voltam com "existente": True.
+    """
+    leads = list(leads)
+    resultados: List[Dict[str, Any]] = [None] * len(leads)
+
+    if pipefy_service.SIMULATION_MODE:
+        return [{"indice": i, "email": lead.get("email"), "status": "sucesso",
+                 "card_id": f"SIM_CARD_{i}"} for i, lead in enumerate(leads)]
+
+    try:
+        field_ids = _get_field_ids()
+    except Exception as e:
+        return [{"indice": i, "email": lead.get("email"), "status": "erro", "erro": str(e)}
+                for i, lead in enumerate(leads)]
+
+    # Validação local (mesma de registrar_lead): inválidos nem vão para a rede
+    validos = []
+    for i, lead in enumerate(leads):
+        datetime_str = lead.get("datetime_str")
+        if datetime_str:
+            datetime_str = _normalizar_ou_manter(datetime_str)
+        try:
+            fields = _montar_campos_lead(
+                field_ids, lead.get("nome"), lead.get("email"), lead.get("empresa"),
+                lead.get("necessidade"), datetime_str, lead.get("link_reuniao"))
+        except (ValueError, KeyError) as e:
+            resultados[i] = {"indice": i, "email": lead.get("email"),
+                             "status": "erro", "erro": str(e)}
+            continue
+        validos.append(
+            (i, lead, {"pipe_id": PIPE_ID, "fields_attributes": fields}))
+
+    validos, repetidos = _separar_registrados(validos, resultados)
+
+    for lote in _dividir_em_lotes(validos):
+        mutation, variables = montar_mutation_lote(
+            [entrada for _, _, entrada in lote])
+        # Mutation: o cliente não repete um lote cuja resposta se perdeu (os
+        # cards podem ter sido criados). Esses leads voltam como erro; a
+        # sincronização do índice traz os cards criados antes de uma reimportação.
+        result = _executar_query(mutation, variables)
+        for (_, lead, _), item in zip(lote, _interpretar_lote(lote, result)):
+            resultados[item["indice"]] = item
+            if item["status"] == "sucesso":
+                _indexar_lead(lead.get("email"), lead.get("empresa"), item["card_id"])
+
+    for indice, lead, original in repetidos:
+        primeiro = resultados[original]
+        if primeiro["status"] == "sucesso":
+            resultados[indice] = _existente(indice, lead, primeiro["card_id"])
+        else:
+            resultados[indice] = {**primeiro, "indice": indice, "email": lead.get("email")}
+
+    return resultados
@@ -0,0 +1,326 @@
+import os
+import re
+import time
+import random
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Optional, Dict, Any, TYPE_CHECKING
+
+from app.services.metrics import PIPEFY_SECONDS, PIPEFY_RETRIES, ERRORS
+
+# httpx é importado sob demanda, para não pesar no tempo de partida da API
+if TYPE_CHECKING:
+    import httpx
+
+PIPEFY_URL = os.getenv("PIPEFY_URL", "https://api.pipefy.com/graphql")
+
+# Conexões e retentativas
+PIPEFY_TIMEOUT = float(os.getenv("PIPEFY_TIMEOUT", "10"))
+PIPEFY_MAX_CONNECTIONS = int(os.getenv("PIPEFY_MAX_CONNECTIONS", "20"))
+PIPEFY_MAX_TENTATIVAS = int(os.getenv("PIPEFY_MAX_TENTATIVAS", "4"))
+PIPEFY_BACKOFF_BASE = float(os.getenv("PIPEFY_BACKOFF_BASE", "0.25"))
+PIPEFY_BACKOFF_MAX = float(os.getenv("PIPEFY_BACKOFF_MAX", "8"))
+
+# Circuit breaker: abre após N falhas seguidas e rejeita chamadas durante o cooldown
+PIPEFY_CB_LIMITE = int(os.getenv("PIPEFY_CB_LIMITE", "5"))
+PIPEFY_CB_COOLDOWN = float(os.getenv("PIPEFY_CB_COOLDOWN", "30"))
+
+STATUS_REPETIVEIS = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+_OPERACAO_RE = re.compile(r"(?:query|mutation)\s+(\w+)")
+
+
+@lru_cache(maxsize=256)
+def _operacao(query: str) -> str:
+    """Nome da operação GraphQL (rótulo das métricas)."""
+    encontrado = _OPERACAO_RE.search(query)
+    return encontrado.group(1) if encontrado else "anonima"
+
+
+@lru_cache(maxsize=256)
+def _e_mutation(query: str) -> bool:
+    return query.lstrip().startswith("mutation")
+
+
+def _nao_enviada(erro: Exception) -> bool:
+    """Falha antes de a requisição chegar ao Pipefy (seguro repetir uma mutation)."""
+    import httpx
+    return isinstance(erro, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+class CircuitoAberto(Exception):
+    """O Pipefy falhou repetidamente; chamadas são rejeitadas até o cooldown."""
+
+
+class CircuitBreaker:
+    """Disjuntor simples (fechado -> aberto -> meio-aberto) seguro entre threads."""
+
+    def __init__(self, limite: int = PIPEFY_CB_LIMITE, cooldown: float = PIPEFY_CB_COOLDOWN):
+        self.limite = limite
+        self.cooldown = cooldown
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._teste_em_andamento = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self) -> str:
+        if self._falhas < self.limite:
+            return "fechado"
+        return "aberto" if time.monotonic() < self._aberto_ate else "meio-aberto"
+
+    def permitir(self) -> None:
+        with self._lock:
+            if self._falhas < self.limite:
+                return
+            if time.monotonic() < self._aberto_ate or self._teste_em_andamento:
+                raise CircuitoAberto(
+                    "Pipefy indisponível (circuit breaker aberto).")
+            # Meio-aberto: deixa passar uma única chamada de teste
+            self._teste_em_andamento = True
+
+    def sucesso(self) -> None:
+        with self._lock:
+            self._falhas = 0
+            self._teste_em_andamento = False
+
+    def liberar(self) -> None:
+        """Resultado que não diz nada da saúde do Pipefy (ex.: 4xx): só libera o teste."""
+        with self._lock:
+            self._teste_em_andamento = False
+
+    def falha(self) -> None:
+        with self._lock:
+            self._falhas += 1
+            self._teste_em_andamento = False
+            if self._falhas >= self.limite:
+                self._aberto_ate = time.monotonic() + self.cooldown
+
+
+def _retry_after(response: Optional["httpx.Response"]) -> Optional[float]:
+    """Lê o cabeçalho Retry-After (segundos ou data HTTP)."""
+    if response is None:
+        return None
+    valor = response.headers.get("Retry-After")
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        quando = parsedate_to_datetime(valor)
+        return max(0.0, (quando - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class PipefyClient:
+    """
+    Cliente GraphQL do Pipefy com conexões keep-alive reaproveitadas,
+    retentativa com backoff exponencial (jitter completo, respeitando
+    Retry-After) e circuit breaker. Oferece interface síncrona (executar)
+    e assíncrona (aexecutar); ambas devolvem o JSON da resposta ou
+    {"error": "..."} como o _executar_query original.
+
+    Mutations não são idempotentes (createCard repetido = card duplicado):
+    só são repetidas quando a requisição com certeza não foi processada
+    (falha de conexão ou 429). `idempotente` sobrepõe essa regra.
+    """
+
+    def __init__(self, url: str = PIPEFY_URL, token: Optional[str] = None,
+                 timeout: float = PIPEFY_TIMEOUT,
+                 max_tentativas: int = PIPEFY_MAX_TENTATIVAS,
+                 max_conexoes: int = PIPEFY_MAX_CONNECTIONS,
+                 backoff_base: float = PIPEFY_BACKOFF_BASE,
+                 backoff_max: float = PIPEFY_BACKOFF_MAX,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_conexoes = max_conexoes
+        self.breaker = breaker or CircuitBreaker()
+        self._sync: Optional["httpx.Client"] = None
+        self._async: Optional["httpx.AsyncClient"] = None
+        self._async_loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
+        }
+
+    def _limites(self) -> "httpx.Limits":
+        import httpx
+        return httpx.Limits(max_connections=self.max_conexoes,
+                            max_keepalive_connections=self.max_conexoes)
+
+    def _cliente_sync(self) -> "httpx.Client":
+        if self._sync is None:
+            with self._lock:
+                if self._sync is None:
+                    import httpx
+                    self._sync = httpx.Client(
+                        headers=self._headers, timeout=self.timeout, limits=self._limites())
+        return self._sync
+
+    def _cliente_async(self) -> "httpx.AsyncClient":
+        # O pool do AsyncClient pertence ao event loop que o criou
+        loop = asyncio.get_running_loop()
+        if self._async is None or self._async_loop is not loop:
+            import httpx
+            self._async = httpx.AsyncClient(
+                headers=self._headers, timeout=self.timeout, limits=self._limites())
+            self._async_loop = loop
+        return self._async
+
+    def _espera(self, tentativa: int, response: Optional["httpx.Response"]) -> float:
+        sugerido = _retry_after(response)
+        if sugerido is not None:
+            return min(sugerido, self.backoff_max)
+        teto = min(self.backoff_max, self.backoff_base * (2 ** tentativa))
+        return random.uniform(0, teto)
+
+    def _interpretar(self, response: "httpx.Response") -> Dict[str, Any]:
+        response.raise_for_status()
+        result = response.json()
+        if "errors" in result:
+            ERRORS.labels("pipefy", "graphql").inc()
+            logger.error("Pipefy retornou erros: %s", result["errors"])
+        return result
+
+    def _concluir(self, response: "httpx.Response") -> Dict[str, Any]:
+        """Resposta final (sem nova tentativa): resultado e estado do breaker."""
+        try:
+            result = self._interpretar(response)
+        except Exception as e:
+            if 400 <= response.status_code < 500:
+                # Erro da requisição (token, query): o Pipefy está respondendo
+                self.breaker.liberar()
+            else:
+                self.breaker.falha()
+            ERRORS.labels("pipefy", type(e).__name__).inc()
+            logger.error("Erro ao conectar com Pipefy: %s", e)
+            return {"error": str(e)}
+        self.breaker.sucesso()
+        return result
+
+    def _preparar(self, query: str, variables: Optional[dict], idempotente: Optional[bool]):
+        """Corpo, política de repetição e métrica da chamada (sem rede)."""
+        if idempotente is None:
+            idempotente = not _e_mutation(query)
+        payload = {"query": query, "variables": variables or {}}
+        return payload, idempotente, PIPEFY_SECONDS.labels(_operacao(query))
+
+    def _bloqueio(self) -> Optional[Dict[str, Any]]:
+        """{"error"} se o breaker recusar a chamada."""
+        try:
+            self.breaker.permitir()
+        except CircuitoAberto as e:
+            ERRORS.labels("pipefy", "circuito_aberto").inc()
+            return {"error": str(e)}
+        return None
+
+    def _decidir(self, tentativa: int, idempotente: bool,
+                 response: Optional["httpx.Response"], erro: Optional[Exception]):
+        """
+        O que fazer depois de uma tentativa (resposta ou exceção do post),
+        comum a executar e aexecutar: (resultado, None) encerra a chamada;
+        (None, espera) tenta de novo depois de `espera` segundos.
+        """
+        import httpx
+        if erro is None:
+            if response.status_code not in STATUS_REPETIVEIS:
+                return self._concluir(response), None
+            ultimo_erro = f"HTTP {response.status_code}"
+            motivo = str(response.status_code)
+            repetivel = idempotente or response.status_code == 429
+        elif isinstance(erro, httpx.TransportError):
+            ultimo_erro = str(erro) or type(erro).__name__
+            motivo = "transporte"
+            repetivel = idempotente or _nao_enviada(erro)
+        else:
+            self.breaker.falha()
+            ERRORS.labels("pipefy", type(erro).__name__).inc()
+            logger.error("Erro ao conectar com Pipefy: %s", erro)
+            return {"error": str(erro)}, None
+
+        # Mutation que pode já ter sido gravada não se repete (duplicaria)
+        if repetivel and tentativa + 1 < self.max_tentativas:
+            PIPEFY_RETRIES.labels(motivo).inc()
+            return None, self._espera(tentativa, response)
+        self.breaker.falha()
+        ERRORS.labels("pipefy", "tentativas_esgotadas").inc()
+        logger.error("Erro ao conectar com Pipefy: %s", ultimo_erro)
+        return {"error": ultimo_erro}, None
+
+    def executar(self, query: str, variables: Optional[dict] = None,
+                idempotente: Optional[bool] = None) -> Dict[str, Any]:
+        payload, idempotente, duracao = self._preparar(query, variables, idempotente)
+        bloqueio = self._bloqueio()
+        if bloqueio is not None:
+            return bloqueio
+        try:
+            for tentativa in range(max(1, self.max_tentativas)):
+                response = erro = None
+                inicio = time.perf_counter()
+                try:
+                    response = self._cliente_sync().post(self.url, json=payload)
+                    duracao.observe(time.perf_counter() - inicio)
+                except Exception as e:
+                    erro = e
+                resultado, espera = self._decidir(tentativa, idempotente, response, erro)
+                if resultado is not None:
+                    return resultado
+                time.sleep(espera)
+        except BaseException:
+            # Cancelada (timeout da ferramenta, cliente que desconectou, hedge
+            # perdedor): não diz nada da saúde do Pipefy, só libera o teste
+            # do meio-aberto
+            self.breaker.liberar()
+            raise
+
+    async def aexecutar(self, query: str, variables: Optional[dict] = None,
+                        idempotente: Optional[bool] = None) -> Dict[str, Any]:
+        payload, idempotente, duracao = self._preparar(query, variables, idempotente)
+        bloqueio = self._bloqueio()
+        if bloqueio is not None:
+            return bloqueio
+        try:
+            for tentativa in range(max(1, self.max_tentativas)):
+                response = erro = None
+                inicio = time.perf_counter()
+                try:
+                    response = await self._cliente_async().post(self.url, json=payload)
+                    duracao.observe(time.perf_counter() - inicio)
+                except Exception as e:
+                    erro = e
+                resultado, espera = self._decidir(tentativa, idempotente, response, erro)
+                if resultado is not None:
+                    return resultado
+                await asyncio.sleep(espera)
+        except BaseException:
+            # Ver executar: cancelamento só libera o teste do meio-aberto
+            self.breaker.liberar()
+            raise
+
+    def fechar(self) -> None:
+        if self._sync is not None:
+            self._sync.close()
+            self._sync = None
+
+    async def afechar(self) -> None:
+        if self._async is not None:
+            await self._async.aclose()
+            self._async = None
@@ -1,56 +1,76 @@
 import os
-import requests
 import json
+import time
+import asyncio
+import logging
 from dotenv import load_dotenv
 from app.utils.date_utils import normalizar_data
 
 load_dotenv()
 
-PIPEFY_URL = "https://api.pipefy.com/graphql"
+from app.services.pipefy_client import PipefyClient, PIPEFY_URL  # noqa: E402
+from app.services.field_cache import field_cache, ler_snapshot  # noqa: E402
+from app.services.lead_index import LEAD_INDEX_ENABLED, get_lead_index  # noqa: E402
+from app.utils.log_utils import Lazy  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
 ACCESS_TOKEN = os.getenv("PIPEFY_ACCESS_TOKEN")
 PIPE_ID = os.getenv("PIPEFY_PRE_SALES_PIPE_ID")
 
-# Cache para os IDs dos campos
-_field_id_cache = {}
-
 # Modo de simulação: ativo se não houver token ou contiver "SIMULACAO"
 SIMULATION_MODE = not ACCESS_TOKEN or "SIMULACAO" in ACCESS_TOKEN.upper()
 
 
-def _executar_query(query, variables=None):
-    """Executa a requisição GraphQL no Pipefy"""
+# Cliente com pool de conexões, retentativa e circuit breaker (compartilhado)
+pipefy_client = PipefyClient(url=PIPEFY_URL, token=ACCESS_TOKEN)
+
+
+def _resultado_simulado(query):
     if SIMULATION_MODE and "start_form_fields" not in query:
-        print("[DEBUG] Modo de simulação ativo. Nenhuma chamada real ao Pipefy.")
+        logger.debug("Modo de simulação ativo. Nenhuma chamada real ao Pipefy.")
         return {"data": {"createCard": {"card": {"id": "SIM_CARD_12345", "title": "Simulado"}}}}
+    return None
 
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    payload = {"query": query, "variables": variables or {}}
 
-    try:
-        response = requests.post(
-            PIPEFY_URL, headers=headers, json=payload, timeout=10
-        )
-        response.raise_for_status()
-        result = response.json()
-        if "errors" in result:
-            print("[ERROR] Pipefy retornou erros:",
-                  json.dumps(result["errors"], indent=2))
-        return result
-    except Exception as e:
-        print(f"[ERROR] Erro ao conectar com Pipefy: {e}")
-        return {"error": str(e)}
+def _campos_rejeitados(query, result):
+    """Se o Pipefy recusou um field id numa mutation (o cache de campos está velho)."""
+    if "mutation" not in query or not result.get("errors"):
+        return False
+    mensagens = " ".join(str(e.get("message", ""))
+                         for e in result["errors"]).lower()
+    return "field" in mensagens or "campo" in mensagens
 
 
-def _get_field_ids():
-    """Busca e cacheia os IDs dos campos do Start Form do Pipefy."""
-    global _field_id_cache
-    if _field_id_cache:
-        return _field_id_cache
+def _verificar_campos_rejeitados(query, result):
+    if _campos_rejeitados(query, result):
+        field_cache.invalidar(PIPE_ID)
+
 
-    query = """
+def _executar_query(query, variables=None):
+    """Executa a requisição GraphQL no Pipefy"""
+    simulado = _resultado_simulado(query)
+    if simulado is not None:
+        return simulado
+    result = pipefy_client.executar(query, variables)
+    _verificar_campos_rejeitados(query, result)
+    return result
+
+
+async def _executar_query_async(query, variables=None):
+    """Versão assíncrona de _executar_query (não ocupa thread durante a rede)."""
+    simulado = _resultado_simulado(query)
+    if simulado is not None:
+        return simulado
+    result = await pipefy_client.aexecutar(query, variables)
+    if _campos_rejeitados(query, result):
+        # invalidar espera as travas do cache, que obter segura durante a
+        # busca no Pipefy (em outra thread ou worker): fora do event loop
+        await asyncio.to_thread(field_cache.invalidar, PIPE_ID)
+    return result
+
+
+QUERY_CAMPOS = """
     query GetPipeFields($pipeId: ID!) {
       pipe(id: $pipeId) {
         start_form_fields {
@@ -60,9 +80,40 @@ def _get_field_ids():
       }
     }
     """
-    variables = {"pipeId": PIPE_ID}
-    result = _executar_query(query, variables)
 
+# Mapeamento label -> key
+LABEL_MAP = {
+    "Nome": "nome",
+    "Email": "email",
+    "Empresa": "empresa",
+    "Necessidade": "necessidade",
+    "Interesse_confirmado": "interesse",
+    "Meeting_link": "link_reuniao",
+    "Data Reuniao": "data_reuniao"
+}
+
+
+def mapear_campos(fields):
+    """Converte a lista start_form_fields (id/label) no mapa chave -> field id."""
+    field_ids = {}
+    for field in fields:
+        label = field.get("label")
+        internal_id = field.get("id")
+        if label in LABEL_MAP:
+            key = LABEL_MAP[label]
+            field_ids[key] = internal_id
+
+    if len(field_ids) < len(LABEL_MAP):
+        logger.warning("Nem todos os campos esperados foram encontrados no Pipefy. "
+                       "Funcionalidade pode ser limitada. Campos encontrados: %s",
+                       list(field_ids.keys()))
+
+    return field_ids
+
+
+def _buscar_campos():
+    """Consulta os campos do Start Form no Pipefy (sem cache)."""
+    result = _executar_query(QUERY_CAMPOS, {"pipeId": PIPE_ID})
     if result.get("error") or "errors" in result:
         raise Exception(
             "Não foi possível buscar os campos do Pipefy. Verifique o token e o ID do Pipe."
@@ -73,61 +124,87 @@ def _get_field_ids():
     if not fields:
         raise Exception("Nenhum campo encontrado no Start Form do Pipe.")
 
-    # Mapeamento label -> key
-    label_map = {
-        "Nome": "nome",
-        "Email": "email",
-        "Empresa": "empresa",
-        "Necessidade": "necessidade",
-        "Interesse_confirmado": "interesse",
-        "Meeting_link": "link_reuniao",
-        "Data Reuniao": "data_reuniao"
-    }
+    return mapear_campos(fields)
 
-    for field in fields:
-        label = field.get("label")
-        internal_id = field.get("id")
-        if label in label_map:
-            key = label_map[label]
-            _field_id_cache[key] = internal_id
 
-    if len(_field_id_cache) < len(label_map):
-        print("[WARNING] Nem todos os campos esperados foram encontrados no Pipefy. Funcionalidade pode ser limitada.")
-        print(f"Campos encontrados: {list(_field_id_cache.keys())}")
+def _get_field_ids():
+    """Busca e cacheia (memória + disco, com TTL) os IDs dos campos do Start Form."""
+    return field_cache.obter(PIPE_ID, _buscar_campos)
 
-    return _field_id_cache
 
+async def _get_field_ids_async():
+    return await field_cache.aobter(PIPE_ID, _buscar_campos)
 
-def registrar_lead(nome: str, email: str, empresa: str, necessidade: str, datetime_str: str = None, link_reuniao: str = None) -> str:
-    """Cria um novo card (lead) no Pipefy."""
-    if SIMULATION_MODE:
-        simulated_card_id = "SIM_CARD_12345"
-        return json.dumps({
-            "status": "sucesso",
-            "card_id": simulated_card_id,
-            "email": email,
-            "mensagem": "Lead registrado com sucesso (simulação)."
-        })
 
+def carregar_snapshot_de_campos():
+    """
+    Semeia o cache de field ids com o snapshot do diagnostico_pipefy.py, se
+    o cache não tiver um mapeamento fresco. O snapshot vale pelo TTL do
+    cache a partir de quando foi capturado (não da partida); um field id
+    velho ainda é recusado pelo Pipefy e invalida o cache
+    (_verificar_campos_rejeitados).
+    """
+    snapshot = ler_snapshot(PIPE_ID)
+    if not snapshot:
+        return False
+    campos, capturado_em = snapshot
+    semeado = field_cache.semear(PIPE_ID, mapear_campos(campos), substituir=False,
+                                 atualizado_em=capturado_em)
+    if semeado:
+        logger.info("Field ids do pipe %s carregados do snapshot.", PIPE_ID)
+    return semeado
+
+
+# Validação do campo 'Necessidade' (select do Pipefy)
+NECESSIDADE_MAP = {
+    "implementar ia": "Implementar IA",
+    "automação": "Automação de Processos",
+}
+
+MUTATION_CREATE_CARD = """
+    mutation CreateCard($input: CreateCardInput!) {
+      createCard(input: $input) {
+        card {
+          id
+          title
+        }
+      }
+    }
+    """
+
+MUTATION_UPDATE_FIELDS = """
+    mutation UpdateCardFields($input: UpdateFieldsValuesInput!) {
+      updateFieldsValues(input: $input) {
+        success
+      }
+    }
+    """
+
+
+def _registro_simulado(email):
+    simulated_card_id = "SIM_CARD_12345"
+    return json.dumps({
+        "status": "sucesso",
+        "card_id": simulated_card_id,
+        "email": email,
+        "mensagem": "Lead registrado com sucesso (simulação)."
+    })
+
+
+def _normalizar_ou_manter(datetime_str):
     try:
-        field_ids = _get_field_ids()
+        return normalizar_data(datetime_str)
     except Exception as e:
-        return str(e)
+        logger.warning("Não foi possível normalizar a data: %s", e)
+        return datetime_str
 
-    if datetime_str:
-        try:
-            datetime_str = normalizar_data(datetime_str)
-        except Exception as e:
-            print(f"[WARNING] Não foi possível normalizar a data: {e}")
-
-    # Validação do campo 'Necessidade' (select do Pipefy)
-    necessidade_map = {
-        "implementar ia": "Implementar IA",
-        "automação": "Automação de Processos",
-    }
-    necessidade_value = necessidade_map.get(necessidade.lower())
+
+def _montar_campos_lead(field_ids, nome, email, empresa, necessidade, datetime_str=None, link_reuniao=None):
+    """Monta fields_attributes do createCard. Levanta ValueError se a necessidade for inválida."""
+    necessidade_value = NECESSIDADE_MAP.get((necessidade or "").lower())
     if not necessidade_value:
-        return "Erro: Necessidade inválida. Escolha uma opção válida do Pipefy."
+        raise ValueError(
+            "Erro: Necessidade inválida. Escolha uma opção válida do Pipefy.")
 
     # Campos do card
     fields = [
@@ -147,22 +224,13 @@ def registrar_lead(nome: str, email: str, empresa: str, necessidade: str, dateti
         fields.append(
             {"field_id": field_ids["data_reuniao"], "field_value": datetime_str})
 
-    # Mutation GraphQL
-    mutation = """
-    mutation CreateCard($input: CreateCardInput!) {
-      createCard(input: $input) {
-        card {
-          id
-          title
-        }
-      }
-    }
-    """
-    variables = {"input": {"pipe_id": PIPE_ID, "fields_attributes": fields}}
-    result = _executar_query(mutation, variables)
+    return fields
 
+
+def _resposta_registro(result, email, empresa=None):
     if result.get("data") and result["data"].get("createCard"):
         card_id = result["data"]["createCard"]["card"]["id"]
+        _indexar_lead(email, empresa, card_id)
         return json.dumps({
             "status": "sucesso",
             "card_id": card_id,
@@ -173,46 +241,105 @@ def registrar_lead(nome: str, email: str, empresa: str, necessidade: str, dateti
         return f"Falha ao criar card no Pipefy. Detalhes: {json.dumps(result)}"
 
 
-def atualizar_card_com_reuniao(card_id: str, link: str, datetime_str: str) -> str:
-    print(
-        f"[DEBUG] Iniciando atualização do card {card_id} com link: {link} e data: {datetime_str}")
+def _card_existente(email, empresa):
+    """card_id de um lead já registrado (índice local, sem ir ao Pipefy)."""
+    if not LEAD_INDEX_ENABLED:
+        return None
+    try:
+        return get_lead_index().buscar(email, empresa)
+    except Exception as e:
+        logger.warning("Índice de leads indisponível: %s", e)
+        return None
+
+
+def _indexar_lead(email, empresa, card_id):
+    if not LEAD_INDEX_ENABLED:
+        return
+    try:
+        get_lead_index().registrar(email, empresa, card_id)
+    except Exception as e:
+        logger.warning("Não foi possível indexar o card %s: %s", card_id, e)
+
+
+def _resposta_existente(card_id, email):
+    logger.info("Lead já registrado no card %s; nenhum card novo criado.", card_id)
+    return json.dumps({
+        "status": "sucesso",
+        "card_id": card_id,
+        "email": email,
+        "existente": True,
+        "mensagem": "Lead já registrado anteriormente. Próximo passo: oferecer horários de reunião."
+    })
 
+
+def registrar_lead(nome: str, email: str, empresa: str, necessidade: str, datetime_str: str = None, link_reuniao: str = None) -> str:
+    """Cria um novo card (lead) no Pipefy."""
     if SIMULATION_MODE:
-        print("[DEBUG] Modo de simulação ativo. Nenhuma chamada real ao Pipefy.")
-        return json.dumps({
-            "status": "sucesso",
-            "card_id": card_id,
-            "mensagem": f"Card {card_id} atualizado com link e data (simulação)."
-        })
+        return _registro_simulado(email)
+
+    card_id = _card_existente(email, empresa)
+    if card_id:
+        return _resposta_existente(card_id, email)
 
     try:
         field_ids = _get_field_ids()
-        print(f"[DEBUG] IDs dos campos obtidos: {field_ids}")
     except Exception as e:
-        print(f"[ERROR] Erro ao obter IDs dos campos: {e}")
         return str(e)
 
-    if "link_reuniao" not in field_ids or "data_reuniao" not in field_ids:
-        print(
-            "[ERROR] Campos 'link_reuniao' ou 'data_reuniao' não encontrados no Pipefy.")
-        return "Erro: Campos para link ou data da reunião não encontrados."
+    if datetime_str:
+        datetime_str = _normalizar_ou_manter(datetime_str)
+
+    try:
+        fields = _montar_campos_lead(
+            field_ids, nome, email, empresa, necessidade, datetime_str, link_reuniao)
+    except ValueError as e:
+        return str(e)
+
+    variables = {"input": {"pipe_id": PIPE_ID, "fields_attributes": fields}}
+    result = _executar_query(MUTATION_CREATE_CARD, variables)
+    return _resposta_registro(result, email, empresa)
+
+
+async def registrar_lead_async(nome: str, email: str, empresa: str, necessidade: str, datetime_str: str = None, link_reuniao: str = None) -> str:
+    """Versão assíncrona de registrar_lead, usada pelo loop de ferramentas."""
+    if SIMULATION_MODE:
+        return _registro_simulado(email)
+
+    # Busca no índice (µs): roda direto no loop, sem thread
+    card_id = _card_existente(email, empresa)
+    if card_id:
+        return _resposta_existente(card_id, email)
 
-    # 🔹 Normaliza a data
     try:
-        datetime_str = normalizar_data(datetime_str)
+        field_ids = await _get_field_ids_async()
     except Exception as e:
-        print(f"[WARNING] Falha ao normalizar data: {e}")
+        return str(e)
 
-    # ✅ Mutation corrigida
-    mutation = """
-    mutation UpdateCardFields($input: UpdateFieldsValuesInput!) {
-      updateFieldsValues(input: $input) {
-        success
-      }
-    }
-    """
+    if datetime_str:
+        datetime_str = await asyncio.to_thread(_normalizar_ou_manter, datetime_str)
+
+    try:
+        fields = _montar_campos_lead(
+            field_ids, nome, email, empresa, necessidade, datetime_str, link_reuniao)
+    except ValueError as e:
+        return str(e)
+
+    variables = {"input": {"pipe_id": PIPE_ID, "fields_attributes": fields}}
+    result = await _executar_query_async(MUTATION_CREATE_CARD, variables)
+    return _resposta_registro(result, email, empresa)
+
+
+def _atualizacao_simulada(card_id):
+    logger.debug("Modo de simulação ativo. Nenhuma chamada real ao Pipefy.")
+    return json.dumps({
+        "status": "sucesso",
+        "card_id": card_id,
+        "mensagem": f"Card {card_id} atualizado com link e data (simulação)."
+    })
 
-    variables = {
+
+def _variaveis_atualizacao(field_ids, card_id, link, datetime_str):
+    return {
         "input": {
             "nodeId": card_id,
             "values": [
@@ -222,16 +349,153 @@ def atualizar_card_com_reuniao(card_id: str, link: str, datetime_str: str) -> st
         }
     }
 
-    result = _executar_query(mutation, variables)
-    print(f"[DEBUG] Resultado da atualização: {json.dumps(result, indent=2)}")
+
+def _resposta_atualizacao(card_id, result):
+    # Dump da resposta só é formatado se o DEBUG estiver ligado (e amostrado)
+    logger.debug("Resultado da atualização: %s", Lazy(json.dumps, result, indent=2))
 
     success = result.get("data", {}).get(
         "updateFieldsValues", {}).get("success")
 
     if success:
-        print(f"[INFO] Card {card_id} atualizado com sucesso no Pipefy.")
+        logger.info("Card %s atualizado com sucesso no Pipefy.", card_id)
         return f"Card {card_id} atualizado com sucesso com link e data da reunião."
     else:
-        print(
-            f"[ERROR] Falha ao atualizar o card {card_id}. Detalhes: {result}")
+        logger.error("Falha ao atualizar o card %s. Detalhes: %s", card_id, result)
         return f"Falha ao atualizar card {card_id}. Detalhes: {json.dumps(result)}"
+
+
+def _campos_reuniao_ausentes(field_ids):
+    if "link_reuniao" not in field_ids or "data_reuniao" not in field_ids:
+        logger.error("Campos 'link_reuniao' ou 'data_reuniao' não encontrados no Pipefy.")
+        return "Erro: Campos para link ou data da reunião não encontrados."
+    return None
+
+
+def atualizar_card_com_reuniao(card_id: str, link: str, datetime_str: str) -> str:
+    logger.debug("Iniciando atualização do card %s com link: %s e data: %s",
+                 card_id, link, datetime_str)
+
+    if SIMULATION_MODE:
+        return _atualizacao_simulada(card_id)
+
+    try:
+        field_ids = _get_field_ids()
+        logger.debug("IDs dos campos obtidos: %s", field_ids)
+    except Exception as e:
+        logger.error("Erro ao obter IDs dos campos: %s", e)
+        return str(e)
+
+    erro = _campos_reuniao_ausentes(field_ids)
+    if erro:
+        return erro
+
+    # 🔹 Normaliza a data
+    datetime_str = _normalizar_ou_manter(datetime_str)
+
+    variables = _variaveis_atualizacao(field_ids, card_id, link, datetime_str)
+    result = _executar_query(MUTATION_UPDATE_FIELDS, variables)
+    return _resposta_atualizacao(card_id, result)
+
+
+async def atualizar_card_com_reuniao_async(card_id: str, link: str, datetime_str: str) -> str:
+    """Versão assíncrona de atualizar_card_com_reuniao."""
+    logger.debug("Iniciando atualização do card %s com link: %s e data: %s",
+                 card_id, link, datetime_str)
+
+    if SIMULATION_MODE:
+        return _atualizacao_simulada(card_id)
+
+    try:
+        field_ids = await _get_field_ids_async()
+    except Exception as e:
+        logger.error("Erro ao obter IDs dos campos: %s", e)
+        return str(e)
+
+    erro = _campos_reuniao_ausentes(field_ids)
+    if erro:
+        return erro
+
+    datetime_str = await asyncio.to_thread(_normalizar_ou_manter, datetime_str)
+
+    variables = _variaveis_atualizacao(field_ids, card_id, link, datetime_str)
+    result = await _executar_query_async(MUTATION_UPDATE_FIELDS, variables)
+    return _resposta_atualizacao(card_id, result)
+
+
+# 🔹 Sincronização do índice local de leads
+
+QUERY_CARDS_ALTERADOS = """
+    query SyncCards($pipeId: ID!, $after: String, $filtro: AllCardsFilter) {
+      allCards(pipeId: $pipeId, first: 50, after: $after, filter: $filtro) {
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+        edges {
+          node {
+            id
+            updated_at
+            fields {
+              field {
+                id
+              }
+              value
+            }
+          }
+        }
+      }
+    }
+    """
+
+
+def _cards_da_pagina(edges, field_ids):
+    for edge in edges:
+        node = edge.get("node") or {}
+        valores = {(f.get("field") or {}).get("id"): f.get("value")
+                   for f in node.get("fields") or []}
+        yield (node.get("id"), valores.get(field_ids.get("email")),
+               valores.get(field_ids.get("empresa")), node.get("updated_at"))
+
+
+def sincronizar_indice_de_leads(completa: bool = None) -> dict:
+    """
+    Traz para o índice local os cards alterados no Pipefy desde a última
+    sincronização (filtro updated_at >= cursor, paginado). A completa relê o
+    pipe inteiro e descarta do índice os cards que sumiram.
+    """
+    if SIMULATION_MODE or not LEAD_INDEX_ENABLED:
+        return {"cards": 0}
+
+    indice = get_lead_index()
+    if completa is None:
+        completa = indice.precisa_sincronizacao_completa()
+    field_ids = _get_field_ids()
+    desde = None if completa else indice.cursor_sincronizacao
+    filtro = {"field": "updated_at", "operator": "gte", "value": desde} if desde else None
+
+    inicio = time.time()
+    after, total, maximo = None, 0, None
+    while True:
+        result = _executar_query(QUERY_CARDS_ALTERADOS, {
+            "pipeId": PIPE_ID, "after": after, "filtro": filtro})
+        if result.get("error") or result.get("errors"):
+            raise RuntimeError(f"Falha ao sincronizar cards: {json.dumps(result)}")
+        pagina = (result.get("data") or {}).get("allCards") or {}
+        cards = list(_cards_da_pagina(pagina.get("edges") or [], field_ids))
+        total += indice.aplicar_pagina(cards)
+        # O cursor só avança no fim: uma falha no meio relê tudo desde o anterior
+        for _, _, _, atualizado_em in cards:
+            if atualizado_em and (maximo is None or atualizado_em > maximo):
+                maximo = atualizado_em
+        info = pagina.get("pageInfo") or {}
+        if not info.get("hasNextPage"):
+            break
+        after = info.get("endCursor")
+
+    indice.avancar_cursor(maximo)
+
+    removidos = indice.concluir_sincronizacao_completa(inicio) if completa else 0
+    logger.info("Índice de leads sincronizado (%s): %d cards lidos, %d removidos.",
+                "completa" if completa else "incremental", total, removidos)
+    return {"cards": total, "removidos": removidos, "completa": completa}
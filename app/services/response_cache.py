@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+# Cache de respostas do modelo para inícios de conversa repetidos ("oi",
+# "quero saber mais"...). Desligado por padrão: RESPONSE_CACHE_ENABLED=1 liga.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "0") == "1"
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "600"))
+RESPONSE_CACHE_MAX_ITEMS = int(os.getenv("RESPONSE_CACHE_MAX_ITEMS", "1024"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Custo fixo aproximado de cada entrada além do texto (chave, nó do OrderedDict)
+_OVERHEAD_ENTRADA = 256
+
+
+class _Entrada:
+    __slots__ = ("texto", "segundos", "tamanho", "expira_em")
+
+    def __init__(self, texto: str, segundos: float, expira_em: float):
+        self.texto = texto
+        # Quanto a chamada original ao modelo levou (o que um acerto economiza)
+        self.segundos = segundos
+        self.tamanho = len(texto.encode("utf-8")) + _OVERHEAD_ENTRADA
+        self.expira_em = expira_em
+
+
+def pode_usar_cache(history: List[Dict[str, Any]]) -> bool:
+    """
+    Só históricos de texto puro entram no cache. Depois de uma function call
+    o histórico carrega dados do lead e efeitos no Pipefy/agenda (card_id,
+    horário reservado), e essa resposta não pode ser reaproveitada.
+    """
+    for item in history:
+        for p in item.get("parts", []):
+            if not isinstance(p, dict) or p.get("functionCall") or p.get("functionResponse"):
+                return False
+    return True
+
+
+def chave_resposta(modelo: str, instrucao: str, ferramentas: str,
+                   history: List[Dict[str, Any]]) -> str:
+    """Hash canônico de (modelo, instrução de sistema, ferramentas, histórico)."""
+    canonico = json.dumps([modelo, instrucao, ferramentas, history],
+                          ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Respostas em texto do modelo por chave canônica, com despejo por LRU,
+    TTL (contado da gravação) e teto de memória.
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+                 max_itens: int = RESPONSE_CACHE_MAX_ITEMS,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self._itens: "OrderedDict[str, _Entrada]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+    @property
+    def bytes_em_uso(self) -> int:
+        return self._bytes
+
+    def get(self, chave: str) -> Optional[_Entrada]:
+        agora = time.monotonic()
+        with self._lock:
+            entrada = self._itens.get(chave)
+            if entrada is not None and entrada.expira_em <= agora:
+                self._remover(chave)
+                entrada = None
+            if entrada is None:
+                self.faltas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return entrada
+
+    def set(self, chave: str, texto: str, segundos: float) -> None:
+        entrada = _Entrada(texto, segundos, time.monotonic() + self.ttl)
+        if entrada.tamanho > self.max_bytes:
+            return
+        with self._lock:
+            self._remover(chave)
+            self._itens[chave] = entrada
+            self._bytes += entrada.tamanho
+            self._despejar()
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    def _remover(self, chave: str) -> None:
+        entrada = self._itens.pop(chave, None)
+        if entrada is not None:
+            self._bytes -= entrada.tamanho
+
+    def _despejar(self) -> None:
+        while self._itens and (len(self._itens) > self.max_itens
+                               or self._bytes > self.max_bytes):
+            _, entrada = self._itens.popitem(last=False)
+            self._bytes -= entrada.tamanho
+
+
+# Instância única usada pelo agente
+response_cache = ResponseCache()
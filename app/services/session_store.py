@@ -0,0 +1,177 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+from app.services.conversa import ConversaCompilada
+from app.utils.json_utils import dumps, loads
+
+# Limites configuráveis do armazenamento de sessões (processo local)
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Custo fixo aproximado de cada registro/sessão além do payload
+_OVERHEAD_MENSAGEM = 64
+_OVERHEAD_SESSAO = 256
+# A conversa compilada (types.Content do SDK + dicts de wire) ocupa 31,3x a
+# 32,5x o JSON das partes das mensagens (benchmarks/bench_conversa.py, 10 a
+# 1000 mensagens) e entra no teto de memória; com folga para conversas curtas
+_FATOR_CONVERSA_COMPILADA = 33
+
+
+class SessaoNaoEncontrada(KeyError):
+    """A sessão não existe ou já foi removida por TTL/LRU."""
+
+
+class _Mensagem:
+    """Registro compacto de uma mensagem: papel + partes serializadas em JSON."""
+    __slots__ = ("role", "dados")
+
+    def __init__(self, role: str, parts: List[Dict[str, Any]]):
+        self.role = role
+        self.dados = dumps(parts)
+
+    def tamanho(self) -> int:
+        return len(self.dados) + _OVERHEAD_MENSAGEM
+
+    def para_dict(self) -> Dict[str, Any]:
+        return {"role": self.role, "parts": loads(self.dados)}
+
+
+class _Sessao:
+    __slots__ = ("mensagens", "tamanho", "expira_em", "conversa", "custo_conversa")
+
+    def __init__(self, expira_em: float):
+        self.mensagens: List[_Mensagem] = []
+        self.tamanho = _OVERHEAD_SESSAO
+        self.expira_em = expira_em
+        # Histórico já compilado para o SDK (reaproveitado entre turnos)
+        self.conversa: Optional[ConversaCompilada] = None
+        self.custo_conversa = 0
+
+
+class SessionStore:
+    """
+    Histórico de conversas mantido no servidor, com despejo por LRU, TTL
+    (contado a partir do último acesso) e teto de memória.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS,
+                 max_sessoes: int = SESSION_MAX_SESSIONS,
+                 max_bytes: int = SESSION_MAX_BYTES):
+        self.ttl = ttl
+        self.max_sessoes = max_sessoes
+        self.max_bytes = max_bytes
+        self._sessoes: "OrderedDict[str, _Sessao]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessoes)
+
+    @property
+    def bytes_em_uso(self) -> int:
+        return self._bytes
+
+    def criar(self) -> str:
+        """Abre uma sessão vazia e devolve o seu id."""
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            sessao = _Sessao(time.monotonic() + self.ttl)
+            self._sessoes[session_id] = sessao
+            self._bytes += sessao.tamanho
+            self._despejar(time.monotonic())
+        return session_id
+
+    def carregar(self, session_id: str) -> List[Dict[str, Any]]:
+        """Devolve o histórico no formato de wire (lista de dicts role/parts)."""
+        with self._lock:
+            sessao = self._tocar(session_id)
+            mensagens = list(sessao.mensagens)
+        return [m.para_dict() for m in mensagens]
+
+    def carregar_conversa(self, session_id: str) -> ConversaCompilada:
+        """
+        Histórico compilado para o SDK. Só as mensagens ainda não compiladas
+        são convertidas; o turno recebe uma cópia (bifurcada) para anexar.
+        """
+        with self._lock:
+            sessao = self._tocar(session_id)
+            mensagens = list(sessao.mensagens)
+            conversa = sessao.conversa
+        if conversa is None or len(conversa) > len(mensagens):
+            conversa = ConversaCompilada()
+        else:
+            conversa = conversa.bifurcar()
+        # Guardadas já validadas (corpo da requisição ou produzidas pelo agente)
+        conversa.estender((m.para_dict() for m in mensagens[len(conversa):]), validadas=True)
+        return conversa
+
+    def anexar(self, session_id: str, mensagens: List[Dict[str, Any]],
+               conversa: Optional[ConversaCompilada] = None) -> None:
+        """
+        Acrescenta as mensagens de um turno ao final da sessão. `conversa`,
+        se informada, é o histórico compilado já com essas mensagens.
+        """
+        registros = [_Mensagem(m.get("role", "user"), m.get("parts", []))
+                     for m in mensagens]
+        with self._lock:
+            sessao = self._tocar(session_id)
+            for registro in registros:
+                sessao.mensagens.append(registro)
+                sessao.tamanho += registro.tamanho()
+                self._bytes += registro.tamanho()
+            completa = conversa is not None and len(conversa) == len(sessao.mensagens)
+            self._trocar_conversa(sessao, conversa if completa else None)
+            self._despejar(time.monotonic(), manter=session_id)
+
+    def remover(self, session_id: str) -> None:
+        with self._lock:
+            sessao = self._sessoes.pop(session_id, None)
+            if sessao is not None:
+                self._bytes -= sessao.tamanho
+
+    def _trocar_conversa(self, sessao: _Sessao, conversa: Optional[ConversaCompilada]) -> None:
+        custo = 0
+        if conversa is not None:
+            # Só o JSON das partes: é a base em que o fator foi medido
+            dados = (sessao.tamanho - _OVERHEAD_SESSAO - sessao.custo_conversa
+                     - _OVERHEAD_MENSAGEM * len(sessao.mensagens))
+            custo = dados * _FATOR_CONVERSA_COMPILADA
+        sessao.conversa = conversa
+        sessao.tamanho += custo - sessao.custo_conversa
+        self._bytes += custo - sessao.custo_conversa
+        sessao.custo_conversa = custo
+
+    def _tocar(self, session_id: str) -> _Sessao:
+        """Busca a sessão, renova o TTL e a move para o fim da fila LRU."""
+        agora = time.monotonic()
+        sessao = self._sessoes.get(session_id)
+        if sessao is None or sessao.expira_em <= agora:
+            if sessao is not None:
+                self._sessoes.pop(session_id)
+                self._bytes -= sessao.tamanho
+            raise SessaoNaoEncontrada(session_id)
+        sessao.expira_em = agora + self.ttl
+        self._sessoes.move_to_end(session_id)
+        return sessao
+
+    def _despejar(self, agora: float, manter: str = None) -> None:
+        # O TTL é renovado a cada acesso, então as expiradas ficam no início
+        while self._sessoes:
+            session_id, sessao = next(iter(self._sessoes.items()))
+            excedeu = (len(self._sessoes) > self.max_sessoes
+                       or self._bytes > self.max_bytes)
+            if sessao.expira_em > agora and not excedeu:
+                break
+            if session_id == manter and len(self._sessoes) == 1:
+                break
+            self._sessoes.popitem(last=False)
+            self._bytes -= sessao.tamanho
+
+
+# Instância única usada pela API
+session_store = SessionStore()
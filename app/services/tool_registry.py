@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, Any, NamedTuple, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+# Cache explícito do Gemini (cached content) para a instrução de sistema e as
+# ferramentas: enviadas e cobradas uma vez, referenciadas por nome a cada turno.
+# Desligado por padrão; exige modelo com suporte e um mínimo de tokens no bloco.
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1"
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# O handle é renovado quando falta menos do que isso para expirar
+GEMINI_CONTEXT_CACHE_MARGEM_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_MARGEM_SECONDS", "300"))
+# Depois de uma falha ao criar o cache, os turnos seguem sem ele por este tempo
+GEMINI_CONTEXT_CACHE_RETRY_SECONDS = float(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_SECONDS", "600"))
+
+logger = logging.getLogger(__name__)
+
+
+class _Compilado(NamedTuple):
+    declaracoes: list
+    tools: list
+    versao: str
+    afc: Any
+    com_ferramentas: Any
+    sem_ferramentas: Any
+
+
+class ToolRegistry:
+    """
+    Declarações das ferramentas (FunctionDeclaration) e configs do Gemini
+    montadas uma única vez, em vez de o SDK inspecionar as funções Python a
+    cada chamada. `versao` é o hash de (modelo, instrução, esquemas): muda
+    sempre que qualquer um deles muda.
+    """
+
+    def __init__(self, funcoes: Dict[str, Callable[..., Any]], instrucao: str, modelo: str):
+        self.funcoes = dict(funcoes)
+        self.instrucao = instrucao
+        self.modelo = modelo
+        self._compilado: Optional[_Compilado] = None
+        self._lock = threading.Lock()
+
+        # Estado do cached content
+        self.cache_nome: Optional[str] = None
+        self._cache_expira_em = 0.0
+        self._cache_tentar_apos = 0.0
+        self._cache_tarefa: Optional[asyncio.Task] = None
+
+    # 🔹 Compilação
+
+    def compilar(self) -> _Compilado:
+        if self._compilado is None:
+            with self._lock:
+                if self._compilado is None:
+                    self._compilado = self._montar()
+        return self._compilado
+
+    def _montar(self) -> _Compilado:
+        from google.genai import types
+
+        declaracoes = []
+        for nome, func in self.funcoes.items():
+            declaracao = types.FunctionDeclaration.from_callable_with_api_option(
+                callable=func, use_json_schema=True)
+            if declaracao.name != nome:
+                raise ValueError(f"Ferramenta '{nome}' declarada como '{declaracao.name}'.")
+            declaracoes.append(declaracao)
+        tools = [types.Tool(function_declarations=declaracoes)]
+
+        esquemas = [d.model_dump(mode="json", exclude_none=True) for d in declaracoes]
+        versao = hashlib.sha256(json.dumps(
+            [self.modelo, self.instrucao, esquemas], ensure_ascii=False, sort_keys=True
+        ).encode("utf-8")).hexdigest()[:16]
+
+        # O loop de ferramentas é nosso (executar_turno), não do SDK
+        afc = types.AutomaticFunctionCallingConfig(disable=True)
+        return _Compilado(
+            declaracoes=declaracoes,
+            tools=tools,
+            versao=versao,
+            afc=afc,
+            com_ferramentas=types.GenerateContentConfig(
+                system_instruction=self.instrucao, tools=tools,
+                automatic_function_calling=afc),
+            sem_ferramentas=types.GenerateContentConfig(
+                system_instruction=self.instrucao, tools=tools,
+                automatic_function_calling=afc,
+                tool_config=types.ToolConfig(
+                    function_calling_config=types.FunctionCallingConfig(mode="NONE"))),
+        )
+
+    @property
+    def versao(self) -> str:
+        return self.compilar().versao
+
+    def config(self, permitir_ferramentas: bool = True) -> "types.GenerateContentConfig":
+        """Config pronta (instrução e ferramentas enviadas na própria requisição)."""
+        compilado = self.compilar()
+        return compilado.com_ferramentas if permitir_ferramentas else compilado.sem_ferramentas
+
+    # 🔹 Cached content
+
+    def config_para(self, cliente, permitir_ferramentas: bool = True) -> "types.GenerateContentConfig":
+        """
+        Config do turno: referencia o cached content quando há um handle
+        válido; senão usa a config completa e agenda a criação/renovação do
+        cache em segundo plano (o turno nunca espera por ele).
+        """
+        if not GEMINI_CONTEXT_CACHE or not permitir_ferramentas:
+            # Requisições com cached content não aceitam tool_config próprio
+            return self.config(permitir_ferramentas)
+
+        agora = time.monotonic()
+        if self.cache_nome is None or agora >= self._cache_expira_em - GEMINI_CONTEXT_CACHE_MARGEM_SECONDS:
+            self._agendar_cache(cliente, agora)
+        if self.cache_nome is not None and agora < self._cache_expira_em:
+            from google.genai import types
+            return types.GenerateContentConfig(
+                cached_content=self.cache_nome,
+                automatic_function_calling=self.compilar().afc)
+        return self.config(permitir_ferramentas)
+
+    def _agendar_cache(self, cliente, agora: float) -> None:
+        if self._cache_tarefa is not None and not self._cache_tarefa.done():
+            return
+        if self.cache_nome is None and agora < self._cache_tentar_apos:
+            return
+        self._cache_tarefa = asyncio.get_running_loop().create_task(self.preparar_cache(cliente))
+
+    async def preparar_cache(self, cliente) -> Optional[str]:
+        """Cria o cached content ou estende o TTL do atual. Devolve o nome."""
+        from google.genai import types
+
+        compilado = self.compilar()
+        ttl = f"{GEMINI_CONTEXT_CACHE_TTL_SECONDS}s"
+        if self.cache_nome is not None:
+            try:
+                await cliente.aio.caches.update(
+                    name=self.cache_nome, config=types.UpdateCachedContentConfig(ttl=ttl))
+                self._cache_expira_em = time.monotonic() + GEMINI_CONTEXT_CACHE_TTL_SECONDS
+                return self.cache_nome
+            except Exception as e:
+                # Expirou ou foi apagado do lado do Gemini: cria outro
+                logger.warning("Falha ao renovar o cached content %s: %s", self.cache_nome, e)
+                self.invalidar_cache()
+        try:
+            cache = await cliente.aio.caches.create(
+                model=self.modelo,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"sdr-{compilado.versao}",
+                    system_instruction=self.instrucao,
+                    tools=compilado.tools,
+                    ttl=ttl,
+                ))
+        except Exception as e:
+            # Modelo sem suporte ou bloco abaixo do mínimo de tokens do cache
+            self._cache_tentar_apos = time.monotonic() + GEMINI_CONTEXT_CACHE_RETRY_SECONDS
+            logger.warning("Cached content indisponível para %s (%s); seguindo sem cache.",
+                           self.modelo, e)
+            return None
+        self.cache_nome = cache.name
+        self._cache_expira_em = time.monotonic() + GEMINI_CONTEXT_CACHE_TTL_SECONDS
+        logger.info("Cached content %s criado (versão %s).", cache.name, compilado.versao)
+        return self.cache_nome
+
+    def invalidar_cache(self) -> None:
+        self.cache_nome = None
+        self._cache_expira_em = 0.0
+
+    async def apagar_cache(self, cliente) -> None:
+        """Apaga o cached content (no desligamento, para não pagar armazenamento)."""
+        nome, self.cache_nome = self.cache_nome, None
+        if nome is None or cliente is None:
+            return
+        try:
+            await cliente.aio.caches.delete(name=nome)
+        except Exception as e:
+            logger.warning("Falha ao apagar o cached content %s: %s", nome, e)
@@ -0,0 +1,83 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from app.services import outbox
+from app.services.gemini_agent import get_client, tool_registry
+from app.services.tool_registry import GEMINI_CONTEXT_CACHE
+from app.services.lead_index import LEAD_INDEX_ENABLED, LEAD_INDEX_SYNC_SECONDS
+from app.services.pipefy_service import (
+    pipefy_client, _get_field_ids_async, carregar_snapshot_de_campos, sincronizar_indice_de_leads,
+    SIMULATION_MODE, PIPE_ID)
+
+# Aquecimento em segundo plano: a API já atende "/" enquanto o SDK do Gemini,
+# o dateparser e os field ids do Pipefy são carregados.
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+
+logger = logging.getLogger(__name__)
+
+
+def _aquecer_datas() -> None:
+    from app.utils.date_utils import _dateparser
+    # Fallback do normalizador: o primeiro parse carrega os dados de idioma
+    _dateparser("amanhã")
+
+
+async def _etapa(nome: str, corrotina) -> None:
+    try:
+        await corrotina
+    except Exception as e:
+        logger.warning("Aquecimento '%s' falhou: %s", nome, e)
+
+
+async def _aquecer() -> None:
+    await _etapa("gemini", asyncio.to_thread(get_client))
+    # Declarações das ferramentas e configs prontas antes do primeiro turno
+    await _etapa("ferramentas", asyncio.to_thread(tool_registry.compilar))
+    if GEMINI_CONTEXT_CACHE and get_client() is not None:
+        await _etapa("cached_content", tool_registry.preparar_cache(get_client()))
+    await _etapa("dateparser", asyncio.to_thread(_aquecer_datas))
+    if not SIMULATION_MODE and PIPE_ID:
+        # Com snapshot (diagnostico_pipefy.py) os field ids não esperam o Pipefy;
+        # sem ele a busca também deixa uma conexão aberta no pool assíncrono
+        await _etapa("snapshot", asyncio.to_thread(carregar_snapshot_de_campos))
+        await _etapa("pipefy", _get_field_ids_async())
+        if outbox.PIPEFY_WRITE_BEHIND:
+            # Escritas pendentes de uma execução anterior voltam a ser drenadas
+            await _etapa("outbox", asyncio.to_thread(_retomar_outbox))
+
+
+async def _sincronizar_leads() -> None:
+    """Mantém o índice local de leads em dia com o Pipefy (incremental)."""
+    while True:
+        try:
+            await asyncio.to_thread(sincronizar_indice_de_leads)
+        except Exception as e:
+            logger.warning("Sincronização do índice de leads falhou: %s", e)
+        await asyncio.sleep(LEAD_INDEX_SYNC_SECONDS)
+
+
+def _retomar_outbox() -> None:
+    fila = outbox.get_outbox()
+    if fila.pendentes():
+        fila.iniciar_worker()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tarefa = asyncio.create_task(_aquecer()) if STARTUP_WARMUP else None
+    sincronizacao = None
+    if LEAD_INDEX_ENABLED and LEAD_INDEX_SYNC_SECONDS > 0 and not SIMULATION_MODE and PIPE_ID:
+        sincronizacao = asyncio.create_task(_sincronizar_leads())
+    yield
+    for pendente in (tarefa, sincronizacao):
+        if pendente is not None and not pendente.done():
+            pendente.cancel()
+    if outbox._outbox is not None:
+        await asyncio.to_thread(outbox._outbox.parar_worker)
+    await tool_registry.apagar_cache(get_client() if tool_registry.cache_nome else None)
+    pipefy_client.fechar()
+    await pipefy_client.afechar()
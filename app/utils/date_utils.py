@@ -1,32 +1,152 @@
-import dateparser
-from datetime import datetime
+import os
+import re
+import time
+from datetime import datetime, date
+from functools import lru_cache
+from typing import Iterable, List, Optional
 
+from app.services.metrics import DATE_SECONDS
 
-def normalizar_data(texto_data: str) -> str:
-    """
-    Converte uma data escrita de forma natural (ex: '21/10/2025 às 19:00')
-    para o formato ISO 8601 aceito pelo Pipefy.
-    """
+DATE_CACHE_SIZE = int(os.getenv("DATE_CACHE_SIZE", "4096"))
+
+# Configuração do dateparser (fallback para formatos fora do caminho rápido)
+_DATEPARSER_SETTINGS = {
+    'TIMEZONE': 'America/Sao_Paulo',
+    'RETURN_AS_TIMEZONE_AWARE': False,
+    'PREFER_DATES_FROM': 'future'
+}
+
+_MESES = {
+    "janeiro": 1, "jan": 1, "fevereiro": 2, "fev": 2, "março": 3, "marco": 3, "mar": 3,
+    "abril": 4, "abr": 4, "maio": 5, "mai": 5, "junho": 6, "jun": 6,
+    "julho": 7, "jul": 7, "agosto": 8, "ago": 8, "setembro": 9, "set": 9,
+    "outubro": 10, "out": 10, "novembro": 11, "nov": 11, "dezembro": 12, "dez": 12,
+}
+
+# Hora opcional: "às 20h", "as 20h30", "20:30", "20:30:00"
+_HORA = r"(?:\s*(?:,|às|as)?\s*(?P<h>\d{1,2})(?:(?::(?P<m>\d{2})(?::(?P<s>\d{2}))?)|h(?P<hm>\d{2})?))?"
+
+# 2025-10-25T10:00:00 (saída de oferecer_horarios), sem fuso
+_ISO_RE = re.compile(
+    r"^(?P<a>\d{4})-(?P<mes>\d{2})-(?P<d>\d{2})"
+    r"(?:[T ](?P<h>\d{2}):(?P<m>\d{2})(?::(?P<s>\d{2})(?:\.\d{1,6})?)?)?$")
+# 21/10/2025 às 19:00
+_NUMERICO_RE = re.compile(
+    r"^(?P<d>\d{1,2})/(?P<mes>\d{1,2})/(?P<a>\d{4})" + _HORA + r"$", re.IGNORECASE)
+# dia 9 de novembro às 20h / 9 de novembro de 2026, 14:30
+_EXTENSO_RE = re.compile(
+    r"^(?:dia\s+)?(?P<d>\d{1,2})\s+de\s+(?P<mes>[a-zç]+)\.?(?:\s+de\s+(?P<a>\d{4}))?"
+    + _HORA + r"$", re.IGNORECASE)
 
-    if not texto_data or not isinstance(texto_data, str):
-        raise ValueError("Data inválida ou vazia.")
+
+def _montar(ano, mes, dia, h, m, s) -> Optional[datetime]:
+    try:
+        return datetime(ano, mes, dia, h, m, s)
+    except ValueError:
+        return None
+
+
+def _hora(match) -> tuple:
+    h = int(match.group("h") or 0)
+    m = int(match.group("m") or match.groupdict().get("hm") or 0)
+    s = int(match.group("s") or 0)
+    return h, m, s
+
+
+def _caminho_rapido(texto: str, dia_ref: date) -> Optional[datetime]:
+    """Formatos mais comuns, sem dateparser. None = não reconhecido."""
+    match = _ISO_RE.match(texto)
+    if match:
+        return _montar(int(match["a"]), int(match["mes"]), int(match["d"]), *_hora(match))
+
+    match = _NUMERICO_RE.match(texto)
+    if match:
+        return _montar(int(match["a"]), int(match["mes"]), int(match["d"]), *_hora(match))
+
+    match = _EXTENSO_RE.match(texto)
+    if match:
+        mes = _MESES.get(match["mes"].lower())
+        if mes is None:
+            return None
+        dia = int(match["d"])
+        if match["a"]:
+            return _montar(int(match["a"]), mes, dia, *_hora(match))
+        # Sem ano: próxima ocorrência a partir do dia de referência (datas futuras)
+        resultado = _montar(dia_ref.year, mes, dia, *_hora(match))
+        if resultado is None or resultado.date() < dia_ref:
+            resultado = _montar(dia_ref.year + 1, mes, dia, *_hora(match))
+        return resultado
+    return None
+
+
+def _dateparser(texto_data: str) -> Optional[datetime]:
+    import dateparser  # import tardio: só paga o custo quando o caminho rápido falha
 
     # Substitui 'às' por um espaço para facilitar a interpretação de hora
     texto_para_parse = texto_data.replace('às', ' ')
 
     # Usa dateparser para interpretar a data em português
-    parsed_date = dateparser.parse(
+    return dateparser.parse(
         texto_para_parse,
         languages=['pt'],
-        settings={
-            'TIMEZONE': 'America/Sao_Paulo',
-            'RETURN_AS_TIMEZONE_AWARE': False,
-            'PREFER_DATES_FROM': 'future'
-        }
+        settings=_DATEPARSER_SETTINGS
     )
 
-    if not parsed_date:
-        raise ValueError(f"Não foi possível interpretar a data: {texto_data}")
 
+class _NaoCachear(Exception):
+    def __init__(self, valor: datetime):
+        self.valor = valor
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _normalizar_em_cache(texto_data: str, dia_ref: date) -> Optional[str]:
+    parsed_date = _caminho_rapido(texto_data.strip(), dia_ref)
+    if parsed_date is None:
+        parsed_date = _dateparser(texto_data)
+        if parsed_date is not None and (parsed_date.second or parsed_date.microsecond):
+            # Herdou o relógio atual (ex.: "amanhã"): não pode ficar em cache
+            raise _NaoCachear(parsed_date)
+    if parsed_date is None:
+        return None
     # Retorna no formato ISO padrão aceito pelo Pipefy
-    return parsed_date.strftime("%Y-%m-%dT%H:%M:%S")
\ No newline at end of file
+    return parsed_date.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _normalizar(texto_data: str, dia_ref: date) -> Optional[str]:
+    try:
+        return _normalizar_em_cache(texto_data, dia_ref)
+    except _NaoCachear as e:
+        return e.valor.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def normalizar_data(texto_data: str) -> str:
+    """
+    Converte uma data escrita de forma natural (ex: '21/10/2025 às 19:00')
+    para o formato ISO 8601 aceito pelo Pipefy.
+    """
+
+    if not texto_data or not isinstance(texto_data, str):
+        raise ValueError("Data inválida ou vazia.")
+
+    inicio = time.perf_counter()
+    resultado = _normalizar(texto_data, date.today())
+    DATE_SECONDS.observe(time.perf_counter() - inicio)
+    if not resultado:
+        raise ValueError(f"Não foi possível interpretar a data: {texto_data}")
+    return resultado
+
+
+def normalizar_datas(textos: Iterable[str], ignorar_erros: bool = False) -> List[Optional[str]]:
+    """
+    Versão em lote de normalizar_data (importações). Com ignorar_erros=True,
+    entradas inválidas viram None em vez de levantar ValueError.
+    """
+    dia_ref = date.today()
+    resultados = []
+    for texto in textos:
+        resultado = _normalizar(texto, dia_ref) if texto and isinstance(
+            texto, str) else None
+        if resultado is None and not ignorar_erros:
+            raise ValueError(f"Não foi possível interpretar a data: {texto}")
+        resultados.append(resultado)
+    return resultados
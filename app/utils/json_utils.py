@@ -0,0 +1,33 @@
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional: sem ele fica o json da stdlib
+    orjson = None
+
+
+def dumps(dados: Any, ordenado: bool = False) -> bytes:
+    """JSON compacto em UTF-8 (orjson quando instalado, ~5-10x mais rápido)."""
+    if orjson is not None:
+        return orjson.dumps(dados, option=orjson.OPT_SORT_KEYS if ordenado else 0)
+    return json.dumps(dados, ensure_ascii=False, sort_keys=ordenado,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def loads(dados: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(dados)
+    return json.loads(dados)
+
+
+class RespostaJSON(JSONResponse):
+    """
+    JSONResponse serializada com `dumps`. Devolvida direto pela rota, pula a
+    revalidação do response_model (o corpo já sai de objetos validados).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" (uma linha por evento) ou "texto" (leitura humana no terminal)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Fração dos registros DEBUG que chegam a ser formatados e escritos
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "request_id", default=None)
+conversa_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "conversa_id", default=None)
+
+# Atributos padrão de LogRecord; o que sobrar veio de `extra=`
+_ATRIBUTOS_PADRAO = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class Lazy:
+    """
+    Adia uma formatação cara (ex.: json.dumps de uma resposta inteira) até o
+    registro ser de fato escrito: `logger.debug("Resposta: %s", Lazy(json.dumps, r))`.
+    """
+    __slots__ = ("_func", "_args", "_kwargs")
+
+    def __init__(self, func, *args, **kwargs):
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+
+    def __str__(self) -> str:
+        return str(self._func(*self._args, **self._kwargs))
+
+
+class _Contexto(logging.Filter):
+    """Copia request/conversa do contexto de quem loga (antes de ir para a fila)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.conversa_id = conversa_id_var.get()
+        return True
+
+
+class _AmostragemDebug(logging.Filter):
+    def __init__(self, taxa: float):
+        super().__init__()
+        self.taxa = taxa
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.taxa
+
+
+class _QueueHandlerPreguicoso(QueueHandler):
+    """
+    O QueueHandler padrão formata a mensagem na thread de quem loga; aqui o
+    registro vai cru para a fila e a formatação acontece na thread do listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Nunca bloqueia a requisição por causa de log: descarta
+            pass
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        evento = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            evento["request_id"] = record.request_id
+        if getattr(record, "conversa_id", None):
+            evento["conversa_id"] = record.conversa_id
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_PADRAO and chave not in ("request_id", "conversa_id"):
+                evento[chave] = valor
+        if record.exc_info:
+            evento["exc"] = self.formatException(record.exc_info)
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configurar_logging(nivel: str = LOG_LEVEL, formato: str = LOG_FORMAT,
+                       taxa_debug: float = LOG_DEBUG_SAMPLE_RATE) -> None:
+    """
+    Liga o pipeline de logs do pacote `app`: QueueHandler (não bloqueia) ->
+    thread do QueueListener -> stdout. Idempotente.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    saida = logging.StreamHandler(sys.stdout)
+    if formato == "json":
+        saida.setFormatter(JsonFormatter())
+    else:
+        saida.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    fila: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = _QueueHandlerPreguicoso(fila)
+    handler.addFilter(_AmostragemDebug(taxa_debug))
+    handler.addFilter(_Contexto())
+
+    raiz = logging.getLogger("app")
+    raiz.setLevel(nivel)
+    raiz.addHandler(handler)
+    raiz.propagate = False
+
+    _listener = QueueListener(fila, saida, respect_handler_level=True)
+    _listener.start()
+    atexit.register(parar_logging)
+
+
+def parar_logging() -> None:
+    """Escoa a fila e para a thread do listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class ContextoRequisicaoMiddleware:
+    """
+    Middleware ASGI puro (sem o custo do BaseHTTPMiddleware): usa o
+    X-Request-ID recebido ou gera um, expõe no contexto dos logs e devolve
+    no cabeçalho da resposta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for nome, valor in scope.get("headers", ()):
+            if nome == b"x-request-id":
+                request_id = valor.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                mensagem.setdefault("headers", [])
+                mensagem["headers"] = list(mensagem["headers"]) + [
+                    (b"x-request-id", request_id.encode("latin-1"))]
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            request_id_var.reset(token)
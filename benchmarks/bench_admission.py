@@ -0,0 +1,111 @@
+"""
+Benchmark de goodput sob sobrecarga (controle de admissão), offline.
+
+O Gemini falso atende no máximo --capacidade chamadas ao mesmo tempo (o
+excesso espera do lado do "provedor", como acontece com uma cota saturada).
+Requisições chegam em malha aberta a --taxa por segundo, acima da
+capacidade; cada cliente desiste depois de --prazo segundos, mas o servidor
+continua processando o que já aceitou (como numa desconexão HTTP comum).
+
+Compara o servidor sem limite (tudo vai para o modelo) com o controle de
+admissão (vagas = capacidade, fila limitada, recusa antecipada pelo prazo).
+Goodput = respostas entregues dentro do prazo por segundo.
+
+Uso:
+    python -m benchmarks.bench_admission [--taxa 120] [--duracao 10]
+        [--capacidade 20] [--servico 0.3] [--prazo 2.0]
+"""
+import os
+import time
+import asyncio
+import logging
+import argparse
+
+os.environ.setdefault("PIPEFY_ACCESS_TOKEN", "SIMULACAO")
+os.environ.setdefault("GEMINI_API_KEY", "chave-falsa")
+
+from fastapi import HTTPException  # noqa: E402
+
+from app.fakes.gemini import FakeGeminiClient  # noqa: E402
+from app.services import gemini_agent  # noqa: E402
+from app.services.admission import ControleDeAdmissao, prazo_var  # noqa: E402
+
+
+def _fake_com_capacidade(capacidade, servico):
+    fake = FakeGeminiClient(latencia=servico)
+    original = fake.aio.models.generate_content
+    vagas = asyncio.Semaphore(capacidade)
+
+    async def generate_content(*args, **kwargs):
+        async with vagas:
+            return await original(*args, **kwargs)
+    fake.aio.models.generate_content = generate_content
+    return fake
+
+
+async def _rodar(controle, args):
+    gemini_agent.client = _fake_com_capacidade(args.capacidade, args.servico)
+    gemini_agent.controle_admissao = controle
+    historico = [{"role": "user", "parts": [{"text": "Olá, quero saber mais."}]}]
+    resultado = {"ok": 0, "recusadas": 0, "estouraram": 0, "latencias": []}
+
+    async def requisicao():
+        prazo_var.set(time.monotonic() + args.prazo)
+        inicio = time.perf_counter()
+        servidor = asyncio.ensure_future(gemini_agent.run_gemini_agent(historico))
+        feitos, _ = await asyncio.wait({servidor}, timeout=args.prazo)
+        if not feitos:
+            # O cliente desistiu; o servidor segue com a chamada já aceita
+            resultado["estouraram"] += 1
+            return servidor
+        try:
+            servidor.result()
+            resultado["ok"] += 1
+            resultado["latencias"].append(time.perf_counter() - inicio)
+        except HTTPException as e:
+            resultado["recusadas" if e.status_code == 429 else "estouraram"] += 1
+        return None
+
+    tarefas = []
+    intervalo = 1 / args.taxa
+    inicio = time.perf_counter()
+    for i in range(int(args.taxa * args.duracao)):
+        atraso = inicio + i * intervalo - time.perf_counter()
+        if atraso > 0:
+            await asyncio.sleep(atraso)
+        tarefas.append(asyncio.ensure_future(requisicao()))
+    abandonadas = [t for t in await asyncio.gather(*tarefas) if t is not None]
+    for tarefa in abandonadas:
+        tarefa.cancel()
+    await asyncio.gather(*abandonadas, return_exceptions=True)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--taxa", type=float, default=120, help="Requisições por segundo.")
+    parser.add_argument("--duracao", type=float, default=10)
+    parser.add_argument("--capacidade", type=int, default=20,
+                        help="Chamadas simultâneas que o modelo falso atende.")
+    parser.add_argument("--servico", type=float, default=0.3, help="Duração de cada chamada (s).")
+    parser.add_argument("--prazo", type=float, default=2.0, help="Quanto o cliente espera (s).")
+    args = parser.parse_args()
+    logging.getLogger("app").setLevel(logging.CRITICAL)
+
+    capacidade_rps = args.capacidade / args.servico
+    print(f"oferta {args.taxa:.0f} req/s para capacidade ~{capacidade_rps:.0f} req/s, "
+          f"prazo {args.prazo}s")
+    for nome, controle in (
+            ("sem limite", ControleDeAdmissao(limite=0)),
+            ("admissão", ControleDeAdmissao(limite=args.capacidade, fila_max=4 * args.capacidade,
+                                            espera_max=args.prazo))):
+        r = asyncio.run(_rodar(controle, args))
+        lat = sorted(r["latencias"])
+        p95 = round(lat[int(0.95 * (len(lat) - 1))] * 1000) if lat else None
+        print(f"  {nome:11} goodput {r['ok'] / args.duracao:6.1f} req/s | ok {r['ok']:>5} | "
+              f"429 {r['recusadas']:>5} | estouraram o prazo {r['estouraram']:>5} | p95 ok {p95} ms")
+
+
+if __name__ == "__main__":
+    main()
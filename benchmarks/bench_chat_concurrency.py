@@ -0,0 +1,69 @@
+"""
+Benchmark de concorrência do /chat contra um Gemini falso.
+
+Compara a rota assíncrona atual (client.aio) com a rota síncrona antiga,
+que prende um worker do threadpool do Starlette (40 por padrão) durante
+toda a chamada ao modelo.
+
+Uso:
+    python -m benchmarks.bench_chat_concurrency [--latencia 0.2] [--concorrencia 40 200 500]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app.fakes.gemini import FakeGeminiClient
+from app.services import gemini_agent
+from app.main import app, AgentRequest, AgentResponse
+
+
+def _registrar_rota_legada(fake):
+    """Rota equivalente ao chat() síncrono anterior (generate_content bloqueante)."""
+    @app.post("/chat-legado", response_model=AgentResponse)
+    def chat_legado(request: AgentRequest):
+        history = request.history or []
+        history.append({"role": "user", "parts": [{"text": request.prompt}]})
+        response = fake.models.generate_content(
+            model=gemini_agent.MODEL_NAME, contents=history)
+        history.append({"role": "model", "parts": [{"text": response.text}]})
+        return AgentResponse(response=response.text, history=history)
+
+
+async def _disparar(rota: str, concorrencia: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        inicio = time.perf_counter()
+        respostas = await asyncio.gather(*[
+            http.post(rota, json={"prompt": "oi"}) for _ in range(concorrencia)
+        ])
+        duracao = time.perf_counter() - inicio
+    falhas = sum(1 for r in respostas if r.status_code != 200)
+    if falhas:
+        raise RuntimeError(f"{falhas} requisições falharam em {rota}")
+    return duracao
+
+
+async def main(latencia: float, niveis):
+    fake = FakeGeminiClient(latencia=latencia)
+    gemini_agent.client = fake
+    _registrar_rota_legada(fake)
+
+    print(f"Latência simulada do modelo: {latencia * 1000:.0f} ms")
+    print(f"{'concorrência':>12} | {'rota':>12} | {'tempo (s)':>9} | {'req/s':>8}")
+    for n in niveis:
+        for rota in ("/chat-legado", "/chat"):
+            duracao = await _disparar(rota, n)
+            print(f"{n:>12} | {rota:>12} | {duracao:>9.2f} | {n / duracao:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latencia", type=float, default=0.2,
+                        help="Latência do modelo falso em segundos.")
+    parser.add_argument("--concorrencia", type=int, nargs="+",
+                        default=[40, 200, 500])
+    args = parser.parse_args()
+    asyncio.run(main(args.latencia, args.concorrencia))
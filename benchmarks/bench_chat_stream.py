@@ -0,0 +1,122 @@
+"""
+Benchmark do /chat/stream (SSE) contra um Gemini falso em streaming.
+
+Mede separadamente o tempo até o primeiro byte (primeiro evento SSE), o
+tempo até o primeiro token de texto e a latência total, comparando com a
+latência do /chat, que só responde com a geração completa. Com
+--ferramenta, o modelo falso chama registrar_lead antes de responder.
+
+Uso:
+    python -m benchmarks.bench_chat_stream [--latencia 0.3] [--intervalo-chunk 0.05] [--requisicoes 20] [--ferramenta]
+"""
+import os
+import time
+import socket
+import asyncio
+import argparse
+import threading
+import statistics
+
+os.environ.setdefault("PIPEFY_ACCESS_TOKEN", "SIMULACAO")
+
+import httpx
+import uvicorn
+
+from app.fakes.gemini import FakeGeminiClient, resposta_chamadas, resposta_texto
+from app.services import gemini_agent
+from app.main import app
+
+TEXTO = ("Perfeito! Seu cadastro foi registrado. Tenho horários disponíveis "
+         "amanhã às 10h, às 14h e às 16h. Qual deles fica melhor para você?")
+
+LEAD = {"nome": "Ana Souza", "email": "ana@exemplo.com",
+        "empresa": "Exemplo", "necessidade": "Implementar IA"}
+
+
+def _roteiro(contents, config):
+    # Primeiro salto do turno: chama a ferramenta; depois responde em texto
+    ultima = contents[-1]
+    if ultima.role == "user" and ultima.parts[0].text:
+        return resposta_chamadas([("registrar_lead", LEAD)])
+    return resposta_texto(TEXTO)
+
+
+def _subir_servidor():
+    """
+    uvicorn real numa thread: o ASGITransport do httpx acumula o corpo
+    inteiro antes de devolver, o que esconderia o ganho do streaming.
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        porta = s.getsockname()[1]
+    servidor = uvicorn.Server(uvicorn.Config(
+        app, host="127.0.0.1", port=porta, log_level="warning", lifespan="off"))
+    threading.Thread(target=servidor.run, daemon=True).start()
+    while not servidor.started:
+        time.sleep(0.01)
+    return servidor, f"http://127.0.0.1:{porta}"
+
+
+async def _stream(http):
+    inicio = time.perf_counter()
+    primeiro_byte = primeiro_token = None
+    eventos = {}
+    async with http.stream("POST", "/chat/stream", json={"prompt": "oi"}) as r:
+        r.raise_for_status()
+        async for linha in r.aiter_lines():
+            agora = time.perf_counter() - inicio
+            if primeiro_byte is None:
+                primeiro_byte = agora
+            if linha.startswith("event: "):
+                nome = linha[len("event: "):]
+                eventos[nome] = eventos.get(nome, 0) + 1
+                if nome == "token" and primeiro_token is None:
+                    primeiro_token = agora
+                if nome == "erro":
+                    raise RuntimeError("O streaming terminou com evento de erro.")
+    return primeiro_byte, primeiro_token, time.perf_counter() - inicio, eventos
+
+
+async def _completo(http):
+    inicio = time.perf_counter()
+    r = await http.post("/chat", json={"prompt": "oi"})
+    r.raise_for_status()
+    return time.perf_counter() - inicio
+
+
+def _ms(valores):
+    return f"p50 {statistics.median(valores) * 1000:7.1f} ms | max {max(valores) * 1000:7.1f} ms"
+
+
+async def main(args):
+    gemini_agent.client = FakeGeminiClient(
+        latencia=args.latencia, texto=TEXTO, intervalo_chunk=args.intervalo_chunk,
+        roteiro=_roteiro if args.ferramenta else None)
+
+    servidor, url = _subir_servidor()
+    try:
+        async with httpx.AsyncClient(base_url=url, timeout=None) as http:
+            medidas = [await _stream(http) for _ in range(args.requisicoes)]
+            completos = [await _completo(http) for _ in range(args.requisicoes)]
+    finally:
+        servidor.should_exit = True
+
+    print(f"Modelo falso: {args.latencia * 1000:.0f} ms até o 1º chunk, "
+          f"{args.intervalo_chunk * 1000:.0f} ms entre chunks"
+          + (", com registrar_lead" if args.ferramenta else ""))
+    print(f"eventos por requisição: {medidas[0][3]}")
+    print(f"/chat/stream  1º byte : {_ms([m[0] for m in medidas])}")
+    print(f"/chat/stream  1º token: {_ms([m[1] for m in medidas])}")
+    print(f"/chat/stream  total   : {_ms([m[2] for m in medidas])}")
+    print(f"/chat         total   : {_ms(completos)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latencia", type=float, default=0.3,
+                        help="Tempo até o primeiro chunk do modelo falso (s).")
+    parser.add_argument("--intervalo-chunk", type=float, default=0.05)
+    parser.add_argument("--requisicoes", type=int, default=20)
+    parser.add_argument("--ferramenta", action="store_true")
+    asyncio.run(main(parser.parse_args()))
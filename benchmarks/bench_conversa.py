@@ -0,0 +1,110 @@
+"""
+Benchmark da compilação do histórico para o SDK.
+
+Para conversas de tamanhos crescentes, compara o custo por turno de:
+
+- "reconstruir": converter o histórico inteiro de dicts para types.Content
+  a cada turno (como _montar_requisicao fazia);
+- "incremental": ConversaCompilada da sessão, anexando só as mensagens novas.
+
+Também mede a memória extra que a conversa compilada ocupa (tracemalloc),
+em relação ao JSON guardado no session store. Como no store, ela é
+montada a partir do JSON: os dicts de wire que a conversa guarda entram na
+conta (é o _FATOR_CONVERSA_COMPILADA de app/services/session_store.py).
+
+Uso:
+    python -m benchmarks.bench_conversa [--tamanhos 10,50,200] [--repeticoes 50]
+"""
+import json
+import time
+import argparse
+import tracemalloc
+import statistics
+
+from app.services.conversa import ConversaCompilada
+
+
+def _turno(i):
+    """Um turno SDR típico: usuário, chamada de ferramenta, resultado, resposta."""
+    return [
+        {"role": "user", "parts": [{"text": f"Mensagem {i} do lead com algum contexto a mais."}]},
+        {"role": "model", "parts": [{"functionCall": {
+            "name": "oferecer_horarios", "args": {"card_id": str(1000 + i)}}}]},
+        {"role": "tool", "parts": [{"functionResponse": {
+            "name": "oferecer_horarios",
+            "response": {"result": json.dumps({"slots": ["2026-10-19T10:00", "2026-10-19T11:00"]})}}}]},
+        {"role": "model", "parts": [{"text": f"Resposta {i} do agente com os horários."}]},
+    ]
+
+
+def _historico(n_mensagens):
+    mensagens = []
+    i = 0
+    while len(mensagens) < n_mensagens:
+        mensagens.extend(_turno(i))
+        i += 1
+    return mensagens[:n_mensagens]
+
+
+def _mediana_us(func, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos) * 1e6
+
+
+def medir(n, repeticoes):
+    historico = _historico(n)
+    novas = _turno(n)
+    base = ConversaCompilada(historico)
+
+    def reconstruir():
+        ConversaCompilada(historico + novas).contents()
+
+    def incremental():
+        conversa = base.bifurcar()
+        conversa.estender(novas)
+        conversa.contents()
+
+    guardado = [(m["role"], json.dumps(m["parts"], ensure_ascii=False)) for m in historico]
+    tracemalloc.start()
+    antes = tracemalloc.take_snapshot()
+    conversa = ConversaCompilada(({"role": role, "parts": json.loads(partes)}
+                                  for role, partes in guardado), validadas=True)
+    depois = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    memoria = sum(s.size_diff for s in depois.compare_to(antes, "filename"))
+    json_bytes = sum(len(partes.encode("utf-8")) for _, partes in guardado)
+    del conversa
+
+    return {
+        "mensagens": n,
+        "reconstruir_us": round(_mediana_us(reconstruir, repeticoes), 1),
+        "incremental_us": round(_mediana_us(incremental, repeticoes), 1),
+        "memoria_bytes": memoria,
+        "json_bytes": json_bytes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanhos", default="10,50,200")
+    parser.add_argument("--repeticoes", type=int, default=50)
+    args = parser.parse_args()
+
+    # Aquece o import do SDK fora das medições
+    ConversaCompilada(_turno(0)).contents()
+    for n in (int(t) for t in args.tamanhos.split(",")):
+        r = medir(n, args.repeticoes)
+        print(f"{r['mensagens']:>5} mensagens: reconstruir {r['reconstruir_us']:>9} µs | "
+              f"incremental {r['incremental_us']:>7} µs "
+              f"({r['reconstruir_us'] / r['incremental_us']:.1f}x) | "
+              f"compilada {r['memoria_bytes'] / 1024:.0f} KiB "
+              f"({r['memoria_bytes'] / r['json_bytes']:.1f}x o JSON)")
+
+
+if __name__ == "__main__":
+    main()
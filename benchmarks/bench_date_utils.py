@@ -0,0 +1,125 @@
+"""
+Microbenchmark de normalizar_data: caminho rápido + cache vs dateparser puro.
+
+1. Confere, para cada entrada de benchmarks/dados/corpus_datas.txt, que a
+   nova implementação devolve exatamente o mesmo que a anterior (dateparser
+   direto) — ou falha nos mesmos casos.
+2. Confere os formatos que o dateparser não entende ("dia 9 de novembro às
+   20h", "19h30"), que o caminho rápido passou a tratar.
+3. Mede a vazão das duas implementações (com e sem cache).
+
+Uso:
+    python -m benchmarks.bench_date_utils [--repeticoes 2000]
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import date
+
+import dateparser
+
+from app.utils import date_utils
+from app.utils.date_utils import normalizar_data, normalizar_datas
+
+CORPUS = os.path.join(os.path.dirname(__file__), "dados", "corpus_datas.txt")
+
+# Formatos em que o dateparser falhava ou devolvia lixo (ex.: "19h" como +19 horas)
+CORRIGIDOS = {
+    "dia 9 de novembro de 2027 às 20h": "2027-11-09T20:00:00",
+    "9 de Novembro de 2027 às 8h": "2027-11-09T08:00:00",
+    "dia 9 de nov de 2027 às 20h30": "2027-11-09T20:30:00",
+    "dia 1 de março de 2027, 14:30": "2027-03-01T14:30:00",
+    "21/10/2025 às 19h": "2025-10-21T19:00:00",
+    "21/10/2025 às 19h30": "2025-10-21T19:30:00",
+}
+
+
+def normalizar_data_anterior(texto_data):
+    """Implementação anterior: sempre dateparser."""
+    if not texto_data or not isinstance(texto_data, str):
+        raise ValueError("Data inválida ou vazia.")
+    parsed_date = dateparser.parse(texto_data.replace('às', ' '), languages=['pt'], settings={
+        'TIMEZONE': 'America/Sao_Paulo', 'RETURN_AS_TIMEZONE_AWARE': False,
+        'PREFER_DATES_FROM': 'future'})
+    if not parsed_date:
+        raise ValueError(f"Não foi possível interpretar a data: {texto_data}")
+    return parsed_date.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _ou_erro(func, texto):
+    try:
+        return func(texto)
+    except ValueError:
+        return "<erro>"
+
+
+def _ler_corpus():
+    with open(CORPUS, encoding="utf-8") as arquivo:
+        return [l.rstrip("\n") for l in arquivo if l.strip() and not l.startswith("#")]
+
+
+def _sem_relogio(valor):
+    # Entradas relativas ("amanhã") herdam a hora atual: compara só até o minuto
+    return valor[:16] if valor != "<erro>" else valor
+
+
+def verificar(corpus):
+    divergencias = 0
+    for texto in corpus:
+        antes, depois = _ou_erro(normalizar_data_anterior, texto), _ou_erro(normalizar_data, texto)
+        if _sem_relogio(antes) != _sem_relogio(depois):
+            divergencias += 1
+            print(f"  DIVERGE {texto!r}: anterior={antes} novo={depois}")
+    for texto, esperado in CORRIGIDOS.items():
+        obtido = _ou_erro(normalizar_data, texto)
+        if obtido != esperado:
+            divergencias += 1
+            print(f"  ERRADO {texto!r}: esperado={esperado} obtido={obtido}")
+    # Sem ano: próxima ocorrência a partir de hoje
+    hoje = date.today()
+    mes = [nome for nome, numero in date_utils._MESES.items() if numero == hoje.month][0]
+    obtido = normalizar_data(f"dia {hoje.day} de {mes} às 20h")
+    if obtido != hoje.strftime("%Y-%m-%dT20:00:00"):
+        divergencias += 1
+        print(f"  ERRADO data sem ano (hoje): {obtido}")
+    print(f"Corpus: {len(corpus)} entradas idênticas, {len(CORRIGIDOS) + 1} corrigidas, "
+          f"{divergencias} divergências.")
+    return divergencias
+
+
+def medir(nome, func, entradas):
+    inicio = time.perf_counter()
+    for texto in entradas:
+        _ou_erro(func, texto)
+    duracao = time.perf_counter() - inicio
+    print(f"{nome:>34} | {len(entradas) / duracao:>11.0f} chamadas/s | {duracao * 1e6 / len(entradas):>8.1f} µs/chamada")
+
+
+def main(repeticoes):
+    corpus = _ler_corpus()
+    divergencias = verificar(corpus)
+
+    comuns = [t for t in corpus if date_utils._caminho_rapido(t.strip(), date.today())]
+    entradas = (comuns * (repeticoes // len(comuns) + 1))[:repeticoes]
+    # Mesmo conjunto com textos únicos, para medir o caminho rápido sem cache
+    unicas = [f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:00"
+              for i in range(repeticoes)]
+
+    print(f"\n{repeticoes} chamadas em formatos comuns:")
+    medir("anterior (dateparser)", normalizar_data_anterior, entradas)
+    date_utils._normalizar_em_cache.cache_clear()
+    medir("novo, entradas únicas (sem cache)", normalizar_data, unicas)
+    medir("novo, entradas repetidas (cache)", normalizar_data, entradas)
+    inicio = time.perf_counter()
+    normalizar_datas(entradas, ignorar_erros=True)
+    print(f"{'normalizar_datas (lote)':>34} | {repeticoes / (time.perf_counter() - inicio):>11.0f} chamadas/s")
+    return divergencias
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticoes", type=int, default=2000)
+    args = parser.parse_args()
+    sys.exit(1 if main(args.repeticoes) else 0)
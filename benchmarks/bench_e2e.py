@@ -0,0 +1,278 @@
+"""
+Teste de carga ponta a ponta, offline.
+
+Sobe a API (uvicorn real) com um Gemini falso roteirizado (latência com
+distribuição configurável, chamando registrar_lead, oferecer_horarios e
+agendar_reuniao) e o servidor GraphQL falso do Pipefy. Usuários virtuais
+conduzem conversas SDR completas de três turnos em modo sessão.
+
+Relata p50/p95/p99, requisições por segundo e a quebra por etapa (modelo,
+cada ferramenta, restante do servidor) e grava tudo em JSON. Com
+--comparar, confronta o resultado com uma baseline gravada antes e sai com
+código 1 se o p95 ou o RPS piorarem além da tolerância.
+
+Uso:
+    python -m benchmarks.bench_e2e [--conversas 200] [--concorrencia 20]
+        [--latencia lognormal:0.3:0.4] [--pipefy-latencia 0.02]
+        [--saida benchmarks/resultados/e2e.json] [--comparar benchmarks/resultados/e2e_baseline.json]
+        [--tolerancia 0.15]
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from datetime import datetime
+
+from app.fakes.pipefy_server import FakePipefyServer
+
+
+def _resumo(amostras):
+    """Latências em segundos -> estatísticas em ms."""
+    if not amostras:
+        return {"n": 0}
+    ordenadas = sorted(amostras)
+
+    def p(q):
+        return round(ordenadas[min(len(ordenadas) - 1, int(q * len(ordenadas)))] * 1000, 2)
+    return {"n": len(ordenadas), "p50": p(0.50), "p95": p(0.95), "p99": p(0.99),
+            "media": round(statistics.fmean(ordenadas) * 1000, 2),
+            "max": round(ordenadas[-1] * 1000, 2)}
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _preparar_ambiente(pipefy_url, pasta, hosts):
+    # Precisa acontecer antes de importar a API: a configuração é lida no import
+    os.environ.update({
+        "PIPEFY_ACCESS_TOKEN": "token-falso",
+        "PIPE_ID": "1",
+        "PIPEFY_URL": pipefy_url,
+        "PIPEFY_OUTBOX_PATH": os.path.join(pasta, "outbox.sqlite3"),
+        "PIPEFY_FIELD_CACHE_PATH": os.path.join(pasta, "pipefy_fields.json"),
+        "LEAD_INDEX_PATH": os.path.join(pasta, "lead_index.sqlite3"),
+        "AGENDA_PATH": os.path.join(pasta, "agenda.sqlite3"),
+        "AGENDA_HOSTS": ",".join(f"host{i}" for i in range(hosts)),
+        "GEMINI_API_KEY": "chave-falsa",
+    })
+
+
+class _Etapas:
+    """Durações por etapa, coletadas por embrulhos no modelo e nas ferramentas."""
+
+    def __init__(self):
+        self.duracoes = {}
+
+    def registrar(self, etapa, segundos):
+        self.duracoes.setdefault(etapa, []).append(segundos)
+
+    def cronometrar(self, etapa, func):
+        async def embrulho(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.registrar(etapa, time.perf_counter() - inicio)
+        return embrulho
+
+
+def _instrumentar(etapas, latencia):
+    from app.fakes.gemini import FakeGeminiClient, Latencia
+    from app.fakes.roteiro_sdr import roteiro_sdr
+    from app.services import gemini_agent
+
+    fake = FakeGeminiClient(latencia=Latencia.de_texto(latencia), roteiro=roteiro_sdr)
+    fake.aio.models.generate_content = etapas.cronometrar(
+        "modelo", fake.aio.models.generate_content)
+    gemini_agent.client = fake
+    for nome, ferramenta in list(gemini_agent.ASYNC_TOOLS.items()):
+        gemini_agent.ASYNC_TOOLS[nome] = etapas.cronometrar(f"ferramenta:{nome}", ferramenta)
+    return fake
+
+
+def _subir_api():
+    import uvicorn
+    from app.main import app
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        porta = s.getsockname()[1]
+    servidor = uvicorn.Server(uvicorn.Config(
+        app, host="127.0.0.1", port=porta, log_level="warning"))
+    threading.Thread(target=servidor.run, daemon=True).start()
+    while not servidor.started:
+        time.sleep(0.01)
+    return servidor, f"http://127.0.0.1:{porta}"
+
+
+async def _usuario(http, fila, turnos, falhas):
+    from app.fakes.roteiro_sdr import mensagens_do_lead
+
+    while True:
+        try:
+            i = fila.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        try:
+            sessao = (await http.post("/sessions")).json()["session_id"]
+            for n, prompt in enumerate(mensagens_do_lead(i), 1):
+                inicio = time.perf_counter()
+                r = await http.post("/chat", json={"prompt": prompt, "session_id": sessao})
+                duracao = time.perf_counter() - inicio
+                if r.status_code != 200:
+                    falhas.append(f"turno {n}: HTTP {r.status_code}")
+                    break
+                turnos.setdefault(n, []).append(duracao)
+            await http.delete(f"/sessions/{sessao}")
+        except Exception as e:
+            falhas.append(repr(e))
+
+
+async def _carga(url, conversas, concorrencia):
+    import httpx
+
+    fila = asyncio.Queue()
+    for i in range(conversas):
+        fila.put_nowait(i)
+    turnos, falhas = {}, []
+    limites = httpx.Limits(max_connections=concorrencia, max_keepalive_connections=concorrencia)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limites) as http:
+        inicio = time.perf_counter()
+        await asyncio.gather(*[_usuario(http, fila, turnos, falhas)
+                               for _ in range(concorrencia)])
+        duracao = time.perf_counter() - inicio
+    return turnos, falhas, duracao
+
+
+def _aguardar_outbox(timeout=30.0):
+    from app.services import outbox
+    if not outbox.PIPEFY_WRITE_BEHIND or outbox._outbox is None:
+        return 0
+    limite = time.time() + timeout
+    while outbox._outbox.pendentes() and time.time() < limite:
+        time.sleep(0.1)
+    return outbox._outbox.pendentes()
+
+
+def comparar(atual, baseline, tolerancia):
+    """Devolve as regressões (lista de textos) do resultado atual frente à baseline."""
+    regressoes = []
+    p95_antes = baseline["latencia_ms"]["p95"]
+    p95_agora = atual["latencia_ms"]["p95"]
+    print(f"p95: {p95_antes} ms -> {p95_agora} ms "
+          f"({(p95_agora / p95_antes - 1) * 100:+.1f}%)")
+    if p95_agora > p95_antes * (1 + tolerancia):
+        regressoes.append("p95")
+    rps_antes, rps_agora = baseline["rps"], atual["rps"]
+    print(f"RPS: {rps_antes} -> {rps_agora} ({(rps_agora / rps_antes - 1) * 100:+.1f}%)")
+    if rps_agora < rps_antes * (1 - tolerancia):
+        regressoes.append("rps")
+    for etapa, dados in atual["por_etapa"].items():
+        antes = baseline.get("por_etapa", {}).get(etapa)
+        if antes and antes.get("n") and dados.get("n"):
+            print(f"  {etapa:32} p95 {antes['p95']:>9} -> {dados['p95']:>9} ms")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversas", type=int, default=200)
+    parser.add_argument("--concorrencia", type=int, default=20)
+    parser.add_argument("--latencia", default="lognormal:0.3:0.4",
+                        help="Distribuição do modelo falso: tipo:media[:desvio].")
+    parser.add_argument("--pipefy-latencia", type=float, default=0.02)
+    parser.add_argument("--pipefy-taxa-falha", type=float, default=0.0)
+    parser.add_argument("--hosts", type=int, default=20,
+                        help="Anfitriões da agenda (cada conversa reserva um horário).")
+    parser.add_argument("--semente", type=int, default=42,
+                        help="Semente das latências sorteadas (execuções comparáveis).")
+    parser.add_argument("--saida", help="Arquivo JSON com o resultado.")
+    parser.add_argument("--comparar", help="Baseline JSON para comparação.")
+    parser.add_argument("--tolerancia", type=float, default=0.15)
+    args = parser.parse_args()
+    random.seed(args.semente)
+
+    pipefy = FakePipefyServer(latencia=args.pipefy_latencia,
+                              taxa_falha=args.pipefy_taxa_falha).iniciar()
+    _preparar_ambiente(pipefy.url, tempfile.mkdtemp(prefix="bench_e2e_"), args.hosts)
+
+    etapas = _Etapas()
+    fake = _instrumentar(etapas, args.latencia)
+    servidor, url = _subir_api()
+    try:
+        turnos, falhas, duracao = asyncio.run(
+            _carga(url, args.conversas, args.concorrencia))
+        pendentes = _aguardar_outbox()
+    finally:
+        servidor.should_exit = True
+        pipefy.parar()
+
+    todas = [d for valores in turnos.values() for d in valores]
+    total_modelo = sum(etapas.duracoes.get("modelo", []))
+    total_ferramentas = sum(sum(v) for k, v in etapas.duracoes.items()
+                            if k.startswith("ferramenta:"))
+    resultado = {
+        "commit": _commit(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("saida", "comparar")},
+        "requisicoes": len(todas),
+        "falhas": len(falhas),
+        "duracao_s": round(duracao, 3),
+        "rps": round(len(todas) / duracao, 2),
+        "latencia_ms": _resumo(todas),
+        "por_turno": {f"turno_{n}": _resumo(v) for n, v in sorted(turnos.items())},
+        "por_etapa": {etapa: _resumo(v) for etapa, v in sorted(etapas.duracoes.items())},
+        # Fração do tempo das requisições gasta fora do modelo e das ferramentas
+        "restante_servidor_ms_por_req": round(
+            max(0.0, sum(todas) - total_modelo - total_ferramentas) / max(1, len(todas)) * 1000, 2),
+        "chamadas_modelo": fake.chamadas,
+        "pipefy": pipefy.estado.resumo(),
+        "outbox_pendentes": pendentes,
+    }
+
+    lat = resultado["latencia_ms"]
+    print(f"{resultado['requisicoes']} requisições ({args.conversas} conversas, "
+          f"{args.concorrencia} usuários) em {duracao:.2f} s -> {resultado['rps']} req/s, "
+          f"{len(falhas)} falhas")
+    print(f"latência: p50 {lat.get('p50')} | p95 {lat.get('p95')} | p99 {lat.get('p99')} ms")
+    for nome, dados in {**resultado["por_turno"], **resultado["por_etapa"]}.items():
+        print(f"  {nome:32} p50 {dados.get('p50'):>9} | p95 {dados.get('p95'):>9} | n={dados['n']}")
+    print(f"  {'restante do servidor (média)':32} {resultado['restante_servidor_ms_por_req']} ms/req")
+    print(f"Pipefy falso: {resultado['pipefy']['por_operacao']}, outbox pendente: {pendentes}")
+    if falhas:
+        print(f"primeiras falhas: {falhas[:3]}")
+
+    if args.saida:
+        pasta = os.path.dirname(args.saida)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+        print(f"resultado gravado em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            regressoes = comparar(resultado, json.load(arquivo), args.tolerancia)
+        if regressoes:
+            print(f"REGRESSÃO acima de {args.tolerancia:.0%}: {', '.join(regressoes)}")
+            sys.exit(1)
+    if falhas:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
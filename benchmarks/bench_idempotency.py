@@ -0,0 +1,133 @@
+"""
+Benchmark de uma tempestade de retentativas no /chat, offline.
+
+Cada lead faz a conversa SDR completa (Gemini falso com o roteiro, Pipefy
+falso local). No último turno ("pode ser o primeiro horário", que chama
+agendar_reuniao) o cliente não espera a resposta: reenvia a mesma
+requisição a cada --intervalo segundos enquanto a original roda, e mais uma
+vez depois que ela termina, como um app móvel ou webhook com timeout curto.
+
+Compara, sem e com Idempotency-Key: chamadas ao modelo, execuções de
+agendar_reuniao, reservas na agenda e mutations updateFieldsValues no Pipefy
+durante esse turno.
+
+Uso:
+    python -m benchmarks.bench_idempotency [--leads 50] [--repeticoes 4]
+        [--intervalo 0.25] [--latencia fixa:0.4]
+"""
+import os
+import uuid
+import asyncio
+import logging
+import argparse
+import tempfile
+
+import httpx
+
+from app.fakes.pipefy_server import FakePipefyServer
+
+
+def _preparar_ambiente(pasta, url):
+    # Precisa acontecer antes de importar a API: a configuração é lida no import
+    os.environ.update({
+        "PIPEFY_ACCESS_TOKEN": "token-falso",
+        "PIPEFY_PRE_SALES_PIPE_ID": "1",
+        "PIPEFY_URL": url,
+        "PIPEFY_WRITE_BEHIND": "0",
+        "PIPEFY_FIELD_CACHE_PATH": os.path.join(pasta, "pipefy_fields.json"),
+        "LEAD_INDEX_PATH": os.path.join(pasta, "lead_index.sqlite3"),
+        "AGENDA_PATH": os.path.join(pasta, "agenda.sqlite3"),
+        "AGENDA_HOSTS": ",".join(f"host{i}" for i in range(20)),
+        "GEMINI_API_KEY": "chave-falsa",
+    })
+
+
+async def _conversa_ate_o_ultimo_turno(http, falas):
+    history = []
+    for fala in falas[:-1]:
+        r = await http.post("/chat", json={"prompt": fala, "history": history})
+        history = r.json()["history"]
+    return history
+
+
+async def _tempestade(http, fala, history, com_chave, args):
+    corpo = {"prompt": fala, "history": history}
+    headers = {"Idempotency-Key": uuid.uuid4().hex} if com_chave else {}
+    tentativas = []
+    for _ in range(args.repeticoes):
+        tentativas.append(asyncio.ensure_future(http.post("/chat", json=corpo, headers=headers)))
+        await asyncio.sleep(args.intervalo)
+    respostas = await asyncio.gather(*tentativas)
+    # Mais uma depois que a original já terminou
+    respostas.append(await http.post("/chat", json=corpo, headers=headers))
+    return ({r.json()["response"] for r in respostas if r.status_code == 200},
+            sum(r.headers.get("Idempotent-Replayed") == "true" for r in respostas))
+
+
+async def _cenario(com_chave, primeiro_lead, app, fake, srv, contadores, args):
+    from app.fakes.roteiro_sdr import mensagens_do_lead
+    from app.services.availability import get_agenda
+
+    def medir():
+        return (fake.chamadas, contadores["agendar"],
+                srv.estado.por_operacao.get("UpdateCardFields", 0), _reservas(get_agenda()))
+
+    falas = [mensagens_do_lead(primeiro_lead + i) for i in range(args.leads)]
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=None) as http:
+        historicos = await asyncio.gather(*[_conversa_ate_o_ultimo_turno(http, f) for f in falas])
+        # Só o turno final (o da tempestade) entra na conta
+        antes = medir()
+        resultados = await asyncio.gather(*[
+            _tempestade(http, f[-1], h, com_chave, args) for f, h in zip(falas, historicos)])
+    return [d - a for a, d in zip(antes, medir())], resultados
+
+
+def _reservas(agenda):
+    return agenda._conn.execute("SELECT COUNT(*) FROM blocos WHERE tipo = 'reserva'").fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=50)
+    parser.add_argument("--repeticoes", type=int, default=4,
+                        help="Envios do último turno enquanto a original roda.")
+    parser.add_argument("--intervalo", type=float, default=0.25)
+    parser.add_argument("--latencia", default="fixa:0.4", help="Latência do Gemini falso.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta, FakePipefyServer() as srv:
+        _preparar_ambiente(pasta, srv.url)
+        from app.main import app
+        logging.getLogger("app").setLevel(logging.ERROR)
+        from app.services import gemini_agent
+        from app.fakes.gemini import FakeGeminiClient, Latencia
+        from app.fakes.roteiro_sdr import roteiro_sdr
+
+        fake = FakeGeminiClient(latencia=Latencia.de_texto(args.latencia), roteiro=roteiro_sdr)
+        gemini_agent.client = fake
+        contadores = {"agendar": 0}
+        agendar = gemini_agent.ASYNC_TOOLS["agendar_reuniao"]
+
+        async def agendar_contando(**kwargs):
+            contadores["agendar"] += 1
+            return await agendar(**kwargs)
+        gemini_agent.ASYNC_TOOLS["agendar_reuniao"] = agendar_contando
+
+        envios = args.leads * (args.repeticoes + 1)
+        print(f"{args.leads} leads, {args.repeticoes + 1} envios do último turno por lead "
+              f"({envios} requisições)")
+        for nome, com_chave, primeiro_lead in (("sem chave", False, 0),
+                                               ("Idempotency-Key", True, args.leads)):
+            (modelo, agendamentos, updates, reservas), resultados = asyncio.run(
+                _cenario(com_chave, primeiro_lead, app, fake, srv, contadores, args))
+            divergentes = sum(len(respostas) > 1 for respostas, _ in resultados)
+            repetidas = sum(n for _, n in resultados)
+            print(f"  {nome:16} modelo {modelo:>5} | agendar_reuniao {agendamentos:>4} | "
+                  f"reservas {reservas:>4} | updateFieldsValues {updates:>4} | "
+                  f"repetidas {repetidas:>4} | leads com respostas diferentes {divergentes}")
+
+
+if __name__ == "__main__":
+    main()
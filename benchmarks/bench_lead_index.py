@@ -0,0 +1,127 @@
+"""
+Benchmark do índice local de leads (email/empresa -> card_id).
+
+1. Consulta: popula o índice com N leads (como faria a sincronização) e mede
+   a mediana de uma busca com acerto e com falta, para tamanhos crescentes.
+2. Deduplicação: contra o servidor GraphQL falso, registra cada lead duas
+   vezes (o lead volta ou o modelo repete a chamada) e conta os createCard
+   com e sem o índice. Depois cria cards "por fora" no Pipefy falso e mostra
+   que a sincronização incremental os traz para o índice.
+
+Uso:
+    python -m benchmarks.bench_lead_index [--tamanhos 10000,100000,500000]
+        [--buscas 20000] [--leads 200]
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+from app.fakes.pipefy_server import FakePipefyServer
+from app.services.lead_index import LeadIndex
+
+NECESSIDADES = ("automação", "implementar ia")
+
+
+def _lead(i):
+    return {"nome": f"Lead {i}", "email": f"Lead{i}@Exemplo.com ", "empresa": f"Empresa {i % 997} Ltda.",
+            "necessidade": NECESSIDADES[i % 2]}
+
+
+def _popular(indice, n, pagina=5000):
+    for inicio in range(0, n, pagina):
+        indice.aplicar_pagina(
+            (str(100000 + i), f"lead{i}@exemplo.com", f"Empresa {i % 997} Ltda.",
+             f"2026-01-01T00:00:{i % 60:02d}Z")
+            for i in range(inicio, min(n, inicio + pagina)))
+
+
+def _mediana_us(func, argumentos):
+    tempos = []
+    for args in argumentos:
+        inicio = time.perf_counter()
+        func(*args)
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos) * 1e6
+
+
+def medir_consulta(tamanhos, buscas, pasta):
+    for n in tamanhos:
+        indice = LeadIndex(os.path.join(pasta, f"indice_{n}.sqlite3"))
+        inicio = time.perf_counter()
+        _popular(indice, n)
+        carga = time.perf_counter() - inicio
+        acertos = [(f" LEAD{i}@exemplo.com", f"empresa {i % 997} ltda")
+                   for i in random.sample(range(n), min(buscas, n))]
+        faltas = [(f"outro{i}@exemplo.com", "Empresa 1 Ltda.") for i in range(len(acertos))]
+        hit = _mediana_us(indice.buscar, acertos)
+        miss = _mediana_us(indice.buscar, faltas)
+        tamanho = sum(os.path.getsize(c) for c in (indice.caminho, indice.caminho + "-wal")
+                      if os.path.exists(c)) / 2 ** 20
+        print(f"{n:>8} leads: acerto {hit:5.1f} µs | falta {miss:5.1f} µs | "
+              f"carga {carga:5.1f}s | arquivo {tamanho:5.1f} MiB")
+
+
+def medir_deduplicacao(n_leads, pasta):
+    with FakePipefyServer() as srv:
+        os.environ.update(PIPEFY_URL=srv.url, PIPEFY_ACCESS_TOKEN="bench-token",
+                          PIPEFY_PRE_SALES_PIPE_ID="1")
+        from app.services import lead_index, pipefy_service
+
+        # O índice padrão (data/) já foi configurado no import: usa um temporário
+        lead_index._lead_index = LeadIndex(os.path.join(pasta, "dedup.sqlite3"))
+        pipefy_service._get_field_ids()
+        leads = [_lead(i) for i in range(n_leads)]
+        for nome, ligado in (("sem índice", False), ("com índice", True)):
+            pipefy_service.LEAD_INDEX_ENABLED = ligado
+            antes = srv.estado.por_operacao.get("CreateCard", 0)
+            inicio = time.perf_counter()
+            for _ in range(2):
+                for lead in leads:
+                    pipefy_service.registrar_lead(**lead)
+            duracao = time.perf_counter() - inicio
+            criados = srv.estado.por_operacao.get("CreateCard", 0) - antes
+            print(f"{nome:>11}: {2 * n_leads} chamadas -> {criados} createCard | {duracao:5.2f}s")
+
+        # Cards criados fora desta instância (outro processo, importação, UI)
+        externos = [_lead(n_leads + i) for i in range(n_leads)]
+        ids = pipefy_service._get_field_ids()
+        for lead in externos:
+            srv.estado.novo_card([{"field_id": ids[k], "field_value": lead[k]}
+                                  for k in ("nome", "email", "empresa")])
+        completa = pipefy_service.sincronizar_indice_de_leads(completa=True)
+        for lead in externos[:10]:
+            srv.estado.novo_card([{"field_id": ids["email"], "field_value": "x" + lead["email"]},
+                                  {"field_id": ids["empresa"], "field_value": lead["empresa"]}])
+        antes = srv.estado.requisicoes
+        incremental = pipefy_service.sincronizar_indice_de_leads(completa=False)
+        paginas = srv.estado.requisicoes - antes
+        antes = srv.estado.por_operacao.get("CreateCard", 0)
+        for lead in externos:
+            pipefy_service.registrar_lead(**lead)
+        criados = srv.estado.por_operacao.get("CreateCard", 0) - antes
+        print(f"sincronização completa: {completa['cards']} cards | incremental: "
+              f"{incremental['cards']} cards em {paginas} requisição(ões)")
+        print(f"{n_leads} leads criados por fora e registrados depois da sincronização "
+              f"-> {criados} createCard")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanhos", default="10000,100000,500000")
+    parser.add_argument("--buscas", type=int, default=20000)
+    parser.add_argument("--leads", type=int, default=200)
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.semente)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        medir_consulta([int(t) for t in args.tamanhos.split(",")], args.buscas, pasta)
+        medir_deduplicacao(args.leads, pasta)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark do roteador de modelos (fallback e hedging), offline.
+
+Usa o Gemini falso com latência e falhas por modelo: o principal tem cauda
+longa (lognormal) e falhas ocasionais, o secundário é um pouco mais lento na
+mediana e mais estável. Compara, com a mesma carga:
+
+- "só principal": sem hedge e sem reserva (comportamento anterior);
+- "fallback": reserva só em APIError/tempo limite;
+- "hedge réplica": cópia no próprio principal após o percentil observado;
+- "hedge + fallback": cópia e reserva no secundário.
+
+Relata p50/p95/p99, falhas e o custo extra (chamadas a mais que o número de
+requisições).
+
+Uso:
+    python -m benchmarks.bench_model_router [--requisicoes 600] [--concorrencia 20]
+        [--principal lognormal:0.3:1.0] [--secundario lognormal:0.4:0.25] [--taxa-falha 0.05]
+"""
+import time
+import random
+import asyncio
+import logging
+import argparse
+
+from app.fakes.gemini import FakeGeminiClient, Latencia
+from app.services.model_router import ModelRouter
+
+
+def _percentis(amostras):
+    ordenadas = sorted(amostras)
+    if not ordenadas:
+        return {}
+    return {q: round(ordenadas[min(len(ordenadas) - 1, int(q * len(ordenadas)))] * 1000, 1)
+            for q in (0.5, 0.95, 0.99)}
+
+
+async def _cenario(roteador, fake, requisicoes, concorrencia):
+    fila = asyncio.Queue()
+    for i in range(requisicoes):
+        fila.put_nowait(i)
+    latencias, falhas = [], 0
+
+    async def executar(modelo, principal):
+        return await fake.aio.models.generate_content(model=modelo, contents=[], config=None)
+
+    async def usuario():
+        nonlocal falhas
+        while not fila.empty():
+            fila.get_nowait()
+            inicio = time.perf_counter()
+            try:
+                await roteador.gerar(executar)
+                latencias.append(time.perf_counter() - inicio)
+            except Exception:
+                falhas += 1
+
+    await asyncio.gather(*[usuario() for _ in range(concorrencia)])
+    return latencias, falhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requisicoes", type=int, default=600)
+    parser.add_argument("--concorrencia", type=int, default=20)
+    parser.add_argument("--principal", default="lognormal:0.3:1.0")
+    parser.add_argument("--secundario", default="lognormal:0.4:0.25")
+    parser.add_argument("--taxa-falha", type=float, default=0.05,
+                        help="Fração de chamadas ao principal que terminam em 503.")
+    parser.add_argument("--percentil", type=float, default=0.95,
+                        help="Percentil de latência do principal que dispara o hedge.")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+    # Os avisos de fallback do roteador poluiriam a saída
+    logging.getLogger("app.services.model_router").setLevel(logging.ERROR)
+
+    cenarios = [
+        ("só principal", ["principal"], False),
+        ("fallback", ["principal", "secundario"], False),
+        ("hedge réplica", ["principal"], True),
+        ("hedge + fallback", ["principal", "secundario"], True),
+    ]
+    for nome, modelos, hedge in cenarios:
+        random.seed(args.semente)
+        fake = FakeGeminiClient(
+            latencia_por_modelo={"principal": Latencia.de_texto(args.principal),
+                                 "secundario": Latencia.de_texto(args.secundario)},
+            taxa_falha={"principal": args.taxa_falha})
+        roteador = ModelRouter(modelos, hedge=hedge, percentil=args.percentil)
+        latencias, falhas = asyncio.run(
+            _cenario(roteador, fake, args.requisicoes, args.concorrencia))
+        p = _percentis(latencias)
+        extra = sum(fake.chamadas_por_modelo.values()) / args.requisicoes - 1
+        print(f"{nome:18} p50 {p.get(0.5):>7} | p95 {p.get(0.95):>7} | p99 {p.get(0.99):>7} ms"
+              f" | falhas {falhas:>3} | chamadas extras {extra:+.0%}"
+              f" | atraso do hedge {roteador.atraso_hedge('principal') * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark da importação em lote contra o servidor GraphQL falso.
+
+Compara registrar_lead em loop (um createCard por requisição) com
+registrar_leads_em_lote (createCard agrupados com aliases) em número de
+requisições HTTP e tempo total.
+
+Uso:
+    python -m benchmarks.bench_pipefy_bulk [--leads 1000] [--latencia 0.01]
+"""
+import os
+import time
+import argparse
+
+from app.fakes.pipefy_server import FakePipefyServer
+
+
+def _leads(n):
+    necessidades = ("automação", "implementar ia")
+    return [{"nome": f"Lead {i}", "email": f"lead{i}@exemplo.com", "empresa": f"Empresa {i % 37}",
+             "necessidade": necessidades[i % 2]} for i in range(n)]
+
+
+def main(n, latencia):
+    with FakePipefyServer(latencia=latencia) as srv:
+        # As variáveis precisam existir antes de importar o serviço
+        # Sem o índice de leads: aqui cada registrar_lead precisa criar um card
+        os.environ.update(PIPEFY_URL=srv.url, PIPEFY_ACCESS_TOKEN="bench-token",
+                          PIPEFY_PRE_SALES_PIPE_ID="1", LEAD_INDEX_ENABLED="0")
+        from app.services.pipefy_service import registrar_lead, _get_field_ids
+        from app.services.pipefy_bulk import registrar_leads_em_lote
+
+        _get_field_ids()
+        leads = _leads(n)
+
+        antes = srv.estado.requisicoes
+        inicio = time.perf_counter()
+        for lead in leads:
+            registrar_lead(**lead)
+        loop_t, loop_req = time.perf_counter() - inicio, srv.estado.requisicoes - antes
+
+        antes = srv.estado.requisicoes
+        inicio = time.perf_counter()
+        resultados = registrar_leads_em_lote(leads)
+        lote_t, lote_req = time.perf_counter() - inicio, srv.estado.requisicoes - antes
+        ok = sum(1 for r in resultados if r["status"] == "sucesso")
+
+    print(f"{n} leads, latência do servidor {latencia * 1000:.1f} ms")
+    print(f"{'registrar_lead em loop':>26} | {loop_req:>5} requisições | {loop_t:>6.2f}s")
+    print(f"{'registrar_leads_em_lote':>26} | {lote_req:>5} requisições | {lote_t:>6.2f}s "
+          f"| {ok}/{n} criados")
+    print(f"Redução de requisições: {loop_req / max(lote_req, 1):.0f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=1000)
+    parser.add_argument("--latencia", type=float, default=0.01)
+    args = parser.parse_args()
+    main(args.leads, args.latencia)
@@ -0,0 +1,92 @@
+"""
+Benchmark do cliente Pipefy contra o servidor GraphQL falso (offline).
+
+Compara o requests.post sem sessão usado antes por _executar_query com o
+PipefyClient (keep-alive, retentativa com backoff e interface assíncrona):
+tempo total, conexões TCP abertas e taxa de sucesso com falhas injetadas.
+
+Uso:
+    python -m benchmarks.bench_pipefy_client [--chamadas 300] [--latencia 0.005] [--taxa-falha 0.2]
+"""
+import time
+import asyncio
+import argparse
+
+import requests
+
+from app.fakes.pipefy_server import FakePipefyServer
+from app.services.pipefy_client import PipefyClient, CircuitBreaker
+
+QUERY = """
+    query GetPipeFields($pipeId: ID!) {
+      pipe(id: $pipeId) { start_form_fields { id label } }
+    }
+    """
+
+
+def _legado(url, n):
+    ok = 0
+    for _ in range(n):
+        try:
+            r = requests.post(url, json={"query": QUERY, "variables": {"pipeId": "1"}},
+                              headers={"Authorization": "Bearer fake"}, timeout=10)
+            r.raise_for_status()
+            ok += 1
+        except Exception:
+            pass
+    return ok
+
+
+def _novo_cliente(url):
+    # Breaker com limite alto: aqui medimos retentativa, não o disjuntor
+    return PipefyClient(url=url, token="fake", backoff_base=0.01, backoff_max=0.05,
+                        breaker=CircuitBreaker(limite=10 ** 6))
+
+
+def _pool_sync(url, n):
+    cliente = _novo_cliente(url)
+    ok = sum(1 for _ in range(n) if "error" not in cliente.executar(QUERY, {"pipeId": "1"}))
+    cliente.fechar()
+    return ok
+
+
+async def _pool_async(url, n, concorrencia=32):
+    cliente = _novo_cliente(url)
+    sem = asyncio.Semaphore(concorrencia)
+
+    async def uma():
+        async with sem:
+            return "error" not in await cliente.aexecutar(QUERY, {"pipeId": "1"})
+
+    resultados = await asyncio.gather(*[uma() for _ in range(n)])
+    await cliente.afechar()
+    return sum(resultados)
+
+
+def _medir(nome, n, taxa_falha, latencia, func):
+    with FakePipefyServer(latencia=latencia, taxa_falha=taxa_falha, retry_after=0) as srv:
+        inicio = time.perf_counter()
+        ok = func(srv.url, n)
+        duracao = time.perf_counter() - inicio
+        r = srv.estado.resumo()
+    print(f"{nome:>22} | falha {taxa_falha:>4.0%} | {duracao:>7.2f}s | {n / duracao:>8.1f} ch/s "
+          f"| sucesso {ok / n:>6.1%} | conexões {r['conexoes']:>4} | reqs {r['requisicoes']:>5}")
+
+
+def main(n, latencia, taxa_falha):
+    print(f"{n} chamadas, latência do servidor {latencia * 1000:.1f} ms")
+    for taxa in (0.0, taxa_falha):
+        _medir("requests.post (antigo)", n, taxa, latencia, _legado)
+        _medir("PipefyClient.executar", n, taxa, latencia, _pool_sync)
+        _medir("PipefyClient.aexecutar", n, taxa, latencia,
+               lambda url, n: asyncio.run(_pool_async(url, n)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chamadas", type=int, default=300)
+    parser.add_argument("--latencia", type=float, default=0.005)
+    parser.add_argument("--taxa-falha", type=float, default=0.2)
+    args = parser.parse_args()
+    main(args.chamadas, args.latencia, args.taxa_falha)
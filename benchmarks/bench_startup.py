@@ -0,0 +1,99 @@
+"""
+Benchmark de partida da API.
+
+1. `python -X importtime -c "import app.main"`: tempo total de import e os
+   módulos mais caros (cumulativo).
+2. Sobe o uvicorn num subprocesso e mede o tempo até o primeiro 200 em "/".
+
+Sai com código 1 se o tempo até a primeira resposta passar do orçamento,
+para ser usado como verificação de regressão.
+
+Uso:
+    python -m benchmarks.bench_startup [--orcamento-ms 2500] [--top 10]
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import urllib.request
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _ambiente():
+    env = dict(os.environ)
+    # Partida offline: sem Pipefy real e sem aquecimento de rede
+    env.setdefault("PIPEFY_ACCESS_TOKEN", "SIMULACAO")
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+    return env
+
+
+def medir_imports(top):
+    saida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        capture_output=True, text=True, env=_ambiente(), check=True).stderr
+    linhas = []
+    for linha in saida.splitlines():
+        if not linha.startswith("import time:") or "|" not in linha:
+            continue
+        partes = linha[len("import time:"):].split("|")
+        try:
+            linhas.append((int(partes[1]), partes[2].rstrip()))
+        except ValueError:
+            continue  # cabeçalho
+    total = next((us for us, nome in linhas if nome.strip() == "app.main"), 0)
+    topo = sorted(linhas, reverse=True)[:top]
+    return total / 1000, [(us / 1000, nome) for us, nome in topo]
+
+
+def medir_primeira_resposta(timeout=30.0):
+    porta = _porta_livre()
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app",
+         "--port", str(porta), "--log-level", "warning"],
+        env=_ambiente())
+    try:
+        while time.perf_counter() - inicio < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{porta}/", timeout=1) as r:
+                    if r.status == 200:
+                        return (time.perf_counter() - inicio) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("A API não respondeu dentro do timeout.")
+    finally:
+        processo.terminate()
+        processo.wait(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orcamento-ms", type=float, default=2500.0,
+                        help="tempo máximo até o primeiro 200 em /")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    total, topo = medir_imports(args.top)
+    print(f"import app.main: {total:.0f} ms (cumulativo)")
+    for ms, nome in topo:
+        print(f"  {ms:8.1f} ms  {nome}")
+
+    primeira = medir_primeira_resposta()
+    print(f"\nprimeira resposta em /: {primeira:.0f} ms "
+          f"(orçamento {args.orcamento_ms:.0f} ms)")
+    if primeira > args.orcamento_ms:
+        print("ORÇAMENTO DE PARTIDA ESTOURADO")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark do registro de ferramentas e do cached content.
+
+Usa o cliente real do SDK (google.genai) com um transporte httpx falso, que
+responde na hora e guarda o corpo de cada requisição. Compara três formas de
+montar a chamada ao modelo:
+
+- "callables": config nova a cada turno com as funções Python em `tools`
+  (o SDK inspeciona assinaturas e docstrings em toda requisição);
+- "registro": configs pré-montadas do ToolRegistry (FunctionDeclaration);
+- "cached_content": config que só referencia o cached content.
+
+Relata CPU por requisição (parte do cliente) e o tamanho do corpo enviado,
+com a estimativa de tokens de entrada economizados por turno (~4 caracteres
+por token; a contagem exata vem em usage_metadata.cached_content_token_count
+na API real).
+
+Uso:
+    python -m benchmarks.bench_tool_registry [--requisicoes 500]
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+os.environ.setdefault("PIPEFY_ACCESS_TOKEN", "SIMULACAO")
+
+_RESPOSTA = {"candidates": [{"content": {"role": "model", "parts": [{"text": "Olá!"}]}}]}
+
+
+def _cliente(corpos):
+    import httpx
+    from google import genai
+    from google.genai import types
+
+    def responder(request):
+        corpos.append(len(request.content))
+        return httpx.Response(200, json=_RESPOSTA)
+
+    return genai.Client(api_key="chave-falsa", http_options=types.HttpOptions(
+        httpx_async_client=httpx.AsyncClient(transport=httpx.MockTransport(responder))))
+
+
+def _config_callables(permitir_ferramentas=True):
+    """Como run_gemini_agent montava a config antes do registro."""
+    from google.genai import types
+    from app.services.gemini_agent import AVAILABLE_TOOLS, SDR_SYSTEM_INSTRUCTION
+
+    return types.GenerateContentConfig(
+        system_instruction=SDR_SYSTEM_INSTRUCTION,
+        tools=list(AVAILABLE_TOOLS.values()),
+        automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True),
+        tool_config=None if permitir_ferramentas else types.ToolConfig(
+            function_calling_config=types.FunctionCallingConfig(mode="NONE")),
+    )
+
+
+async def _medir(nome, montar_config, requisicoes):
+    from google.genai import types
+    from app.services.gemini_agent import MODEL_NAME
+
+    corpos = []
+    cliente = _cliente(corpos)
+    contents = [types.Content(role="user", parts=[types.Part(text="Olá, quero saber mais.")])]
+    cpu = []
+    for _ in range(requisicoes):
+        inicio = time.process_time()
+        await cliente.aio.models.generate_content(
+            model=MODEL_NAME, contents=contents, config=montar_config())
+        cpu.append(time.process_time() - inicio)
+    return {
+        "modo": nome,
+        "cpu_us_mediana": round(statistics.median(cpu) * 1e6, 1),
+        "cpu_us_media": round(statistics.fmean(cpu) * 1e6, 1),
+        "corpo_bytes": corpos[-1],
+    }
+
+
+async def principal(requisicoes):
+    from google.genai import types
+    from app.services.gemini_agent import tool_registry
+
+    inicio = time.perf_counter()
+    tool_registry.compilar()
+    compilar_ms = (time.perf_counter() - inicio) * 1000
+    afc = tool_registry.compilar().afc
+
+    resultados = [
+        await _medir("callables", _config_callables, requisicoes),
+        await _medir("registro", tool_registry.config, requisicoes),
+        await _medir("cached_content", lambda: types.GenerateContentConfig(
+            cached_content="cachedContents/bench", automatic_function_calling=afc),
+            requisicoes),
+    ]
+    return compilar_ms, resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requisicoes", type=int, default=500)
+    args = parser.parse_args()
+
+    compilar_ms, resultados = asyncio.run(principal(args.requisicoes))
+    print(f"compilação do registro (uma vez): {compilar_ms:.1f} ms")
+    base = resultados[0]
+    for r in resultados:
+        economia = base["corpo_bytes"] - r["corpo_bytes"]
+        print(f"  {r['modo']:15} CPU mediana {r['cpu_us_mediana']:>8} µs "
+              f"(média {r['cpu_us_media']:>8} µs) | corpo {r['corpo_bytes']:>5} B "
+              f"| ~{economia // 4} tokens de entrada a menos por turno")
+    print(json.dumps(resultados, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark de serialização dos corpos do /chat (fora o modelo e o SDK).
+
+Para históricos de tamanhos crescentes, mede por turno:
+
+- decodificar: bytes do corpo -> AgentRequest validado -> mensagens prontas
+  para compilar (a conversão para types.Content é igual nos dois e fica fora);
+- codificar: corpo do AgentResponse -> bytes da resposta.
+
+"antes": history como List[Dict[str, Any]], cada mensagem validada de novo
+em conversa (HistoryItem/HistoryPart em BaseModel) e a resposta revalidada
+pelo response_model antes do JSON do FastAPI.
+"agora": HistoryItem estrito (TypedDict) validado uma vez na borda e a
+resposta em RespostaJSON (orjson, quando instalado).
+
+Uso:
+    python -m benchmarks.bench_wire [--tamanhos 10,100,1000] [--repeticoes 50]
+"""
+import json
+import time
+import argparse
+import statistics
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+
+from app.models import AgentRequest, HistoryItem
+from app.utils import json_utils
+from app.utils.json_utils import RespostaJSON
+from benchmarks.bench_conversa import _historico
+
+
+# 🔹 Modelos de antes (history sem tipo + validação por mensagem em conversa)
+
+
+class _ParteAntiga(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    text: Optional[str] = None
+    functionCall: Optional[dict] = Field(None, alias="function_call")
+    functionResponse: Optional[dict] = Field(None, alias="function_response")
+
+
+class _MensagemAntiga(BaseModel):
+    role: str
+    parts: List[dict]
+
+
+class _RequisicaoAntiga(BaseModel):
+    prompt: str
+    history: Optional[List[Dict[str, Any]]] = None
+    session_id: Optional[str] = None
+
+
+class _RespostaAntiga(BaseModel):
+    response: str
+    history: List[Dict[str, Any]]
+    session_id: Optional[str] = None
+
+
+_CAMPO_RESPOSTA_ANTIGA = TypeAdapter(_RespostaAntiga)
+_VALIDADOR = TypeAdapter(HistoryItem)
+
+
+def decodificar_antes(corpo: bytes):
+    requisicao = _RequisicaoAntiga.model_validate(json.loads(corpo))
+    for item in requisicao.history:
+        mensagem = _MensagemAntiga.model_validate(item)
+        [_ParteAntiga.model_validate(p) for p in mensagem.parts]
+    return requisicao.history
+
+
+def decodificar_agora(corpo: bytes):
+    # O FastAPI faz json.loads do corpo e valida o dict; conversa confia nele
+    return AgentRequest.model_validate(json.loads(corpo)).history
+
+
+def codificar_antes(historico) -> bytes:
+    # serialize_response do FastAPI: valida contra o response_model e gera o JSON
+    resposta = _RespostaAntiga(response="Perfeito, até lá!", history=historico)
+    valor = _CAMPO_RESPOSTA_ANTIGA.validate_python(resposta, from_attributes=True)
+    return _CAMPO_RESPOSTA_ANTIGA.dump_json(valor)
+
+
+def codificar_agora(historico) -> bytes:
+    return RespostaJSON({"response": "Perfeito, até lá!", "history": historico,
+                         "session_id": None}).body
+
+
+def _mediana_us(func, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos) * 1e6
+
+
+def medir(n, repeticoes):
+    historico = _historico(n)
+    corpo = json.dumps({"prompt": "Pode ser amanhã às 10h?", "history": historico}).encode()
+    assert decodificar_agora(corpo) == decodificar_antes(corpo)
+    assert json.loads(codificar_agora(historico)) == json.loads(codificar_antes(historico))
+    validado = [_VALIDADOR.validate_python(m) for m in historico]
+    return {
+        "corpo_kb": len(corpo) / 1024,
+        "decodificar": (_mediana_us(lambda: decodificar_antes(corpo), repeticoes),
+                        _mediana_us(lambda: decodificar_agora(corpo), repeticoes)),
+        "codificar": (_mediana_us(lambda: codificar_antes(historico), repeticoes),
+                      _mediana_us(lambda: codificar_agora(validado), repeticoes)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanhos", default="10,100,1000",
+                        help="Tamanhos do histórico (mensagens), separados por vírgula.")
+    parser.add_argument("--repeticoes", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"JSON da resposta: {'orjson' if json_utils.orjson else 'json (stdlib)'}")
+    for n in (int(t) for t in args.tamanhos.split(",")):
+        r = medir(n, args.repeticoes)
+        (dec_antes, dec_agora), (cod_antes, cod_agora) = r["decodificar"], r["codificar"]
+        total_antes, total_agora = dec_antes + cod_antes, dec_agora + cod_agora
+        print(f"{n:>5} mensagens ({r['corpo_kb']:7.1f} KB) | "
+              f"decodificar {dec_antes:8.0f} -> {dec_agora:7.0f} µs | "
+              f"codificar {cod_antes:7.0f} -> {cod_agora:6.0f} µs | "
+              f"turno {total_antes:8.0f} -> {total_agora:7.0f} µs ({total_antes / total_agora:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()